@@ -63,13 +63,21 @@
                         url += '?'+$.param(options.query);
                     }
                     options.header.token = $.cookie('token');
+                    // reads of the client go to primary DB for a while after it writes, see db_written_at of server
+                    if ($.cookie('db_written_at')) {
+                        options.header.db_written_at = $.cookie('db_written_at');
+                    }
                     return $.ajax({
                         method: obj,
                         url: url,
                         contentType: obj == 'get' ? 'application/x-www-form-urlencoded' : 'application/json',
                         headers: options.header,
                         data: data,
-                        success: function(data) {
+                        success: function(data, status, req) {
+                            var writtenAt = req.getResponseHeader('db_written_at');
+                            if (writtenAt) {
+                                $.cookie('db_written_at', writtenAt, {path: '/'});
+                            }
                             if(data.error){
                                 if(data.error.code == 401){
                                     console.log(data)
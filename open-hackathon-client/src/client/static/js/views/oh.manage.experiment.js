@@ -27,6 +27,10 @@
 
     var currentHackathon = oh.comm.getCurrentHackathon();
 
+    // experiments are listed page by page, see ExprManager.get_expr_list_by_hackathon_id of server
+    var perPage = 20;
+    var currentPage = 1;
+
     //get form-data for submit
     function getFilterData(){
         var Data = {
@@ -37,18 +41,31 @@
     }
 
 
+    // show total and current page, disable prev/next at the first/last page
+    function renderPager(data){
+        var pageCount = Math.max(Math.ceil(data.total / data.per_page), 1);
+        var pager = $('#experiment_pager');
+        currentPage = data.page;
+        $('#experiment_page_info').text('共 ' + data.total + ' 条, 第 ' + data.page + '/' + pageCount + ' 页');
+        pager.find('.previous').toggleClass('disabled', data.page <= 1);
+        pager.find('.next').toggleClass('disabled', data.page >= pageCount);
+        pager.data('pageCount', pageCount);
+    }
+
     // initial table to show admin list
-    function pageLoad(){
+    function pageLoad(page){
         var list = $('#experiment_list');
 
         var data = getFilterData()
+        data.page = page || currentPage;
+        data.per_page = perPage;
         oh.api.admin.experiment.list.get({
             query: data,
             header: {
                 hackathon_name: currentHackathon
             }
         }, function(data) {
-            list.empty().append($('#experiment_list_template').tmpl(data,{
+            list.empty().append($('#experiment_list_template').tmpl(data.items,{
                 getStatus:function(status){
                     if(status == 0){
                         return '初始化中'
@@ -83,22 +100,15 @@
                     return getPriEmail(emails);
                 }
             }));
+            if(!data.error){
+                renderPager(data);
+            }
             oh.comm.removeLoading();
         });
         $('#expr_list_filter').find('[type="submit"]').removeAttr('disabled')
     }
 
 
-    // call api to get experiment list by filter
-    function getExprListByFilter(data){
-        return oh.api.admin.experiment.list.get({
-            query: data,
-            header: {
-                hackathon_name: currentHackathon
-            }
-        });
-    }
-
     // call api to reset experiment
     function resetExperiment(id){
         return oh.api.admin.experiment.put({
@@ -119,17 +129,29 @@
         var filter = $('#expr_list_filter');
         filter.bootstrapValidator().on('success.form.bv', function(e) {
             e.preventDefault();
-            var data = getFilterData();
-            getExprListByFilter(data).then(function(){
-                pageLoad()
-            })
+            // filter changed, start from the first page
+            pageLoad(1);
+        });
+    }
+
+    // initial prev/next page events
+    function pagerinit(){
+        $('#experiment_pager').on('click', 'a', function(e){
+            e.preventDefault();
+            var item = $(this).parent();
+            if(item.hasClass('disabled')){
+                return;
+            }
+            var page = $(this).data('page') == 'prev' ? currentPage - 1 : currentPage + 1;
+            pageLoad(Math.min(Math.max(page, 1), $('#experiment_pager').data('pageCount') || 1));
         });
     }
 
     function init(){
         var editLi = undefined;
-        pageLoad();
+        pageLoad(1);
         forminit();
+        pagerinit();
 
         var confirmModal = $('#confirm_reset_modal').on('show.bs.modal',function(e){
             console.log(e);
@@ -108,6 +108,9 @@
     }
 
     function loadExperiment(data) {
+        if (data.expr_id) {
+            def_expid = data.expr_id;
+        }
         if (data.status == 2) {
             var dockers = []
             for (var i in data.remote_servers) {
@@ -121,7 +124,7 @@
             }
             heartbeat(def_expid);
         } else if (data.status == 1) {
-            setTimeout(getExperiment, 60000);
+            setTimeout(getExperiment, 5000);
         } else {
             showErrorMsg(data);
         }
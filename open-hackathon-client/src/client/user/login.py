@@ -31,20 +31,20 @@ import urllib2
 
 sys.path.append("..")
 
-from client.functions import get_remote, get_config, post_to_remote, convert, qs_dict
+from client.functions import get_remote, get_config, post_to_remote, delete_remote, convert, qs_dict
 from client.log import log
 import json
 import requests
 from user_mgr import user_manager
 from flask import session, request
 from flask_login import logout_user
-from client.constants import LOGIN_PROVIDER
+from client.constants import LOGIN_PROVIDER, HTTP_HEADER
 
 
 class LoginBase():
     def logout(self, admin):
         if admin.is_authenticated():
-            if user_manager.db_logout(admin):
+            if self.api_logout() or user_manager.db_logout(admin):
                 info = "ok"
             else:
                 info = "log out failed"
@@ -54,6 +54,22 @@ class LoginBase():
         else:
             return "ok"
 
+    def api_logout(self):
+        """Logout on API server so that the tokens are deleted and removed from token cache of all server processes
+
+        :rtype: bool
+        :return True if API server logged out the user otherwise False
+        """
+        if session.get("token") is None:
+            return False
+        try:
+            delete_remote(get_config("hackathon-api.endpoint") + "/api/user/login",
+                          {HTTP_HEADER.TOKEN: session["token"]})
+            return True
+        except Exception as e:
+            log.error(e)
+            return False
+
 
 class QQLogin(LoginBase):
     """Sign in with QQ
@@ -96,13 +96,76 @@ class HackathonApi(Api):
 api = HackathonApi(app)
 
 # Enable CORS support. Currently requests of all methods from all domains are allowed
-app.config['CORS_HEADERS'] = 'Content-Type, token, hackathon_name'
+app.config['CORS_HEADERS'] = 'Content-Type, token, hackathon_name, db_written_at'
+app.config['CORS_EXPOSE_HEADERS'] = 'db_written_at'
 cors = CORS(app)
 
 # initialize hackathon scheduler
 scheduler = HackathonScheduler(app)
 
 
+@app.before_request
+def poll_cache_invalidation():
+    """Apply cache invalidations broadcast by other server processes. See cache/invalidation_bus.py"""
+    RequiredFeature("cache_invalidation_bus").poll()
+
+
+@app.before_request
+def begin_db_transaction():
+    """Batch DB writes of the request into one transaction if 'mysql.transaction.request_scoped'"""
+    if safe_get_config("mysql.transaction.request_scoped", False):
+        RequiredFeature("db").begin()
+
+
+@app.before_request
+def begin_sql_profile():
+    """Profile SQL statements of the request if 'mysql.profiler.enabled'. See database/profiler.py"""
+    if safe_get_config("mysql.profiler.enabled", False):
+        from hackathon.database.profiler import start_request_profile
+        start_request_profile()
+
+
+@app.after_request
+def end_sql_profile(response):
+    """Aggregate the SQL profile of request, and report it in header 'X-SQL-Profile' in debug mode"""
+    if safe_get_config("mysql.profiler.enabled", False):
+        from hackathon.database.profiler import finish_request_profile
+        profile = finish_request_profile()
+        if profile and app.debug:
+            response.headers["X-SQL-Profile"] = "queries=%d; sql_time_ms=%.3f; n_plus_one=%d" % (
+                profile.query_count, profile.sql_seconds * 1000, len(profile.n_plus_one))
+    return response
+
+
+@app.after_request
+def set_db_written_header(response):
+    """Respond the time of DB write so that later reads of the client don't go to lagging replicas. See routing.py"""
+    from hackathon.database.routing import mark_written, set_written_header
+
+    session = RequiredFeature("db").session()
+    if session.new or session.dirty or session.deleted:
+        # changes not flushed yet are committed at teardown
+        mark_written()
+    return set_written_header(response)
+
+
+@app.teardown_request
+def end_db_transaction(exception):
+    """Commit the transaction of request and release the DB session of current thread
+
+    Reads don't commit, so the session must be ended here or the next request on this thread would see a stale
+    snapshot. Changes not committed explicitly are committed too since they used to be committed by later DB calls.
+    """
+    db = RequiredFeature("db")
+    try:
+        if db.in_transaction():
+            db.end(exception)
+        elif exception is None:
+            db.commit()
+    finally:
+        db.remove()
+
+
 @app.errorhandler(400)
 def bad_request_handler(error):
     log.error(error)
@@ -143,7 +206,12 @@ def init_components():
     from hackathon.template import TemplateLibrary
     from hackathon.remote.guacamole import GuacamoleInfo
     from hackathon.expr.expr_mgr import ExprManager
+    from hackathon.expr.warm_pool import WarmPoolManager
+    from hackathon.hack.capacity_planner import CapacityPlanner
     from hackathon.cache.cache_mgr import CacheManagerExt
+    from hackathon.cache.invalidation_bus import invalidation_bus
+    from hackathon.expr.heart_beat_buffer import heart_beat_buffer
+    from hackathon.azureformation.operation_tracker import AzureOperationTracker
 
     # dependencies MUST be provided in advance
     factory.provide("util", Utility)
@@ -152,6 +220,7 @@ def init_components():
 
     # cache
     factory.provide("cache", CacheManagerExt)
+    factory.provide("cache_invalidation_bus", invalidation_bus)
 
     # scheduler
     factory.provide("scheduler", scheduler)
@@ -162,10 +231,14 @@ def init_components():
     factory.provide("hackathon_manager", HackathonManager)
     factory.provide("register_manager", RegisterManager)
     factory.provide("azure_cert_manager", AzureCertManager)
+    factory.provide("azure_operation_tracker", AzureOperationTracker)
     factory.provide("docker_host_manager", DockerHostManager)
+    factory.provide("capacity_planner", CapacityPlanner)
     factory.provide("hackathon_template_manager", HackathonTemplateManager)
     factory.provide("template_library", TemplateLibrary)
     factory.provide("expr_manager", ExprManager)
+    factory.provide("warm_pool_manager", WarmPoolManager)
+    factory.provide("heart_beat_buffer", heart_beat_buffer)
     factory.provide("admin_manager", AdminManager)
     factory.provide("team_manager", TeamManager)
     factory.provide("guacamole", GuacamoleInfo)
@@ -176,9 +249,16 @@ def init_components():
     factory.provide("health_check_alauda_docker", get_class("hackathon.health.health_check.AlaudaDockerHealthCheck"))
     factory.provide("health_check_guacamole", get_class("hackathon.health.health_check.GuacamoleHealthCheck"))
     factory.provide("health_check_azure", get_class("hackathon.health.health_check.AzureHealthCheck"))
+    factory.provide("health_check_cache", get_class("hackathon.health.health_check.CacheHealthCheck"))
+    factory.provide("health_check_warm_pool", get_class("hackathon.health.health_check.WarmPoolHealthCheck"))
+    factory.provide("health_check_db_pool", get_class("hackathon.health.health_check.DBPoolHealthCheck"))
+    factory.provide("health_check_scheduler", get_class("hackathon.health.health_check.SchedulerHealthCheck"))
+    factory.provide("health_check_image_pull", get_class("hackathon.health.health_check.ImagePullHealthCheck"))
 
     # docker
     factory.provide("hosted_docker", get_class("hackathon.docker.hosted_docker.HostedDockerFormation"))
+    factory.provide("docker_host_scheduler", get_class("hackathon.docker.host_scheduler.DockerHostScheduler"))
+    factory.provide("image_distributor", get_class("hackathon.docker.image_distributor.ImageDistributor"))
     factory.provide("alauda_docker", get_class("hackathon.docker.alauda_docker.AlaudaDockerFormation"))
 
     # storage
@@ -229,8 +309,58 @@ def __init_schedule_jobs():
                       method="scheduler_recycle_expr",
                       id="scheduler_recycle_expr",
                       next_run_time=next_run_time,
+                      pool="maintenance",
                       minutes=10)
 
+    # schedule job to purge cache invalidations that all processes have applied
+    sche.add_interval(feature="cache_invalidation_bus",
+                      method="purge_expired",
+                      id="purge_expired_cache_invalidation",
+                      next_run_time=next_run_time,
+                      pool="maintenance",
+                      minutes=30)
+
+    # schedule job to apply cache invalidations of other processes even if no request comes to this process
+    sche.add_interval(feature="cache_invalidation_bus",
+                      method="poll_job",
+                      id="poll_cache_invalidation",
+                      next_run_time=next_run_time,
+                      pool="interactive",
+                      singleton=False,
+                      seconds=safe_get_config("cache.invalidation.poll_interval_seconds", 5))
+
+    # schedule job to write buffered heart beats of experiments even if no more heart beat comes
+    sche.add_interval(feature="heart_beat_buffer",
+                      method="flush",
+                      id="flush_heart_beat_buffer",
+                      next_run_time=next_run_time,
+                      pool="interactive",
+                      singleton=False,
+                      seconds=safe_get_config("expr.heart_beat.flush_interval_seconds", 30))
+
+    # schedule job to reconcile the register/online/offline stat of hackathons
+    sche.add_interval(feature="hackathon_manager",
+                      method="reconcile_hackathon_stat",
+                      id="reconcile_hackathon_stat",
+                      next_run_time=next_run_time,
+                      pool="maintenance",
+                      minutes=safe_get_config("hackathon_stat.reconcile_interval_minutes", 10))
+
+    # schedule job to refresh liveness and load of docker hosts
+    sche.add_interval(feature="docker_host_scheduler",
+                      method="probe_all",
+                      id="probe_docker_hosts",
+                      next_run_time=next_run_time,
+                      pool="interactive",
+                      singleton=False,
+                      seconds=safe_get_config("docker.host_scheduler.probe_interval_seconds", 30))
+
+    # compile templates of hackathons in this process so that starting experiments needn't wait for downloading
+    RequiredFeature("template_library").warm_compiled_templates()
+
+    # schedule job to poll pending azure operations
+    RequiredFeature("azure_operation_tracker").schedule_poll_job()
+
     # schedule job to pre-allocate environment
     expr_manager.schedule_pre_allocate_expr_job()
 
@@ -239,8 +369,7 @@ def __init_schedule_jobs():
         docker = RequiredFeature("hosted_docker")
         docker.ensure_images()
 
-    # todo
-    # schedule job to pre-create a docker host server VM
+    # schedule job to pre-create docker host server VMs ahead of demand
     host_server_manager.schedule_pre_allocate_host_server_job()
 
 
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+ 
+The MIT License (MIT)
+ 
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+ 
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+ 
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import sys
+
+sys.path.append("..")
+import json
+from datetime import timedelta
+
+from hackathon import Component
+from hackathon.constants import ADStatus
+from hackathon.database import AzureOperation
+from hackathon.azureformation.utility import (
+    ASYNC_TICK,
+    ASYNC_LOOP,
+    run_job,
+)
+
+__all__ = ["AzureOperationTracker"]
+
+# kinds of tracked operation
+OPERATION_ASYNC = "async"
+OPERATION_DEPLOYMENT = "deployment"
+OPERATION_VIRTUAL_MACHINE = "virtual_machine"
+
+POLL_JOB_ID = "poll_azure_operations"
+
+
+def get_operation_key(kind, azure_key_id, args):
+    return ":".join([kind, str(azure_key_id)] + [str(a) for a in args])
+
+
+class AzureOperationTracker(Component):
+    """Track pending azure operations without blocking threads
+
+    Instead of sleeping in scheduler threads until azure finishes an operation, callers register the operation here
+    and return at once. Pending operations are stored in table azure_operation so that they survive restarts and any
+    server process can poll them. The poll job(see schedule_poll_job) checks operations which are due, grouped by azure
+    key so that one management service serves all operations of the same subscription, and backs off exponentially for
+    operations still in progress. The success or failure callback is dispatched through run_job once the final status
+    is known.
+    """
+
+    def track_async(self, azure_key_id, request_id, on_success, on_failure=None):
+        """Track an async operation until its status is no longer InProgress
+
+        :type azure_key_id: int
+        :param azure_key_id: id of AzureKey which the operation is sent by
+
+        :type request_id: str|unicode
+        :param request_id: the request id azure returns for the async operation
+
+        :type on_success: tuple
+        :param on_success: (mdl_cls_func, cls_args, func_args) to run if the operation succeeds
+
+        :type on_failure: tuple
+        :param on_failure: (mdl_cls_func, cls_args, func_args) to run if the operation fails or times out
+        """
+        self.__track(OPERATION_ASYNC, azure_key_id, (request_id,), on_success, on_failure)
+
+    def track_deployment(self, azure_key_id, cloud_service_name, deployment_name, on_success, on_failure=None):
+        """Track a deployment until it is running. See track_async for the callbacks"""
+        self.__track(OPERATION_DEPLOYMENT, azure_key_id, (cloud_service_name, deployment_name), on_success, on_failure)
+
+    def track_virtual_machine(self, azure_key_id, cloud_service_name, deployment_name, virtual_machine_name, status,
+                              on_success, on_failure=None):
+        """Track a virtual machine until its instance status is 'status'. See track_async for the callbacks"""
+        self.__track(OPERATION_VIRTUAL_MACHINE,
+                     azure_key_id,
+                     (cloud_service_name, deployment_name, virtual_machine_name, status),
+                     on_success,
+                     on_failure)
+
+    def get_pending_count(self):
+        return self.db.count(AzureOperation)
+
+    def schedule_poll_job(self):
+        """Poll pending operations in an interval job which runs in one process at a time"""
+        self.scheduler.add_interval(feature="azure_operation_tracker",
+                                    method="poll",
+                                    id=POLL_JOB_ID,
+                                    pool="interactive",
+                                    seconds=self.__get_config("poll_interval_seconds", 5))
+
+    def poll(self):
+        """Check all pending operations whose next check time has come, and dispatch callbacks of finished ones
+
+        Errors of one azure key don't affect operations of other keys. An operation is failed once its timeout passes
+        """
+        due = self.db.find_all_objects(AzureOperation, AzureOperation.next_check_time <= self.util.get_now())
+
+        by_key = {}
+        for op in due:
+            by_key.setdefault(op.azure_key_id, []).append(op)
+
+        for azure_key_id, ops in by_key.iteritems():
+            self.__poll_key(azure_key_id, ops)
+
+    def get_service(self, azure_key_id):
+        """Return the azure service management service of an azure key"""
+        from hackathon.azureformation.service import Service
+        return Service(azure_key_id)
+
+    # ---------------------------------------- helpers ---------------------------------------- #
+
+    def __poll_key(self, azure_key_id, ops):
+        try:
+            service = self.get_service(azure_key_id)
+        except Exception as e:
+            self.log.error("cannot create azure service of azure key %s" % azure_key_id)
+            self.log.error(e)
+            service = None
+
+        for op in ops:
+            args = json.loads(op.args)
+            result = None
+            if service is not None:
+                try:
+                    result = self.__check(service, op.kind, args)
+                except Exception as e:
+                    self.log.error(e)
+            now = self.util.get_now()
+            if result is None and now >= op.deadline:
+                self.log.error("timed out waiting for azure %s operation %s" % (op.kind, args))
+                result = False
+
+            if result is None:
+                interval = min(op.interval_seconds * 2, self.__get_config("max_interval_seconds", ASYNC_TICK))
+                self.db.update_object(op,
+                                      checks=op.checks + 1,
+                                      interval_seconds=interval,
+                                      next_check_time=now + timedelta(seconds=interval))
+            else:
+                checks = op.checks + 1
+                callback = op.on_success if result else op.on_failure
+                # removed before the callback is dispatched so that it's never dispatched twice
+                self.db.delete_object(op)
+                self.log.debug("azure %s operation %s finished after %d checks, succeeded: %s" % (
+                    op.kind, args, checks, result))
+                if callback:
+                    run_job(callback[0], callback[1], callback[2], 0)
+
+    def __track(self, kind, azure_key_id, args, on_success, on_failure):
+        interval = self.__get_config("initial_interval_seconds", 5)
+        now = self.util.get_now()
+        fields = dict(kind=kind,
+                      azure_key_id=azure_key_id,
+                      args=json.dumps(args),
+                      on_success=on_success,
+                      on_failure=on_failure,
+                      interval_seconds=interval,
+                      checks=0,
+                      next_check_time=now + timedelta(seconds=interval),
+                      deadline=now + timedelta(seconds=self.__get_config("timeout_seconds", ASYNC_TICK * ASYNC_LOOP)))
+        self.log.debug("track azure %s operation %s" % (kind, args))
+
+        operation_key = get_operation_key(kind, azure_key_id, args)
+        op = self.db.find_first_object_by(AzureOperation, operation_key=operation_key)
+        if op is None:
+            self.db.add_object_kwargs(AzureOperation, operation_key=operation_key, create_time=now, **fields)
+        else:
+            self.db.update_object(op, **fields)
+
+    def __check(self, service, kind, args):
+        """Return True if the operation succeeded, False if failed and None if still in progress"""
+        if kind == OPERATION_ASYNC:
+            result = service.get_operation_status(args[0])
+            if result.status == service.IN_PROGRESS:
+                return None
+            if result.status != service.SUCCEEDED:
+                self.log.error("azure async operation %s: %s" % (args[0], vars(result)))
+                return False
+            return True
+        elif kind == OPERATION_DEPLOYMENT:
+            deployment = service.get_deployment_by_name(args[0], args[1])
+            return True if deployment.status == ADStatus.RUNNING else None
+        else:
+            cloud_service_name, deployment_name, virtual_machine_name, status = args
+            deployment = service.get_deployment_by_name(cloud_service_name, deployment_name)
+            result = service.get_virtual_machine_instance_status(deployment, virtual_machine_name)
+            return True if result == status else None
+
+    def __get_config(self, key, default):
+        return self.util.safe_get_config("azure.operation_tracker." + key, default)
@@ -31,14 +31,6 @@ from hackathon.constants import (
     ADStatus,
 )
 
-from hackathon.azureformation.utility import (
-    ASYNC_TICK,
-    DEPLOYMENT_TICK,
-    VIRTUAL_MACHINE_TICK,
-    MDL_CLS_FUNC,
-    run_job,
-)
-
 from hackathon.database.models import (
     AzureKey,
 )
@@ -47,7 +39,7 @@ from azure.servicemanagement import (
     Deployment,
 )
 import time
-from hackathon import Component
+from hackathon import Component, RequiredFeature
 
 
 class Service(ServiceManagementService, Component):
@@ -59,6 +51,8 @@ class Service(ServiceManagementService, Component):
     NOT_FOUND = 'Not found (Not Found)'
     NETWORK_CONFIGURATION = 'NetworkConfiguration'
 
+    operation_tracker = RequiredFeature("azure_operation_tracker")
+
     def __init__(self, azure_key_id):
         self.azure_key_id = azure_key_id
         azure_key = self.db.get_object(AzureKey, self.azure_key_id)
@@ -376,45 +370,25 @@ class Service(ServiceManagementService, Component):
                                      true_mdl_cls_func, true_cls_args, true_func_args,
                                      false_mdl_cls_func, false_cls_args, false_func_args):
         self.log.debug('query async operation status: request_id [%s]' % request_id)
-        result = self.get_operation_status(request_id)
-        if result.status == self.IN_PROGRESS:
-            # query async operation status
-            run_job(MDL_CLS_FUNC[2],
-                    (self.azure_key_id, ),
-                    (request_id,
-                     true_mdl_cls_func, true_cls_args, true_func_args,
-                     false_mdl_cls_func, false_cls_args, false_func_args),
-                    ASYNC_TICK)
-        elif result.status == self.SUCCEEDED:
-            run_job(true_mdl_cls_func, true_cls_args, true_func_args)
-        else:
-            run_job(false_mdl_cls_func, false_cls_args, false_func_args)
+        self.operation_tracker.track_async(self.azure_key_id,
+                                           request_id,
+                                           (true_mdl_cls_func, true_cls_args, true_func_args),
+                                           (false_mdl_cls_func, false_cls_args, false_func_args))
 
     def query_deployment_status(self, cloud_service_name, deployment_name,
                                 true_mdl_cls_func, true_cls_args, true_func_args):
         self.log.debug('query deployment status: deployment_name [%s]' % deployment_name)
-        result = self.get_deployment_by_name(cloud_service_name, deployment_name)
-        if result.status == ADStatus.RUNNING:
-            run_job(true_mdl_cls_func, true_cls_args, true_func_args)
-        else:
-            # query deployment status
-            run_job(MDL_CLS_FUNC[15],
-                    (self.azure_key_id, ),
-                    (cloud_service_name, deployment_name,
-                     true_mdl_cls_func, true_cls_args, true_func_args),
-                    DEPLOYMENT_TICK)
+        self.operation_tracker.track_deployment(self.azure_key_id,
+                                                cloud_service_name,
+                                                deployment_name,
+                                                (true_mdl_cls_func, true_cls_args, true_func_args))
 
     def query_virtual_machine_status(self, cloud_service_name, deployment_name, virtual_machine_name, status,
                                      true_mdl_cls_func, true_cls_args, true_func_args):
         self.log.debug('query virtual machine status: virtual_machine_name [%s]' % virtual_machine_name)
-        deployment = self.get_deployment_by_name(cloud_service_name, deployment_name)
-        result = self.get_virtual_machine_instance_status(deployment, virtual_machine_name)
-        if result == status:
-            run_job(true_mdl_cls_func, true_cls_args, true_func_args)
-        else:
-            # query virtual machine status
-            run_job(MDL_CLS_FUNC[8],
-                    (self.azure_key_id, ),
-                    (cloud_service_name, deployment_name, virtual_machine_name, status,
-                     true_mdl_cls_func, true_cls_args, true_func_args),
-                    VIRTUAL_MACHINE_TICK)
\ No newline at end of file
+        self.operation_tracker.track_virtual_machine(self.azure_key_id,
+                                                     cloud_service_name,
+                                                     deployment_name,
+                                                     virtual_machine_name,
+                                                     status,
+                                                     (true_mdl_cls_func, true_cls_args, true_func_args))
@@ -375,7 +375,9 @@ def load_template_from_experiment(experiment_id):
 def run_job(mdl_cls_func, cls_args, func_args, second=DEFAULT_TICK):
     exec_time = get_now() + timedelta(seconds=second)
     scheduler = RequiredFeature("scheduler")
-    scheduler.get_scheduler().add_job(call, 'date', run_date=exec_time, args=[mdl_cls_func, cls_args, func_args])
+    # the job reads rows written by caller, add it once they are committed
+    db_adapter.after_commit(scheduler.get_scheduler().add_job, call, 'date', run_date=exec_time,
+                            executor='provisioning', args=[mdl_cls_func, cls_args, func_args])
 
 
 # --------------------------------------------- experiment ---------------------------------------------#
@@ -24,22 +24,60 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-from beaker.cache import CacheManager
-from beaker.util import parse_cache_config_options
-
 from hackathon import Component
-
+from hackathon.util import safe_get_config
+from hackathon.cache.lru_cache import LRUCache
+from hackathon.cache.tiered_cache import TieredCache, BeakerCacheBackend
+from hackathon.cache.invalidation_bus import invalidation_bus, ALL_KEYS
+from hackathon.constants import CACHE_CHANNEL
 
 __all__ = ["CacheManagerExt"]
 
 
+def _create_tiered_cache():
+    """Create the tiered cache according to config 'cache'
+
+    The shared tier is optional. Set 'cache.backend.type' to a beaker cache type like 'file' or 'ext:memcached' to
+    enable it, other items of 'cache.backend' are passed to beaker as they are.
+    """
+    local = LRUCache(max_size=safe_get_config("cache.local.max_size", 5000),
+                     ttl=safe_get_config("cache.local.ttl_seconds", 3600))
+
+    backend = None
+    backend_opts = dict(safe_get_config("cache.backend", {}))
+    if backend_opts.get("type"):
+        backend = BeakerCacheBackend(**backend_opts)
+
+    return TieredCache(local, backend)
+
+
+def _invalidate_local(key):
+    if key == ALL_KEYS:
+        tiered_cache.clear()
+    else:
+        tiered_cache.invalidate(key)
+
+
+# the tiered cache is shared by all instances of CacheManagerExt in the same process
+tiered_cache = _create_tiered_cache()
+invalidation_bus.subscribe(CACHE_CHANNEL.CACHE, _invalidate_local)
+
+
 class CacheManagerExt(Component):
-    """To cache resource"""
-    def get_cache(self, key, createfunc):
+    """To cache resource
+
+    Values are cached in an in-process LRU in front of an optional shared backend. See TieredCache for details.
+    Invalidations are broadcast to all server processes through invalidation_bus.
+    """
+
+    def get_cache(self, key, createfunc, ttl=None):
         """Get cached data of the returns of createfunc depending on the key.
         If key and createfunc exist in cache, returns the cached data,
         otherwise caches the returns of createfunc and returns data.
 
+        Concurrent calls with the same key call createfunc only once. A deep copy of the cached data is returned so
+        it's safe to modify it.
+
         :type key: String
         :param key: key name, present the unique key each time caching
 
@@ -47,6 +85,9 @@ class CacheManagerExt(Component):
         :param createfunc: only the name of function, have no parameters,
             its return type can be any basic object, like String, int, tuple, list, dict, etc.
 
+        :type ttl: int
+        :param ttl: time to live in seconds for this key. Default ttl 'cache.local.ttl_seconds' is used if None
+
         :rtype: String
         :return: the value mapped to the key
 
@@ -54,11 +95,10 @@ class CacheManagerExt(Component):
             CacheManager.get_cache(key="abc", createfunc=func)
 
         """
-        results = self.tmpl_cache.get(key=key, createfunc=createfunc)
-        return results
+        return tiered_cache.get(key, createfunc, ttl)
 
     def invalidate(self, key):
-        """remove the key-value pair in the cache
+        """remove the key-value pair in the cache of all server processes
 
         :type key: String
         :param key: key name, present the unique key each time caching
@@ -68,39 +108,28 @@ class CacheManagerExt(Component):
 
         """
         try:
-            self.tmpl_cache.remove_value(key=key)
+            invalidation_bus.publish(CACHE_CHANNEL.CACHE, key)
             return True
         except Exception as e:
             self.log.error(e)
             return False
 
     def clear(self):
-        """clear all the cache
+        """clear all the cache of all server processes
 
         :rtype: bool
         :return: True if clear the cache correctly, otherwise False
         """
         try:
-            self.tmpl_cache.clear()
+            invalidation_bus.publish(CACHE_CHANNEL.CACHE, ALL_KEYS)
             return True
         except Exception as e:
             self.log.error(e)
             return False
 
-    def __init__(self):
-        """initialize the class CacheManager
-        More configuration refer to http://beaker.readthedocs.org/en/latest/caching.html#about
+    def get_stats(self):
+        """Return hits, misses, evictions and compute time of cache
+
+        :rtype: dict
         """
-        # store the basic configuration
-        self.cache_opts = {
-            'cache.type': 'memory',
-            # can be "memory" or "file"
-            'cache.data_dir': '/tmp/cache/data',
-            'cache.lock_dir': '/tmp/cache/lock'
-        }
-        # create CacheManager instance with cache_opts
-        self.cache = CacheManager(**parse_cache_config_options(self.cache_opts))
-        # In addition to the defaults supplied to the CacheManager instance,
-        # any of the Cache options can be changed on a per-namespace basis,
-        # by setting a type, and expire option.
-        self.tmpl_cache = self.cache.get_cache('mytemplate', type='file', expire=3600)
+        return tiered_cache.stats()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import time
+from datetime import timedelta
+from threading import Lock
+
+from sqlalchemy import func, or_
+
+from hackathon import Component
+from hackathon.util import safe_get_config
+from hackathon.database import CacheInvalidation
+
+__all__ = ["CacheInvalidationBus", "invalidation_bus", "ALL_KEYS"]
+
+# published as key to invalidate all keys of a channel
+ALL_KEYS = "*"
+
+
+class CacheInvalidationBus(Component):
+    """Broadcast cache invalidations to all server processes
+
+    Every uwsgi worker has its own in-process cache, so an invalidation must reach all workers or the others keep
+    serving stale data until TTL. An invalidation is applied to the local process at once and appended to table
+    'cache_invalidation' in the transaction of publisher. Every process polls the new rows at most once per poll
+    interval(see poll()) and applies them to its subscribers. Invalidation is idempotent, so it doesn't matter the
+    publisher applies it again.
+
+    Subscribers must handle key ALL_KEYS which means clear the whole channel. It's dispatched when the process didn't
+    poll for longer than retention since some invalidations may have been purged.
+
+    :Example:
+        invalidation_bus.subscribe(CACHE_CHANNEL.CACHE, lambda key: local_cache.invalidate(key))
+        invalidation_bus.publish(CACHE_CHANNEL.CACHE, "hackathon_config_1")
+    """
+
+    def __init__(self, poll_interval=5, retention_minutes=60, late_commit_seconds=60):
+        """
+        :type poll_interval: int|float
+        :param poll_interval: minimum seconds between two polls. It's how long other processes may serve stale data
+
+        :type retention_minutes: int
+        :param retention_minutes: invalidations older than it are deleted by purge_expired
+
+        :type late_commit_seconds: int|float
+        :param late_commit_seconds: max seconds between publishing an invalidation and committing it. Ids are assigned
+            on insert but rows are visible on commit, so a row may appear after rows of greater ids. Rows in this
+            trailing window are scanned again in every poll
+        """
+        self.poll_interval = poll_interval
+        self.retention_minutes = retention_minutes
+        self.late_commit_seconds = late_commit_seconds
+        self.__subscribers = {}  # channel -> list of callback(key)
+        self.__last_id = None
+        self.__applied = {}  # id -> create_time of invalidations applied, those in the trailing window only
+        self.__next_poll = 0
+        self.__last_poll = None
+        self.__lock = Lock()
+
+    def subscribe(self, channel, callback):
+        """Register callback(key) that invalidates the key in local process
+
+        :type channel: str|unicode
+        :param channel: channel defined in constants.py#CACHE_CHANNEL
+        """
+        self.__subscribers.setdefault(channel, []).append(callback)
+
+    def publish(self, channel, key):
+        """Invalidate key in local process at once and broadcast it to the other processes
+
+        :type channel: str|unicode
+        :param channel: channel defined in constants.py#CACHE_CHANNEL
+
+        :type key: str|unicode
+        :param key: the key to invalidate
+        """
+        self.__dispatch(channel, key)
+        try:
+            # committed with the changes of caller. Until then, a reader in this process may cache the old value again
+            self.db.add_object_kwargs(CacheInvalidation, channel=channel, key=key, create_time=self.util.get_now())
+            self.db.after_commit(self.__dispatch, channel, key)
+        except Exception as e:
+            self.log.error("fail to broadcast invalidation of %s:%s" % (channel, key))
+            self.log.error(e)
+
+    def poll(self, force=False):
+        """Apply invalidations published by other processes since last poll
+
+        It's called before every request and by poll_job, but DB is queried at most once per poll interval and never
+        by two threads at the same time. The first poll only records the invalidations committed so far since nothing cached before
+        that. Rows that are committed late with smaller ids are found by scanning the trailing window again.
+
+        :type force: bool
+        :param force: poll right now ignoring the poll interval
+
+        :rtype: int
+        :return count of invalidations applied
+        """
+        now = time.time()
+        if not force and now < self.__next_poll:
+            return 0
+        if not self.__lock.acquire(False):
+            return 0
+
+        try:
+            self.__next_poll = now + self.poll_interval
+            last_poll, self.__last_poll = self.__last_poll, now
+            session = self.db.session()
+            if self.__last_id is None:
+                window_start = self.util.get_now() - timedelta(seconds=self.late_commit_seconds)
+                self.__last_id = session.query(func.max(CacheInvalidation.id)).scalar() or 0
+                self.__applied = dict(session.query(CacheInvalidation.id, CacheInvalidation.create_time)
+                                      .filter(CacheInvalidation.create_time >= window_start).all())
+                return 0
+
+            if now - last_poll > self.retention_minutes * 60:
+                for channel in self.__subscribers.keys():
+                    self.__dispatch(channel, ALL_KEYS)
+
+            # rows committed since last poll were published after last poll or in the late commit window before it
+            window_start = self.util.get_now() - timedelta(seconds=now - last_poll + self.late_commit_seconds)
+            invalidations = session.query(CacheInvalidation.id,
+                                          CacheInvalidation.channel,
+                                          CacheInvalidation.key,
+                                          CacheInvalidation.create_time) \
+                .filter(or_(CacheInvalidation.id > self.__last_id, CacheInvalidation.create_time >= window_start)) \
+                .order_by(CacheInvalidation.id).all()
+            count = 0
+            for invalidation_id, channel, key, create_time in invalidations:
+                if invalidation_id in self.__applied:
+                    continue
+                self.__dispatch(channel, key)
+                self.__applied[invalidation_id] = create_time
+                self.__last_id = max(self.__last_id, invalidation_id)
+                count += 1
+
+            # rows out of the window are never scanned again
+            self.__applied = dict((i, t) for i, t in self.__applied.iteritems() if t is not None and t >= window_start)
+            return count
+        except Exception as e:
+            self.log.error(e)
+            return 0
+        finally:
+            # end the read transaction, or the next poll in the same thread may read a stale snapshot
+            self.db.commit()
+            self.__lock.release()
+
+    def poll_job(self):
+        """Poll from a scheduled job so that invalidations are applied even if no request comes to this process
+
+        It's a scheduled job of every process. The job runs once per poll interval already so the interval isn't
+        checked again, or a run slightly earlier than the last one would be skipped.
+        """
+        return self.poll(force=True)
+
+    def purge_expired(self):
+        """Delete invalidations that all processes have applied. It's a scheduled job"""
+        expire_time = self.util.get_now() - timedelta(minutes=self.retention_minutes)
+        count = self.db.delete_all_objects(CacheInvalidation, CacheInvalidation.create_time < expire_time)
+        self.log.debug("%d expired cache invalidations purged" % count)
+
+    def __dispatch(self, channel, key):
+        for callback in self.__subscribers.get(channel, []):
+            try:
+                callback(key)
+            except Exception as e:
+                self.log.error(e)
+
+
+# shared by all components in the same process
+invalidation_bus = CacheInvalidationBus(poll_interval=safe_get_config("cache.invalidation.poll_interval_seconds", 5),
+                                        retention_minutes=safe_get_config("cache.invalidation.retention_minutes", 60),
+                                        late_commit_seconds=safe_get_config("cache.invalidation.late_commit_seconds",
+                                                                            60))
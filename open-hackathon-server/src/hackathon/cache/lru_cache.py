@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import time
+from threading import RLock
+from collections import OrderedDict
+
+__all__ = ["LRUCache"]
+
+# marker for cache misses so that None can be cached as a normal value
+_MISSING = object()
+
+
+class LRUCache(object):
+    """A thread-safe in-process cache with LRU eviction and per-key TTL
+
+    Unlike the beaker based CacheManagerExt, nothing is pickled or written to disk, values are kept as they are. So
+    NEVER put db model instances in it since they are bound to a DB session, cache their ids or dicts instead.
+
+    :Example:
+        cache = LRUCache(max_size=1000, ttl=300)
+        cache.set("key", "value")
+        cache.set("another", "value", ttl=10)  # expires in 10 seconds
+        cache.get("key")  # "value"
+        cache.stats()  # {"hits": 1, "misses": 0, ...}
+    """
+
+    def __init__(self, max_size=1000, ttl=None):
+        """Create a new cache
+
+        :type max_size: int
+        :param max_size: maximum count of keys. The least recently used key will be evicted once it's exceeded
+
+        :type ttl: int|float|None
+        :param ttl: default time to live in seconds. None means never expire
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.__lock = RLock()
+        self.__data = OrderedDict()  # key -> (value, expire_at)
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__expirations = 0
+
+    def get(self, key, default=None):
+        """Get the cached value of key
+
+        :return the cached value or default if key not found or expired
+        """
+        with self.__lock:
+            value, expire_at = self.__data.pop(key, (_MISSING, None))
+            if value is _MISSING:
+                self.__misses += 1
+                return default
+
+            if expire_at is not None and expire_at <= time.time():
+                self.__expirations += 1
+                self.__misses += 1
+                return default
+
+            # re-insert to mark it as the most recently used
+            self.__data[key] = (value, expire_at)
+            self.__hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Put value into cache
+
+        :type ttl: int|float|None
+        :param ttl: time to live in seconds for this key only. The default ttl of cache is used if None
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expire_at = time.time() + ttl if ttl is not None else None
+        with self.__lock:
+            self.__data.pop(key, None)
+            self.__data[key] = (value, expire_at)
+            while len(self.__data) > self.max_size:
+                self.__data.popitem(last=False)
+                self.__evictions += 1
+
+    def invalidate(self, key):
+        """Remove key from cache
+
+        :rtype: bool
+        :return True if key found and removed otherwise False
+        """
+        with self.__lock:
+            return self.__data.pop(key, _MISSING) is not _MISSING
+
+    def invalidate_where(self, predicate):
+        """Remove all keys that predicate(key, value) returns True
+
+        It scans all keys, don't call it on hot path.
+
+        :rtype: int
+        :return count of removed keys
+        """
+        with self.__lock:
+            keys = [k for k, (v, e) in self.__data.iteritems() if predicate(k, v)]
+            for k in keys:
+                del self.__data[k]
+            return len(keys)
+
+    def clear(self):
+        with self.__lock:
+            self.__data.clear()
+
+    def stats(self):
+        """Return the counters of cache for monitoring
+
+        :rtype: dict
+        """
+        with self.__lock:
+            return {
+                "size": len(self.__data),
+                "max_size": self.max_size,
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "evictions": self.__evictions,
+                "expirations": self.__expirations
+            }
+
+    def __len__(self):
+        return len(self.__data)
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+
+The MIT License (MIT)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import copy
+import time
+from threading import Lock, Event
+
+from hackathon.cache.lru_cache import LRUCache
+
+__all__ = ["TieredCache", "CacheBackend", "BeakerCacheBackend"]
+
+# marker for cache misses so that None can be cached as a normal value
+_MISSING = object()
+
+
+class CacheBackend(object):
+    """Base class of the optional shared tier behind the in-process LRU
+
+    Implementations must be safe to be called from multiple threads. Values passed in are picklable.
+    """
+
+    def get(self, key):
+        """Return the cached value or _MISSING if not found"""
+        raise NotImplementedError()
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+
+class BeakerCacheBackend(CacheBackend):
+    """Shared tier backed by beaker so that 'file', 'ext:memcached', 'ext:database' etc. can be configured
+
+    More options refer to http://beaker.readthedocs.org/en/latest/caching.html#about
+    """
+
+    def __init__(self, namespace="hackathon", **options):
+        from beaker.cache import CacheManager
+        from beaker.util import parse_cache_config_options
+
+        opts = dict(("cache.%s" % k, v) for k, v in options.iteritems())
+        self.cache = CacheManager(**parse_cache_config_options(opts)).get_cache(namespace)
+
+    def get(self, key):
+        try:
+            return self.cache.get(key)
+        except KeyError:
+            return _MISSING
+
+    def set(self, key, value, ttl=None):
+        self.cache.put(key, value, expiretime=ttl)
+
+    def delete(self, key):
+        self.cache.remove_value(key)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class _Flight(object):
+    """A computation in progress that concurrent misses of the same key wait for"""
+
+    def __init__(self):
+        self.event = Event()
+        self.value = None
+        self.error = None
+        self.discarded = False
+
+
+class TieredCache(object):
+    """Cache with an in-process LRU in front of an optional shared backend
+
+    On a miss of both tiers, the value is computed by createfunc. Concurrent misses on the same key are coalesced so
+    that createfunc runs only once while the other threads wait for its result(single flight).
+
+    :Example:
+        cache = TieredCache(LRUCache(max_size=5000, ttl=3600))
+        cache.get("hackathon_stat_1", lambda: compute_stat(1), ttl=60)
+        cache.invalidate("hackathon_stat_1")
+    """
+
+    def __init__(self, local, backend=None, copy_on_read=True):
+        """Create a new tiered cache
+
+        :type local: LRUCache
+        :param local: the in-process tier
+
+        :type backend: CacheBackend
+        :param backend: the optional shared tier. None to use local tier only
+
+        :type copy_on_read: bool
+        :param copy_on_read: return a deep copy of the cached value so that callers can modify it freely
+        """
+        self.local = local
+        self.backend = backend
+        self.copy_on_read = copy_on_read
+        self.__lock = Lock()
+        self.__flights = {}  # key -> _Flight
+        self.__backend_hits = 0
+        self.__computes = 0
+        self.__compute_errors = 0
+        self.__compute_seconds = 0.0
+        self.__compute_max_seconds = 0.0
+        self.__coalesced = 0
+
+    def get(self, key, createfunc, ttl=None):
+        """Get the cached value of key. It's computed by createfunc and cached if not found
+
+        None returned by createfunc is not cached so that a failed load will be retried next time.
+
+        :type key: str|unicode
+        :param key: the cache key
+
+        :type createfunc: function
+        :param createfunc: function without parameters that computes the value
+
+        :type ttl: int|float|None
+        :param ttl: time to live in seconds for this key. The default ttl of local tier is used if None
+
+        :return the cached or computed value
+        """
+        value = self.local.get(key, _MISSING)
+        if value is _MISSING:
+            value = self.__get_single_flight(key, createfunc, ttl)
+        return self.__copy(value)
+
+    def invalidate(self, key):
+        """Remove key from all tiers. A computation of the key in progress won't be cached either
+
+        :rtype: bool
+        :return True if key found in local tier
+        """
+        with self.__lock:
+            flight = self.__flights.pop(key, None)
+            if flight:
+                flight.discarded = True
+
+        found = self.local.invalidate(key)
+        if self.backend:
+            self.backend.delete(key)
+        return found
+
+    def clear(self):
+        with self.__lock:
+            for flight in self.__flights.values():
+                flight.discarded = True
+            self.__flights.clear()
+
+        self.local.clear()
+        if self.backend:
+            self.backend.clear()
+
+    def stats(self):
+        """Return hits/misses/evictions of local tier as well as backend hits and compute time
+
+        :rtype: dict
+        """
+        stats = self.local.stats()
+        stats.update({
+            "backend": self.backend.__class__.__name__ if self.backend else None,
+            "backend_hits": self.__backend_hits,
+            "computes": self.__computes,
+            "compute_errors": self.__compute_errors,
+            "compute_seconds": round(self.__compute_seconds, 3),
+            "compute_max_seconds": round(self.__compute_max_seconds, 3),
+            "coalesced": self.__coalesced,
+            "in_flight": len(self.__flights)
+        })
+        return stats
+
+    def __get_single_flight(self, key, createfunc, ttl):
+        with self.__lock:
+            flight = self.__flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self.__flights[key] = flight
+            else:
+                self.__coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = self.__load(key, createfunc, ttl, flight)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.__lock:
+                if self.__flights.get(key) is flight:
+                    del self.__flights[key]
+            flight.event.set()
+
+    def __load(self, key, createfunc, ttl, flight):
+        if self.backend:
+            value = self.backend.get(key)
+            if value is not _MISSING:
+                self.__backend_hits += 1
+                self.__store_local(key, value, ttl, flight)
+                return value
+
+        start = time.time()
+        try:
+            value = createfunc()
+        except Exception:
+            self.__compute_errors += 1
+            raise
+        finally:
+            elapsed = time.time() - start
+            self.__computes += 1
+            self.__compute_seconds += elapsed
+            self.__compute_max_seconds = max(self.__compute_max_seconds, elapsed)
+
+        if value is not None:
+            if self.backend and not flight.discarded:
+                self.backend.set(key, value, ttl if ttl is not None else self.local.ttl)
+                # an invalidation between the check and set may have deleted the key before the stale value landed
+                if flight.discarded:
+                    self.backend.delete(key)
+            self.__store_local(key, value, ttl, flight)
+        return value
+
+    def __store_local(self, key, value, ttl, flight):
+        with self.__lock:
+            if not flight.discarded:
+                self.local.set(key, value, ttl)
+
+    def __copy(self, value):
+        if self.copy_on_read and value is not None:
+            return copy.deepcopy(value)
+        return value
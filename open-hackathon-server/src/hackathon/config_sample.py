@@ -44,7 +44,40 @@ Config = {
         "secret_key": "secret_key"
     },
     "mysql": {
-        "connection": 'mysql://%s:%s@%s:%s/%s' % (MYSQL_USER, MYSQL_PWD, MYSQL_HOST, MYSQL_PORT, MYSQL_DB)
+        "connection": 'mysql://%s:%s@%s:%s/%s' % (MYSQL_USER, MYSQL_PWD, MYSQL_HOST, MYSQL_PORT, MYSQL_DB),
+        "transaction": {
+            # commit DB writes of a request once at its end instead of one commit per write
+            "request_scoped": True,
+            # commit in every DB call including reads like before. For migration only
+            "legacy_auto_commit": False
+        },
+        "pool": {
+            # max connections of all server processes to the primary, shared by 'workers'(uwsgi processes if 0)
+            "max_connections": 150,
+            "workers": 0,
+            "timeout_seconds": 30,
+            "recycle_seconds": 3600,
+            # connections idle for longer are pinged on checkout
+            "pre_ping_idle_seconds": 30,
+            # threads holding a connection for longer are reported by health item 'db_pool', their stacks are listed
+            # by /api/admin/dbpool for super admin
+            "long_held_seconds": 60,
+            # health item 'db_pool' is WARNING if any checkout timed out in the last seconds
+            "recent_seconds": 300
+        },
+        # optional read replicas. Reads of public resources annotated with @replica_reads go to them
+        "replicas": {
+            "connections": [],
+            "max_connections": 60,
+            # reads of a client go to primary for some seconds after the client writes, see header 'db_written_at'
+            "sticky_seconds": 5
+        },
+        # per request SQL profiling. Stats by endpoint are listed by /api/admin/sqlprofile for super admin
+        "profiler": {
+            "enabled": False,
+            # a SELECT executed this many times in a request is reported as a likely N+1 pattern
+            "n_plus_one_threshold": 5
+        }
     },
     "login": {
         "github": {
@@ -66,22 +99,81 @@ Config = {
         "live": {
             "user_info_url": 'https://apis.live.net/v5.0/me?access_token='
         },
-        "token_expiration_minutes": 60 * 24
+        "token_expiration_minutes": 60 * 24,
+        "token_cache": {
+            "max_size": 10000,
+            "ttl_seconds": 300
+        }
     },
     "azure": {
         "cert_base": "",
+        # pending azure operations are stored in DB and polled by one process at a time every poll interval, each one
+        # from initial interval doubling up to max interval
+        "operation_tracker": {
+            "poll_interval_seconds": 5,
+            "initial_interval_seconds": 5,
+            "max_interval_seconds": 30,
+            "timeout_seconds": 1800
+        }
     },
     "guacamole": {
         "host": "http://localhost:8080"
     },
     "scheduler": {
         "job_store": "mysql",
-        "job_store_url": 'mysql://%s:%s@%s:%s/%s' % (MYSQL_USER, MYSQL_PWD, MYSQL_HOST, MYSQL_PORT, MYSQL_DB)
+        "job_store_url": 'mysql://%s:%s@%s:%s/%s' % (MYSQL_USER, MYSQL_PWD, MYSQL_HOST, MYSQL_PORT, MYSQL_DB),
+        # interval jobs run in only one server process at a time. type: "db", "file"(processes on one host) or "none"
+        "lock": {
+            "type": "db",
+            "lease_seconds": 600,
+            "file_dir": "/tmp/hackathon/job_lock"
+        },
+        # worker pools of scheduled jobs. Lower priority value runs earlier among queued jobs of the same pool
+        "pools": {
+            "default": {"max_workers": 10, "priority": 5},
+            "interactive": {"max_workers": 8, "priority": 0},
+            "provisioning": {"max_workers": 6, "priority": 5},
+            "maintenance": {"max_workers": 4, "priority": 9}
+        }
+    },
+    "cache": {
+        "local": {
+            "max_size": 5000,
+            "ttl_seconds": 3600 * 24
+        },
+        # invalidations are broadcast to all server processes through DB table cache_invalidation
+        "invalidation": {
+            "poll_interval_seconds": 5,
+            "retention_minutes": 60,
+            # invalidations committed later than published, e.g. in long transactions, are still found in this window
+            "late_commit_seconds": 60
+        },
+        # optional shared backend behind the in-process cache. Set type to 'file' or 'ext:memcached' to enable it
+        "backend": {
+            "type": "",
+            "data_dir": "/tmp/cache/data",
+            "lock_dir": "/tmp/cache/lock"
+        }
+    },
+    "expr": {
+        "async_start": {
+            "enabled": True,
+            "max_workers": 8,
+            # docker experiments still starting after the minutes are rolled back by the recycle job
+            "stale_minutes": 60
+        },
+        "heart_beat": {
+            "flush_interval_seconds": 30,
+            "running_check_seconds": 60
+        }
+    },
+    "hackathon_stat": {
+        "reconcile_interval_minutes": 10
     },
     "pre_allocate": {
         "check_interval_minutes": 5,
-        "azure": 1,
-        "docker": 1
+        "max_concurrency": 4,
+        "claim_attempts": 5
     },
     "storage": {
         "type": "local",
@@ -95,7 +187,58 @@ Config = {
             "blob_service_host_base": ".blob.core.chinacloudapi.cn"
         }
     },
+    "template": {
+        # compiled templates are cached per process by template id and update_time
+        "compiled_cache": {
+            "max_size": 200,
+            # remote templates are downloaded by threads of every process, starting an experiment waits for it
+            "max_workers": 4,
+            "load_timeout_seconds": 60
+        }
+    },
+    "http_client": {
+        "pool_size": 10,
+        "connect_timeout_seconds": 5,
+        "read_timeout_seconds": 60,
+        "retries": 3,
+        "backoff_factor": 0.5
+    },
     "docker": {
+        "pull_image_timeout_seconds": 1800,
+        "parallel_start": {
+            "enabled": True,
+            "max_workers": 8
+        },
+        "recycle": {
+            "max_workers": 8
+        },
+        "host_scheduler": {
+            "strategy": "least_loaded",
+            "probe_interval_seconds": 30,
+            "status_max_age_seconds": 60,
+            "probe_workers": 8
+        },
+        # pull images of templates to docker hosts before containers start on them
+        "image_pull": {
+            "max_workers": 8,
+            "per_host_concurrency": 2
+        },
+        "capacity_planner": {
+            "dry_run": True,
+            "interval_minutes": 5,
+            "lead_minutes": 30,
+            "vm_boot_minutes": 30,
+            "rate_window_minutes": 30,
+            "expected_concurrency": 0.8,
+            "headroom": 0.2,
+            "min_free_containers": 5,
+            "max_new_vms_per_run": 3
+        },
+        "port_allocator": {
+            "resync_seconds": 600,
+            "pending_seconds": 300,
+            "conflict_retries": 3
+        },
         "alauda": {
             "token": "",
             "namespace": "",
@@ -31,9 +31,12 @@ class HTTP_HEADER:
     Attributes:
         TOKEN: token for current login user to access the hackathon server APIs with @token_required
         HACKATHON_NAME: the name of hackathon related to the API call
+        DB_WRITTEN_AT: time of the last DB write of the client, responded by server and sent back by client so that
+            its reads don't go to lagging read replicas
     """
     TOKEN = "token"
     HACKATHON_NAME = "hackathon_name"
+    DB_WRITTEN_AT = "db_written_at"
 
 
 class OAUTH_PROVIDER:
@@ -65,15 +68,30 @@ class HEALTH:
     VERSION = "version"
 
 
+class CACHE_CHANNEL:
+    """Channels of cache invalidation that broadcast to all server processes
+
+    Attributes:
+        CACHE: key of CacheManagerExt
+        USER_TOKENS: id of the user whose tokens in token cache are invalid
+    """
+    CACHE = "cache"
+    USER_TOKENS = "user_tokens"
+
+
 class HACKATHON_STAT:
     """Statistics types of a hackathon
 
     Attributes:
         LIKE: number of user that likes a hackathon
-        REGISTER: number of registered users
+        REGISTER: number of registered users whose registration is approved
+        ONLINE: number of registered users who are online now
+        OFFLINE: number of registered users who are offline now
     """
     LIKE = "like"
     REGISTER = "register"
+    ONLINE = "online"
+    OFFLINE = "offline"
 
 
 class HACKATHON_BASIC_INFO:
@@ -326,11 +344,13 @@ class DockerHostServerStatus:
                      of initialization
         DOCKER_READY: VM docker api port is OK
         UNAVAILABLE: VM is unavailable
+        REQUESTED: VM is requested from Azure but not created yet, so that all processes know it's coming
     """
     STARTING = 0
     DOCKER_INIT = 1
     DOCKER_READY = 2
     UNAVAILABLE = 3
+    REQUESTED = 4
 
 class DockerHostServerDisable:
     """
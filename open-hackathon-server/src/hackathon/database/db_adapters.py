@@ -25,15 +25,95 @@
 # -----------------------------------------------------------------------------------
 
 
+from threading import local
+from functools import wraps
+
+from hackathon.util import safe_get_config
+from hackathon.log import log
+
+# commit in every adapter method including reads, the behavior before transaction scopes were introduced. It's there
+# during migration only
+LEGACY_AUTO_COMMIT = safe_get_config("mysql.transaction.legacy_auto_commit", False)
+
+# depth of transaction scopes of current thread and callbacks waiting for its commit. It's shared by all adapters since
+# they share the scoped session
+transaction_state = local()
+
+
+def get_transaction_depth():
+    return getattr(transaction_state, "depth", 0)
+
+
+def fail_transaction(adapter):
+    """Roll back the session at once when a flush inside a transaction scope fails, the outermost scope won't commit
+
+    A session whose flush failed refuses any further query until it's rolled back, so managers which catch the error
+    and go on would fail on every later query and the teardown commit.
+    """
+    transaction_state.failed = True
+    adapter.rollback()
+
+
+def write_in_savepoint(adapter, func, *args, **kwargs):
+    """Run a write of adapter inside a transaction scope in its own savepoint
+
+    A failed write rolls back to the savepoint only. The session stays usable and earlier writes of the scope are kept.
+    """
+    try:
+        savepoint = adapter.db_session.begin_nested()
+    except:
+        # pending changes made before this write fail to flush, there's no savepoint to go back to
+        fail_transaction(adapter)
+        raise
+
+    try:
+        return_value = func(adapter, *args, **kwargs)
+        # flush so that ids are assigned, the outermost scope commits
+        adapter.db_session.flush()
+        savepoint.commit()
+        return return_value
+    except:
+        try:
+            savepoint.rollback()
+        except:
+            fail_transaction(adapter)
+        raise
+
+
 class SQLAlchemyAdapterMetaClass(type):
     @staticmethod
     def wrap(func):
-        """Return a wrapped instance method"""
+        """Return a wrapped instance method that writes
+
+        It commits at once outside transaction scopes. Inside a scope it runs in a savepoint and flushes only, the
+        outermost scope commits all writes once it ends. See write_in_savepoint and SQLAlchemyAdapter.transaction
+        """
+
+        def auto_commit(self, *args, **kwargs):
+            if get_transaction_depth() > 0:
+                return write_in_savepoint(self, func, *args, **kwargs)
+
+            try:
+                return_value = func(self, *args, **kwargs)
+                self.commit()
+                return return_value
+            except:
+                self.rollback()
+                raise
+
+        return auto_commit
+
+    @staticmethod
+    def wrap_read(func):
+        """Return a wrapped instance method that reads only
+
+        It never commits unless LEGACY_AUTO_COMMIT. It reads from a replica only in replica_reads scopes(see routing.py)
+        """
+        if not LEGACY_AUTO_COMMIT:
+            return func
 
         def auto_commit(self, *args, **kwargs):
             try:
-                # todo a trick for DB transaction issue
-                # self.commit()
                 return_value = func(self, *args, **kwargs)
                 self.commit()
                 return return_value
@@ -45,17 +125,62 @@ class SQLAlchemyAdapterMetaClass(type):
 
     def __new__(mcs, name, bases, attrs):
         """If the method in this list, DON'T wrap it"""
-        no_wrap = ["commit", "merge", "rollback", "remove", "session"]
+        no_wrap = ["commit", "merge", "rollback", "remove", "session", "transaction", "begin", "end",
+                   "in_transaction", "after_commit"]
+        # methods that never write
+        read_only = ["get_object", "find_all_objects", "find_all_objects_by", "find_all_objects_order_by", "count",
+                     "count_by", "find_first_object", "find_first_object_by", "find_all_dics", "find_all_dics_by",
+                     "paginate"]
 
         def wrap(method):
             """private methods are not wrapped"""
-            if method not in no_wrap and not method.startswith("__"):
+            if method in read_only:
+                attrs[method] = mcs.wrap_read(attrs[method])
+            elif method not in no_wrap and not method.startswith("__"):
                 attrs[method] = mcs.wrap(attrs[method])
 
         map(lambda m: wrap(m), attrs.keys())
         return super(SQLAlchemyAdapterMetaClass, mcs).__new__(mcs, name, bases, attrs)
 
 
+class Transaction(object):
+    """A transaction scope of adapter. Use it as a context manager or a decorator
+
+    Writes in the scope are committed once when the outermost scope exits without exception, or rolled back otherwise.
+    Scopes can be nested, the inner ones join the outermost one. A failed adapter write rolls back its own savepoint
+    only, so the caller may catch the error and go on. If an explicit commit fails to flush the whole scope is rolled
+    back at once and won't commit.
+
+    :Example:
+        with db.transaction():
+            team = db.add_object_kwargs(Team, name="team")
+            db.add_object_kwargs(UserTeamRel, team_id=team.id, user_id=user.id)
+
+        @db.transaction()
+        def create_team(self):
+            ...
+    """
+
+    def __init__(self, adapter):
+        self.adapter = adapter
+
+    def __enter__(self):
+        self.adapter.begin()
+        return self.adapter
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.adapter.end(exc_val)
+        return False
+
+    def __call__(self, func):
+        @wraps(func)
+        def transactional(*args, **kwargs):
+            with Transaction(self.adapter):
+                return func(*args, **kwargs)
+
+        return transactional
+
+
 class DBAdapter(object):
     def __init__(self, db_session):
         self.db_session = db_session
@@ -71,7 +196,19 @@ class SQLAlchemyAdapter(DBAdapter):
     # ------------------------------ methods that no need to wrap --- start ------------------------------
 
     def commit(self):
-        self.db_session.commit()
+        """Commit the session. Inside a transaction scope it flushes only, the outermost scope commits once it ends
+
+        So explicit commits in managers don't break the request into several transactions. See fail_transaction for a
+        failed flush.
+        """
+        if get_transaction_depth() > 0:
+            try:
+                self.db_session.flush()
+            except:
+                fail_transaction(self)
+                raise
+        else:
+            self.db_session.commit()
 
     def remove(self):
         self.db_session.remove()
@@ -85,6 +222,65 @@ class SQLAlchemyAdapter(DBAdapter):
     def session(self):
         return self.db_session
 
+    def transaction(self):
+        """Return a transaction scope that batches writes into one commit. See Transaction
+
+        :rtype: Transaction
+        """
+        return Transaction(self)
+
+    def in_transaction(self):
+        return get_transaction_depth() > 0
+
+    def begin(self):
+        """Enter a transaction scope of current thread. Prefer transaction() unless the scope spans callbacks"""
+        depth = get_transaction_depth()
+        if depth == 0:
+            transaction_state.failed = False
+        transaction_state.depth = depth + 1
+
+    def end(self, exception=None):
+        """Exit a transaction scope of current thread. The outermost scope commits, or rolls back if exception"""
+        depth = get_transaction_depth()
+        if depth <= 0:
+            return
+        transaction_state.depth = depth - 1
+        if depth == 1:
+            callbacks = getattr(transaction_state, "callbacks", [])
+            transaction_state.callbacks = []
+            if getattr(transaction_state, "failed", False):
+                log.warn("transaction scope rolled back since a flush in it failed")
+                transaction_state.failed = False
+                self.rollback()
+                return
+            if exception is not None:
+                self.rollback()
+                return
+            try:
+                self.commit()
+            except:
+                self.rollback()
+                raise
+
+            for callback, args, kwargs in callbacks:
+                try:
+                    callback(*args, **kwargs)
+                except Exception as e:
+                    log.error(e)
+
+    def after_commit(self, callback, *args, **kwargs):
+        """Call 'callback' once writes so far are committed, e.g. to hand ids of new rows to other threads
+
+        It's called at once outside transaction scopes, or after the outermost scope commits. It's never called if the
+        scope rolls back.
+        """
+        if get_transaction_depth() > 0:
+            if not hasattr(transaction_state, "callbacks"):
+                transaction_state.callbacks = []
+            transaction_state.callbacks.append((callback, args, kwargs))
+        else:
+            callback(*args, **kwargs)
+
     # ------------------------------ methods that no need to wrap --- end------------------------------
 
     # ------------------------------ auto wrapped 'public' methods  --- start ------------------------------
@@ -98,6 +294,17 @@ class SQLAlchemyAdapter(DBAdapter):
     def find_all_objects_by(self, object_class, **kwargs):
         return object_class.query.filter_by(**kwargs).all()
 
+    def find_all_dics(self, object_class, *criterion):
+        """Same as find_all_objects but returns dicts like model.dic(). Only columns are selected so it's much cheaper
+        than building ORM objects for large lists"""
+        serializer = object_class.serializer()
+        return serializer.dic_many(serializer.query().filter(*criterion).all())
+
+    def find_all_dics_by(self, object_class, **kwargs):
+        """Same as find_all_objects_by but returns dicts like model.dic(). See find_all_dics"""
+        criterion = [getattr(object_class, key) == value for key, value in kwargs.iteritems()]
+        return self.find_all_dics(object_class, *criterion)
+
     def find_all_objects_order_by(self, object_class, limit=None, *order_by, **kwargs):
         if limit is not None:
             return object_class.query.filter_by(**kwargs).order_by(*order_by).limit(limit)
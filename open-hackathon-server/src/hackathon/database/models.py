@@ -24,7 +24,7 @@
 # THE SOFTWARE.
 # -----------------------------------------------------------------------------------
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, TypeDecorator
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, TypeDecorator, PickleType, UniqueConstraint
 from sqlalchemy.orm import backref, relation
 from . import Base, db_adapter
 from datetime import datetime
@@ -45,29 +45,109 @@ def date_serializer(date):
 
 
 def to_dic(inst, cls):
-    # add your coversions for things like datetime's
-    # and what-not that aren't serializable.
-    convert = dict()
-    convert[TZDateTime] = date_serializer
-
-    d = dict()
-    for c in cls.__table__.columns:
-        v = getattr(inst, c.name)
-        if c.type.__class__ in convert.keys() and v is not None:
-            try:
-                func = convert[c.type.__class__]
-                d[c.name] = func(v)
-            except:
-                d[c.name] = "Error:  Failed to covert using ", str(convert[c.type.__class__])
-        else:
-            d[c.name] = v
-    return d
+    return get_serializer(cls).dic(inst)
 
 
 def to_json(inst, cls):
     return json.dumps(to_dic(inst, cls))
 
 
+# model class or (model class, fields) -> ModelSerializer
+serializers = {}
+
+
+def get_serializer(cls, fields=None):
+    """Get the serializer of model class. Serializers are built once and shared
+
+    :type cls: class
+    :param cls: the model class, subclass of DBBase
+
+    :type fields: list|tuple
+    :param fields: names of columns to serialize. All columns if None
+
+    :rtype: ModelSerializer
+    """
+    key = cls if fields is None else (cls, tuple(fields))
+    serializer = serializers.get(key)
+    if serializer is None:
+        serializer = ModelSerializer(cls, fields)
+        serializers[key] = serializer
+    return serializer
+
+
+class ModelSerializer(object):
+    """Convert model instances or rows of selected columns to dicts
+
+    Column names and converters are resolved once when the serializer is built, so serializing a row is nothing but a
+    loop over precomputed slots. Values of TZDateTime columns are converted to milliseconds since epoch.
+
+    :Example:
+        serializer = get_serializer(Template, ["id", "name"])
+        serializer.dic(template)  # {"id": 1, "name": "ubuntu"}
+
+        # select the columns only, no ORM object is built
+        serializer.dic_many(serializer.query().filter(Template.status == 1).all())
+    """
+
+    def __init__(self, cls, fields=None):
+        columns = cls.__table__.columns
+        if fields is not None:
+            columns = [columns[f] for f in fields]
+
+        self.cls = cls
+        self.fields = tuple(c.name for c in columns)
+        self.columns = tuple(getattr(cls, c.name) for c in columns)
+        self.converters = tuple(date_serializer if isinstance(c.type, TZDateTime) else None for c in columns)
+        self.__slots = zip(self.fields, self.converters)
+
+    def query(self):
+        """Query that selects the columns of serializer only. Filter it and pass the results to dic_many"""
+        return self.cls.query.with_entities(*self.columns)
+
+    def dic(self, inst):
+        """Serialize a model instance
+
+        :rtype: dict
+        """
+        d = {}
+        for name, convert in self.__slots:
+            v = getattr(inst, name)
+            d[name] = self.__convert(convert, v) if convert and v is not None else v
+        return d
+
+    def dic_many(self, rows):
+        """Serialize many rows
+
+        :type rows: list
+        :param rows: model instances, or tuples of values whose order is the same as self.fields(see query())
+
+        :rtype: list
+        :return: list of dict
+        """
+        rows = list(rows)
+        if not rows:
+            return []
+        if isinstance(rows[0], self.cls):
+            return [self.dic(inst) for inst in rows]
+
+        result = []
+        fields, converters = self.fields, self.converters
+        if not any(converters):
+            return [dict(zip(fields, r)) for r in rows]
+        for r in rows:
+            d = {}
+            for name, convert, v in zip(fields, converters, r):
+                d[name] = self.__convert(convert, v) if convert and v is not None else v
+            result.append(d)
+        return result
+
+    def __convert(self, convert, value):
+        try:
+            return convert(value)
+        except Exception:
+            return "Error:  Failed to covert using %s" % convert.__name__
+
+
 class TZDateTime(TypeDecorator):
     '''
         usage: remove datetime's tzinfo
@@ -107,6 +187,20 @@ class DBBase(Base):
     def dic(self):
         return to_dic(self, self.__class__)
 
+    @classmethod
+    def serializer(cls, fields=None):
+        """Get the shared serializer of the model. See ModelSerializer
+
+        :type fields: list|tuple
+        :param fields: names of columns to serialize. All columns if None
+        """
+        return get_serializer(cls, fields)
+
+    @classmethod
+    def dic_many(cls, rows, fields=None):
+        """Serialize model instances or rows of the columns selected by cls.serializer(fields).query()"""
+        return get_serializer(cls, fields).dic_many(rows)
+
     def json(self):
         return to_json(self, self.__class__)
 
@@ -379,6 +473,8 @@ class HackathonLike(DBBase):
 
 class HackathonStat(DBBase):
     __tablename__ = 'hackathon_stat'
+    # one counter per type, so that concurrent first increases cannot insert duplicate rows
+    __table_args__ = (UniqueConstraint('hackathon_id', 'type'),)
 
     id = Column(Integer, primary_key=True)
     type = Column(String(50))
@@ -509,6 +605,8 @@ class DockerContainer(DBBase):
 
 class PortBinding(DBBase):
     __tablename__ = 'port_binding'
+    # a host port is bound only once, so that two server processes cannot hand out the same port
+    __table_args__ = (UniqueConstraint('binding_type', 'binding_resource_id', 'port_from'),)
 
     # for simplicity, the port won't be released until the corresponding container removed(not stopped).
     # that means a port occupied by stopped container won't be allocated to new container. So it's possible to start the
@@ -761,3 +859,59 @@ class AdminHackathonRel(DBBase):
 
     def __init__(self, **kwargs):
         super(AdminHackathonRel, self).__init__(**kwargs)
+
+
+class CacheInvalidation(DBBase):
+    """Invalidation of cache broadcast to all server processes. See cache/invalidation_bus.py"""
+    __tablename__ = 'cache_invalidation'
+
+    id = Column(Integer, primary_key=True)
+    channel = Column(String(50))  # enum.CACHE_CHANNEL
+    key = Column(String(255))
+    create_time = Column(TZDateTime, default=get_now())
+
+    def __init__(self, **kwargs):
+        super(CacheInvalidation, self).__init__(**kwargs)
+
+
+class AzureOperation(DBBase):
+    """Azure operation waiting for its final status, polled by any server process. See operation_tracker.py"""
+    __tablename__ = 'azure_operation'
+
+    id = Column(Integer, primary_key=True)
+    operation_key = Column(String(191), unique=True)  # kind, azure key and args, e.g. request id of async operation
+    kind = Column(String(20))
+    azure_key_id = Column(Integer)
+    args = Column(Text)  # json list of the arguments to check the status
+    on_success = Column(PickleType)  # (mdl_cls_func, cls_args, func_args) to run by run_job
+    on_failure = Column(PickleType)
+    interval_seconds = Column(Integer)
+    checks = Column(Integer, default=0)
+    next_check_time = Column(TZDateTime)
+    deadline = Column(TZDateTime)
+    create_time = Column(TZDateTime, default=get_now())
+
+    def __init__(self, **kwargs):
+        super(AzureOperation, self).__init__(**kwargs)
+
+
+class SchedulerJobLock(DBBase):
+    """Lease of a scheduled job shared by all server processes so that only one runs it. See job_lock.py"""
+    __tablename__ = 'scheduler_job_lock'
+
+    job_id = Column(String(191), primary_key=True)
+    owner = Column(String(100))  # host:pid of the process holding the lease
+    locked_until = Column(TZDateTime)
+    last_start_time = Column(TZDateTime)
+
+    def __init__(self, **kwargs):
+        super(SchedulerJobLock, self).__init__(**kwargs)
+
+
+def _build_serializers():
+    """Build serializers of all models at import so that no request pays for it"""
+    for model in DBBase.__subclasses__():
+        get_serializer(model)
+
+
+_build_serializers()
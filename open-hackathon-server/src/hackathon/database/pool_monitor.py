@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import sys
+import time
+import traceback
+from collections import deque
+from threading import Lock, current_thread
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.pool import QueuePool
+
+from hackathon.util import safe_get_config
+
+__all__ = ["PoolMonitor", "InstrumentedQueuePool", "create_instrumented_engine", "get_pool_sizing"]
+
+# upper bounds in milliseconds of the buckets of checkout wait histogram
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+def get_worker_count():
+    """Count of server processes that share the connection budget. 'mysql.pool.workers' or uwsgi processes"""
+    workers = safe_get_config("mysql.pool.workers", 0)
+    if workers:
+        return workers
+    try:
+        import uwsgi
+        return uwsgi.numproc
+    except ImportError:
+        return 1
+
+
+def get_pool_sizing(max_connections):
+    """Split the connection budget of the server among its worker processes
+
+    A third of the share of each process is kept open in the pool, the rest is overflow that's closed once returned.
+
+    :type max_connections: int
+    :param max_connections: max count of connections that all processes of the server may open to one database
+
+    :rtype: tuple
+    :return: (pool_size, max_overflow) for a process
+    """
+    per_worker = max(max_connections // get_worker_count(), 2)
+    pool_size = max(per_worker // 3, 1)
+    return pool_size, per_worker - pool_size
+
+
+class PoolMonitor(object):
+    """Collect checkout wait, ping and long-held connection stats of a connection pool
+
+    Connections idle for more than 'pre_ping_idle_seconds' are pinged on checkout. A dead one raises
+    DisconnectionError so that pool replaces it with a fresh connection transparently, instead of failing the first
+    request after MySQL closes idle connections.
+
+    Stacks of threads holding a connection longer than 'long_held_seconds' are captured only when asked for by
+    get_stats, so checkouts pay nothing for it. Checkout timeouts are also counted in the last 'recent_seconds' so
+    that a timeout long ago doesn't make the pool look unhealthy forever.
+    """
+
+    def __init__(self, long_held_seconds=60, pre_ping_idle_seconds=30, recent_seconds=300):
+        self.long_held_seconds = long_held_seconds
+        self.pre_ping_idle_seconds = pre_ping_idle_seconds
+        self.recent_seconds = recent_seconds
+        self.__lock = Lock()
+        self.__wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.__checkouts = 0
+        self.__wait_seconds = 0.0
+        self.__wait_max_seconds = 0.0
+        self.__timeouts = 0
+        self.__timeout_times = deque()
+        self.__pings = 0
+        self.__ping_failures = 0
+        self.__held = {}  # id of connection record -> (checkout time, thread ident, thread name)
+
+    def attach(self, pool):
+        pool.monitor = self
+        event.listen(pool, "connect", self.on_connect)
+        event.listen(pool, "checkout", self.on_checkout)
+        event.listen(pool, "checkin", self.on_checkin)
+
+    def record_wait(self, seconds, timeout=False):
+        """Record the time taken to get a connection from pool. See InstrumentedQueuePool"""
+        ms = seconds * 1000
+        bucket = len(WAIT_BUCKETS_MS)
+        for i, bound in enumerate(WAIT_BUCKETS_MS):
+            if ms <= bound:
+                bucket = i
+                break
+        with self.__lock:
+            self.__wait_buckets[bucket] += 1
+            self.__wait_seconds += seconds
+            self.__wait_max_seconds = max(self.__wait_max_seconds, seconds)
+            if timeout:
+                self.__timeouts += 1
+                self.__timeout_times.append(time.time())
+            else:
+                self.__checkouts += 1
+
+    def on_connect(self, dbapi_connection, connection_record):
+        connection_record.info.pop("checkin_time", None)
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        checkin_time = connection_record.info.get("checkin_time")
+        if checkin_time is not None and time.time() - checkin_time > self.pre_ping_idle_seconds:
+            self.__ping(dbapi_connection)
+
+        thread = current_thread()
+        with self.__lock:
+            self.__held[id(connection_record)] = (time.time(), thread.ident, thread.name)
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        connection_record.info["checkin_time"] = time.time()
+        with self.__lock:
+            self.__held.pop(id(connection_record), None)
+
+    def get_stats(self, with_stacks=False):
+        """Return checkout wait histogram, ping counters and connections held too long
+
+        :type with_stacks: bool
+        :param with_stacks: whether to include stacks of the threads holding connections too long. Stacks may leak
+            internals so only return them to super admin
+
+        :rtype: dict
+        """
+        now = time.time()
+        with self.__lock:
+            while self.__timeout_times and now - self.__timeout_times[0] > self.recent_seconds:
+                self.__timeout_times.popleft()
+            buckets = list(self.__wait_buckets)
+            count = self.__checkouts + self.__timeouts
+            stats = {
+                "checkouts": self.__checkouts,
+                "timeouts": self.__timeouts,
+                "recent_timeouts": len(self.__timeout_times),
+                "pings": self.__pings,
+                "ping_failures": self.__ping_failures,
+                "checkout_wait": {
+                    "avg_ms": round(self.__wait_seconds * 1000 / count, 3) if count else 0,
+                    "max_ms": round(self.__wait_max_seconds * 1000, 3),
+                    "histogram_ms": dict(zip(["<=%d" % b for b in WAIT_BUCKETS_MS] + [">%d" % WAIT_BUCKETS_MS[-1]],
+                                             buckets))
+                }
+            }
+            held = self.__held.values()
+
+        frames = sys._current_frames() if with_stacks else {}
+        stats["long_held"] = []
+        for since, ident, name in held:
+            if now - since > self.long_held_seconds:
+                item = {"held_seconds": round(now - since, 1), "thread": name}
+                if with_stacks:
+                    item["stack"] = traceback.format_stack(frames[ident]) if ident in frames else []
+                stats["long_held"].append(item)
+        return stats
+
+    def __ping(self, dbapi_connection):
+        with self.__lock:
+            self.__pings += 1
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+        except Exception:
+            with self.__lock:
+                self.__ping_failures += 1
+            # pool will invalidate the connection and check out another one
+            raise exc.DisconnectionError()
+        finally:
+            cursor.close()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long every checkout waits in its PoolMonitor"""
+
+    def connect(self):
+        return self.__timed_checkout(super(InstrumentedQueuePool, self).connect)
+
+    def unique_connection(self):
+        return self.__timed_checkout(super(InstrumentedQueuePool, self).unique_connection)
+
+    def __timed_checkout(self, checkout):
+        monitor = getattr(self, "monitor", None)
+        if monitor is None:
+            return checkout()
+
+        start = time.time()
+        try:
+            connection = checkout()
+        except exc.TimeoutError:
+            monitor.record_wait(time.time() - start, timeout=True)
+            raise
+        monitor.record_wait(time.time() - start)
+        return connection
+
+    def recreate(self):
+        pool = super(InstrumentedQueuePool, self).recreate()
+        pool.monitor = getattr(self, "monitor", None)
+        return pool
+
+
+def create_instrumented_engine(url, max_connections):
+    """Create an engine whose pool is sized by get_pool_sizing and monitored by PoolMonitor
+
+    :type url: str|unicode
+    :param url: connection url of database
+
+    :type max_connections: int
+    :param max_connections: max count of connections that all processes of the server may open to the database
+    """
+    pool_size, max_overflow = get_pool_sizing(max_connections)
+    engine = create_engine(url,
+                           convert_unicode=True,
+                           poolclass=InstrumentedQueuePool,
+                           pool_size=pool_size,
+                           max_overflow=max_overflow,
+                           pool_timeout=safe_get_config("mysql.pool.timeout_seconds", 30),
+                           # MySQL closes connections idle for 'wait_timeout'(8 hours by default)
+                           pool_recycle=safe_get_config("mysql.pool.recycle_seconds", 3600),
+                           echo=False)
+    monitor = PoolMonitor(long_held_seconds=safe_get_config("mysql.pool.long_held_seconds", 60),
+                          pre_ping_idle_seconds=safe_get_config("mysql.pool.pre_ping_idle_seconds", 30),
+                          recent_seconds=safe_get_config("mysql.pool.recent_seconds", 300))
+    monitor.attach(engine.pool)
+    return engine
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import re
+import time
+import traceback
+from threading import Lock, local
+from collections import defaultdict
+
+from flask import request, has_request_context
+from sqlalchemy import event
+
+from hackathon.util import safe_get_config
+from hackathon.log import log
+
+__all__ = ["RequestProfile", "attach_profiler", "is_profiling_enabled", "start_request_profile",
+           "finish_request_profile", "get_sql_profile", "reset_sql_profile", "get_fingerprint"]
+
+# profile of the request that current thread is handling
+profile_state = local()
+
+# endpoint -> EndpointStats, aggregated by finish_request_profile
+endpoint_stats = {}
+endpoint_stats_lock = Lock()
+
+# count of different statements kept per endpoint, the most executed ones are kept
+MAX_STATEMENTS_PER_ENDPOINT = 20
+
+STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:\?|%s|%\(\w+\)s)\s*,?)+\)", re.IGNORECASE)
+WHITESPACE = re.compile(r"\s+")
+
+
+def is_profiling_enabled():
+    return safe_get_config("mysql.profiler.enabled", False)
+
+
+def get_fingerprint(statement):
+    """Normalize a SQL statement so that executions differing only in parameters have the same fingerprint
+
+    :type statement: str|unicode
+    :param statement: SQL statement, with or without bound parameters rendered
+
+    :rtype: str|unicode
+    """
+    fingerprint = STRING_LITERAL.sub("?", statement)
+    fingerprint = NUMBER_LITERAL.sub("?", fingerprint)
+    fingerprint = WHITESPACE.sub(" ", fingerprint).strip()
+    # lists of different length in IN clause are the same statement
+    return IN_LIST.sub("IN (...)", fingerprint)
+
+
+def get_caller():
+    """The innermost frame in our own codes which executes a statement, 'file:line function'"""
+    for filename, line, func, _ in reversed(traceback.extract_stack()):
+        filename = filename.replace("\\", "/")
+        if "/hackathon/" in filename and "/hackathon/database/" not in filename:
+            return "%s:%d %s" % (filename[filename.rindex("/hackathon/") + 1:], line, func)
+    return None
+
+
+class RequestProfile(object):
+    """Statements executed while handling one request
+
+    A SELECT statement executed 'n_plus_one_threshold' times or more in a request is likely an N+1 pattern, which is
+    usually lazy loading of a relationship in a loop like `[t.user_team_rels.count() for t in teams]`. Where it's
+    executed is recorded at the moment it reaches the threshold, so it points into the loop.
+    """
+
+    def __init__(self, endpoint, n_plus_one_threshold=5):
+        self.endpoint = endpoint
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.start_time = time.time()
+        self.query_count = 0
+        self.sql_seconds = 0.0
+        self.statements = defaultdict(int)  # fingerprint -> count
+        self.n_plus_one = {}  # fingerprint -> caller
+
+    def record(self, statement, seconds):
+        fingerprint = get_fingerprint(statement)
+        self.query_count += 1
+        self.sql_seconds += seconds
+        self.statements[fingerprint] += 1
+        if self.statements[fingerprint] == self.n_plus_one_threshold and fingerprint[:6].upper() == "SELECT":
+            self.n_plus_one[fingerprint] = get_caller()
+
+    def get_summary(self):
+        return {
+            "endpoint": self.endpoint,
+            "query_count": self.query_count,
+            "sql_time_ms": round(self.sql_seconds * 1000, 3),
+            "n_plus_one": [{
+                "statement": fingerprint,
+                "count": self.statements[fingerprint],
+                "caller": caller
+            } for fingerprint, caller in self.n_plus_one.iteritems()]
+        }
+
+
+class EndpointStats(object):
+    """Aggregated profiles of all requests to an endpoint"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.requests = 0
+        self.query_count = 0
+        self.max_query_count = 0
+        self.sql_seconds = 0.0
+        self.n_plus_one_requests = 0
+        self.statements = {}  # fingerprint -> {"count", "max_per_request", "n_plus_one", "caller"}
+
+    def add(self, profile):
+        self.requests += 1
+        self.query_count += profile.query_count
+        self.max_query_count = max(self.max_query_count, profile.query_count)
+        self.sql_seconds += profile.sql_seconds
+        if profile.n_plus_one:
+            self.n_plus_one_requests += 1
+
+        for fingerprint, count in profile.statements.iteritems():
+            stat = self.statements.setdefault(fingerprint, {"count": 0, "max_per_request": 0, "n_plus_one": 0,
+                                                            "caller": None})
+            stat["count"] += count
+            stat["max_per_request"] = max(stat["max_per_request"], count)
+            if fingerprint in profile.n_plus_one:
+                stat["n_plus_one"] += 1
+                stat["caller"] = profile.n_plus_one[fingerprint]
+
+        if len(self.statements) > MAX_STATEMENTS_PER_ENDPOINT:
+            kept = sorted(self.statements.iteritems(), key=lambda s: s[1]["count"], reverse=True)
+            self.statements = dict(kept[:MAX_STATEMENTS_PER_ENDPOINT])
+
+    def dic(self):
+        statements = sorted(self.statements.iteritems(), key=lambda s: s[1]["count"], reverse=True)
+        return {
+            "endpoint": self.endpoint,
+            "requests": self.requests,
+            "avg_query_count": round(float(self.query_count) / self.requests, 2),
+            "max_query_count": self.max_query_count,
+            "avg_sql_time_ms": round(self.sql_seconds * 1000 / self.requests, 3),
+            "n_plus_one_requests": self.n_plus_one_requests,
+            # statements executed more than once in a request
+            "repeated_statements": [dict(stat, statement=fingerprint) for fingerprint, stat in statements
+                                    if stat["max_per_request"] > 1]
+        }
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(profile_state, "profile", None) is not None:
+        conn.info.setdefault("profiler_start_time", []).append(time.time())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = getattr(profile_state, "profile", None)
+    start_times = conn.info.get("profiler_start_time")
+    if profile is not None and start_times:
+        profile.record(statement, time.time() - start_times.pop())
+
+
+def attach_profiler(engine):
+    """Listen to statements executed by the engine. Only those in profiled requests are recorded"""
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+def start_request_profile():
+    """Start to profile statements executed by current request"""
+    endpoint = "%s %s" % (request.method, request.endpoint) if has_request_context() else None
+    profile_state.profile = RequestProfile(endpoint, safe_get_config("mysql.profiler.n_plus_one_threshold", 5))
+
+
+def finish_request_profile():
+    """Stop profiling current request and add its profile to the stats of endpoint
+
+    :rtype: RequestProfile
+    :return: the profile of request or None if it's not profiled
+    """
+    profile = getattr(profile_state, "profile", None)
+    profile_state.profile = None
+    if profile is None:
+        return None
+
+    if profile.n_plus_one:
+        log.warn("likely N+1 queries in %s: %s" % (profile.endpoint, profile.get_summary()["n_plus_one"]))
+    with endpoint_stats_lock:
+        stats = endpoint_stats.get(profile.endpoint)
+        if stats is None:
+            stats = endpoint_stats[profile.endpoint] = EndpointStats(profile.endpoint)
+        stats.add(profile)
+    return profile
+
+
+def get_sql_profile():
+    """Stats of all endpoints profiled since started or reset, endpoints executing more statements come first
+
+    :rtype: dict
+    """
+    with endpoint_stats_lock:
+        endpoints = [stats.dic() for stats in endpoint_stats.values()]
+    endpoints.sort(key=lambda e: e["avg_query_count"], reverse=True)
+    return {
+        "enabled": is_profiling_enabled(),
+        "endpoints": endpoints
+    }
+
+
+def reset_sql_profile():
+    with endpoint_stats_lock:
+        endpoint_stats.clear()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import time
+import random
+from threading import local
+from functools import wraps
+from collections import OrderedDict
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+from hackathon.util import safe_get_config
+from hackathon.constants import HTTP_HEADER
+
+__all__ = ["RoutingSession", "replica_reads", "primary_reads", "engines", "get_pool_stats", "set_written_header"]
+
+# engine name -> engine, the primary first. See hackathon/database/__init__.py
+engines = OrderedDict()
+
+# routing state of current thread: depth of replica_reads and primary_reads scopes and whether the session has written
+routing_state = local()
+
+
+def written_recently():
+    """Whether the client of current request has written in 'mysql.replicas.sticky_seconds'
+
+    A request that writes responds the time in header HTTP_HEADER.DB_WRITTEN_AT and the client sends it back in later
+    requests, so that the client always sees its own writes however far replicas lag behind, whichever server process
+    handles the request. See set_written_header
+    """
+    written_at = request.headers.get(HTTP_HEADER.DB_WRITTEN_AT)
+    if not written_at:
+        return False
+    try:
+        return time.time() - float(written_at) < safe_get_config("mysql.replicas.sticky_seconds", 5)
+    except ValueError:
+        return False
+
+
+def should_read_replica():
+    """Reads go to replicas in replica_reads scopes of a request, unless the session or the client has written recently
+
+    Threads other than request handlers like scheduled jobs always read primary since they usually read rows just
+    written by others. So do reads in primary_reads scopes like validating login token.
+    """
+    if getattr(routing_state, "replica_depth", 0) <= 0 or getattr(routing_state, "primary_depth", 0) > 0:
+        return False
+    if getattr(routing_state, "written", False) or not has_request_context():
+        return False
+    return not written_recently()
+
+
+def mark_written():
+    routing_state.written = True
+    if has_request_context():
+        g.db_written = True
+
+
+def set_written_header(response):
+    """Tell the client the time of its write if current request has written. See written_recently
+
+    :type response: flask.Response
+    :param response: response of current request
+    """
+    if getattr(g, "db_written", False):
+        response.headers[HTTP_HEADER.DB_WRITTEN_AT] = "%.3f" % time.time()
+    return response
+
+
+class ReplicaReads(object):
+    """Scope in which reads may go to read replicas. Use it as a context manager or a decorator
+
+    Only resources that read and never write should be annotated. Adapter reads elsewhere always go to primary.
+
+    :Example:
+        with replica_reads:
+            hackathons = db.find_all_objects(Hackathon)
+
+        class HackathonListResource(HackathonResource):
+            @replica_reads
+            def get(self):
+                ...
+    """
+
+    def __enter__(self):
+        routing_state.replica_depth = getattr(routing_state, "replica_depth", 0) + 1
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        routing_state.replica_depth -= 1
+        return False
+
+    def __call__(self, func):
+        @wraps(func)
+        def read_replica_and_call(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+
+        return read_replica_and_call
+
+
+replica_reads = ReplicaReads()
+
+
+class PrimaryReads(object):
+    """Scope in which reads always go to primary even inside a replica_reads scope, e.g. validating a login token that
+    was just created. Use it as a context manager or a decorator
+    """
+
+    def __enter__(self):
+        routing_state.primary_depth = getattr(routing_state, "primary_depth", 0) + 1
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        routing_state.primary_depth -= 1
+        return False
+
+    def __call__(self, func):
+        @wraps(func)
+        def read_primary_and_call(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+
+        return read_primary_and_call
+
+
+primary_reads = PrimaryReads()
+
+
+class RoutingSession(Session):
+    """Session that sends reads to a read replica and everything else to primary
+
+    A session sticks to one replica until it's closed so that reads in the same transaction see the same snapshot.
+    """
+
+    def __init__(self, primary=None, replicas=None, **kwargs):
+        # an explicit bind, e.g. by scoped_session.configure, replaces the primary
+        self.primary = kwargs.pop("bind", None) or primary
+        super(RoutingSession, self).__init__(bind=self.primary, **kwargs)
+        self.replicas = replicas or []
+        self.replica = None
+
+    def get_bind(self, mapper=None, clause=None):
+        if isinstance(clause, UpdateBase):
+            mark_written()
+            return self.primary
+
+        if self.replicas and not self._flushing and should_read_replica():
+            if self.replica is None:
+                self.replica = random.choice(self.replicas)
+            return self.replica
+        return self.primary
+
+    def close(self):
+        super(RoutingSession, self).close()
+        self.replica = None
+        routing_state.written = False
+
+
+def get_pool_stats(with_stacks=False):
+    """Return connection pool status of every engine, with stats of its PoolMonitor if any(see pool_monitor.py)
+
+    :type with_stacks: bool
+    :param with_stacks: whether to include stacks of threads holding connections too long, for super admin only
+
+    :rtype: dict
+    :return: engine name -> {"size": 50, "checked_in": 3, "checked_out": 2, "overflow": -45, "checkouts": 100, ...}
+    """
+    stats = {}
+    for name, engine in engines.iteritems():
+        pool = engine.pool
+        stat = {"pool": pool.__class__.__name__}
+        for key, method in [("size", "size"), ("checked_in", "checkedin"), ("checked_out", "checkedout"),
+                            ("overflow", "overflow")]:
+            if hasattr(pool, method):
+                stat[key] = getattr(pool, method)()
+        monitor = getattr(pool, "monitor", None)
+        if monitor:
+            stat.update(monitor.get_stats(with_stacks))
+        stats[name] = stat
+    return stats
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def after_flush(session, flush_context):
+    mark_written()
@@ -26,11 +26,14 @@
 
 from hackathon import RequiredFeature
 from hackathon_response import unauthorized, bad_request, forbidden
+from hackathon.database.routing import replica_reads, primary_reads
 
 __all__ = [
     "token_required",
     "hackathon_name_required",
     "admin_privilege_required",
+    "replica_reads",
+    "primary_reads",
 ]
 
 user_manager = RequiredFeature("user_manager")
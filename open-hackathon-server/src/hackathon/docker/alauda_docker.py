@@ -25,7 +25,6 @@ THE SOFTWARE.
 import sys
 
 sys.path.append("..")
-import requests
 import json
 from datetime import datetime, timedelta
 
@@ -45,6 +44,7 @@ from hackathon.hackathon_exception import (
 )
 from hackathon.template import DOCKER_UNIT
 from hackathon import Component, Context
+from hackathon.http_client import get_http_client
 
 
 class ALAUDA:
@@ -106,7 +106,8 @@ class AlaudaDockerFormation(DockerFormationBase, Component):
     # --------------------------------------private function--------------------------#
     def __schedule_query_service_status(self, context):
         self.log.debug("alauda service '%r' is deploying, will query again 10 seconds later" % context)
-        self.scheduler.add_once("alauda_docker", "query_service_status_async", context=context, seconds=10)
+        self.scheduler.add_once("alauda_docker", "query_service_status_async", context=context, pool="interactive",
+                                seconds=10)
 
     def __service_result_handler(self, service, context):
         if self.__is_service_deploying(service):
@@ -289,7 +290,7 @@ class AlaudaDockerFormation(DockerFormationBase, Component):
 
     def __request(self, method, path, data=None):
         url = self.__get_full_url(path)
-        req = requests.request(method, url, headers=self.__get_headers(), data=data)
+        req = get_http_client(url).request(method, url, headers=self.__get_headers(), data=data)
         if 200 <= req.status_code < 300:
             resp = req.content
             self.log.debug("'%s' response %d from alauda api '%s': %s" % (method, req.status_code, path, resp))
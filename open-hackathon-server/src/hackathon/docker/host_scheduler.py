@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("..")
+import time
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from hackathon import Component, RequiredFeature, Context
+from hackathon.database.models import DockerHostServer
+from hackathon.constants import DockerHostServerStatus, DockerHostServerDisable
+from hackathon.util import safe_get_config
+from hackathon.docker.image_distributor import normalize_image
+
+__all__ = ["DockerHostScheduler", "register_placement_strategy"]
+
+
+def spread(candidates):
+    """Prefer the host that runs fewest containers, so that containers spread over all hosts"""
+    return sorted(candidates, key=lambda c: (c.running, c.host_id))
+
+
+def bin_pack(candidates):
+    """Prefer the fullest host that still fits, so that idle hosts can be released"""
+    return sorted(candidates, key=lambda c: (-c.container_count, c.host_id))
+
+
+def least_loaded(candidates):
+    """Prefer the host with the lowest container usage, then the one with more memory per container"""
+    return sorted(candidates, key=lambda c: (float(c.container_count) / max(c.container_max_count, 1),
+                                             -c.mem_total / (c.running + 1),
+                                             c.host_id))
+
+
+# name -> function that sorts candidate hosts by preference. See register_placement_strategy
+placement_strategies = {
+    "spread": spread,
+    "binpack": bin_pack,
+    "least_loaded": least_loaded
+}
+
+
+def register_placement_strategy(name, strategy):
+    """Register a placement strategy which can be chosen by config 'docker.host_scheduler.strategy'
+
+    :type name: str|unicode
+    :param name: name of the strategy
+
+    :type strategy: function
+    :param strategy: takes a list of Context(host_id, container_count, container_max_count, running, mem_total, cpus)
+        and returns them sorted by preference
+    """
+    placement_strategies[name] = strategy
+
+
+# host id -> Context(alive, probe_time, running, mem_total, cpus, images) of docker hosts probed by this process
+host_statuses = {}
+host_statuses_lock = Lock()
+
+# thread pool to probe docker hosts. Created on first use
+probe_executor = None
+
+
+def get_probe_executor():
+    global probe_executor
+    with host_statuses_lock:
+        if probe_executor is None:
+            probe_executor = ThreadPoolExecutor(max_workers=safe_get_config("docker.host_scheduler.probe_workers", 8))
+        return probe_executor
+
+
+class DockerHostScheduler(Component):
+    """Choose docker host for new containers
+
+    Liveness, load and images of every docker host are kept in memory and refreshed by probe_all() in background, so
+    placing containers never waits for docker hosts. Hosts never probed by this process yet are probed before first
+    use. Hosts that have the images of container already are preferred, so that starting a container doesn't wait for
+    pulling image. The chosen host is reserved by an atomic increment of container_count, so concurrent starts in all
+    processes never exceed container_max_count.
+    """
+    hosted_docker = RequiredFeature("hosted_docker")
+
+    def reserve(self, req_count, hackathon, images=None):
+        """Choose a docker host for req_count containers and reserve capacity for them
+
+        The reservation is released when the containers stop or are deleted, see HostedDockerFormation.
+
+        :type req_count: int
+        :param req_count: the number of containers needed
+
+        :type hackathon: Hackathon
+        :param hackathon: hackathon which the docker host belongs to
+
+        :type images: list
+        :param images: images the containers run. Only hosts that have all of them are chosen unless no such host
+
+        :rtype: DockerHostServer
+        :return the docker host reserved or None if no host available
+        """
+        hosts = self.db.find_all_objects(DockerHostServer,
+                                         DockerHostServer.container_count + req_count <=
+                                         DockerHostServer.container_max_count,
+                                         DockerHostServer.hackathon_id == hackathon.id,
+                                         DockerHostServer.state == DockerHostServerStatus.DOCKER_READY,
+                                         DockerHostServer.disable == DockerHostServerDisable.ABLE)
+        statuses = self.__get_statuses(hosts)
+        candidates = [Context(host_id=h.id,
+                              container_count=h.container_count,
+                              container_max_count=h.container_max_count,
+                              running=statuses[h.id].running if statuses[h.id].running is not None else
+                              h.container_count,
+                              mem_total=statuses[h.id].mem_total or 0,
+                              cpus=statuses[h.id].cpus or 0)
+                      for h in hosts if statuses[h.id].alive]
+        if images:
+            images = set(normalize_image(i) for i in images)
+            ready = [c for c in candidates if images <= (statuses[c.host_id].images or set())]
+            if ready:
+                candidates = ready
+            else:
+                self.log.warn("no docker host of hackathon %d has images %s, containers will wait for pulling" %
+                              (hackathon.id, list(images)))
+
+        strategy_name = safe_get_config("docker.host_scheduler.strategy", "least_loaded")
+        strategy = placement_strategies.get(strategy_name, least_loaded)
+        for candidate in strategy(candidates):
+            reserved = self.db.session().query(DockerHostServer) \
+                .filter(DockerHostServer.id == candidate.host_id,
+                        DockerHostServer.container_count + req_count <= DockerHostServer.container_max_count) \
+                .update({DockerHostServer.container_count: DockerHostServer.container_count + req_count},
+                        synchronize_session=False)
+            self.db.commit()
+            if reserved == 1:
+                self.log.debug("%d containers reserved on docker host %d by strategy %s" %
+                               (req_count, candidate.host_id, strategy_name))
+                return self.db.get_object(DockerHostServer, candidate.host_id)
+
+        self.log.debug("no docker host available for %d containers of hackathon %d" % (req_count, hackathon.id))
+        return None
+
+    def probe_all(self):
+        """Refresh liveness and load of all ready docker hosts in parallel. It's a scheduled job"""
+        hosts = self.db.find_all_objects(DockerHostServer,
+                                         DockerHostServer.state == DockerHostServerStatus.DOCKER_READY,
+                                         DockerHostServer.disable == DockerHostServerDisable.ABLE)
+        self.__probe([(h.id, self.hosted_docker.get_vm_url(h)) for h in hosts], wait_result=True)
+
+    def get_host_images(self, hosts):
+        """Probe hosts at once and return images on them
+
+        :type hosts: list
+        :param hosts: list of DockerHostServer
+
+        :rtype: dict
+        :return host id -> set of image references present, None if the host is not alive
+        """
+        self.__probe([(h.id, self.hosted_docker.get_vm_url(h)) for h in hosts], wait_result=True)
+        return dict((h.id, host_statuses[h.id].images) for h in hosts)
+
+    def add_host_image(self, host_id, image):
+        """Record an image just pulled to docker host before the next probe finds it"""
+        with host_statuses_lock:
+            status = host_statuses.get(host_id)
+            if status is not None and status.images is not None:
+                status.images.add(normalize_image(image))
+
+    def get_host_statuses(self):
+        """Return liveness and load of all docker hosts probed by this process
+
+        :rtype: dict
+        :return dict from host id to dict of status
+        """
+        now = time.time()
+        return dict((host_id, {
+            "alive": s.alive,
+            "seconds_since_probe": round(now - s.probe_time, 1),
+            "running": s.running,
+            "mem_total": s.mem_total,
+            "cpus": s.cpus,
+            "images": len(s.images) if s.images is not None else None
+        }) for host_id, s in host_statuses.items())
+
+    def __get_statuses(self, hosts):
+        """Get status of hosts from memory. Unknown hosts are probed at once, stale ones in background"""
+        max_age = safe_get_config("docker.host_scheduler.status_max_age_seconds", 60)
+        now = time.time()
+        unknown, stale = [], []
+        for h in hosts:
+            status = host_statuses.get(h.id)
+            if status is None:
+                unknown.append((h.id, self.hosted_docker.get_vm_url(h)))
+            elif now - status.probe_time > max_age and not status.probing:
+                stale.append((h.id, self.hosted_docker.get_vm_url(h)))
+
+        self.__probe(unknown, wait_result=True)
+        self.__probe(stale, wait_result=False)
+        return dict((h.id, host_statuses[h.id]) for h in hosts)
+
+    def __probe(self, hosts, wait_result):
+        """Probe hosts in the probe executor
+
+        :type hosts: list
+        :param hosts: list of tuple(host_id, vm_url)
+        """
+        if not hosts:
+            return
+
+        with host_statuses_lock:
+            for host_id, vm_url in hosts:
+                status = host_statuses.get(host_id)
+                if status is not None:
+                    status.probing = True
+
+        futures = [get_probe_executor().submit(self.__probe_one, host_id, vm_url) for host_id, vm_url in hosts]
+        if wait_result:
+            wait(futures)
+
+    def __probe_one(self, host_id, vm_url):
+        """Query /info and images of docker host. It doesn't touch DB so it's safe in any thread"""
+        info = self.hosted_docker.remote_info(vm_url)
+        status = Context(alive=info is not None,
+                         probe_time=time.time(),
+                         probing=False,
+                         running=None,
+                         mem_total=None,
+                         cpus=None,
+                         images=None)
+        if info is not None:
+            status.running = info.get("ContainersRunning", info.get("Containers"))
+            status.mem_total = info.get("MemTotal")
+            status.cpus = info.get("NCPU")
+            status.images = self.hosted_docker.remote_images(vm_url)
+        else:
+            self.log.warn("docker host %d(%s) is not alive" % (host_id, vm_url))
+
+        with host_statuses_lock:
+            host_statuses[host_id] = status
@@ -41,10 +41,16 @@ from hackathon.database.models import (
     DockerHostServer,
 )
 from hackathon.constants import (
-    EStatus,
     PortBindingType,
     VEStatus,
     HEALTH,
+    DockerHostServerStatus,
+)
+from sqlalchemy import (
+    case,
+)
+from sqlalchemy.exc import (
+    IntegrityError,
 )
 from compiler.ast import (
     flatten,
@@ -58,6 +64,9 @@ from hackathon.azureformation.endpoint import (
 from docker_formation_base import (
     DockerFormationBase,
 )
+from port_allocator import (
+    PortAllocator,
+)
 from hackathon.azureformation.service import (
     Service,
 )
@@ -68,10 +77,16 @@ from hackathon.constants import (
     HEALTH_STATUS,
 )
 from hackathon.template import DOCKER_UNIT
+from hackathon.http_client import get_http_client
 import json
-import requests
+import time
+import urllib
 from datetime import timedelta
 
+# docker host server id -> PortAllocator, shared by all instances of HostedDockerFormation in the same process
+port_allocators = {}
+port_allocators_lock = Lock()
+
 
 class HostedDockerFormation(DockerFormationBase, Component):
     hackathon_template_manager = RequiredFeature("hackathon_template_manager")
@@ -81,13 +96,8 @@ class HostedDockerFormation(DockerFormationBase, Component):
     Host resource are required. Azure key required in case of azure.
     """
     application_json = {'content-type': 'application/json'}
-    host_ports = []
-    host_port_max_num = 30
     docker_host_manager = RequiredFeature("docker_host_manager")
 
-    def __init__(self):
-        self.lock = Lock()
-
     def report_health(self):
         """Report health of DockerHostServers
 
@@ -96,7 +106,9 @@ class HostedDockerFormation(DockerFormationBase, Component):
             Error if no server running
         """
         try:
-            hosts = self.db.find_all_objects(DockerHostServer)
+            # requested VMs are not created by Azure yet
+            hosts = self.db.find_all_objects(DockerHostServer,
+                                             DockerHostServer.state != DockerHostServerStatus.REQUESTED)
             alive = 0
             for host in hosts:
                 if self.ping(host):
@@ -122,27 +134,39 @@ class HostedDockerFormation(DockerFormationBase, Component):
             }
 
     def get_available_host_port(self, docker_host, private_port):
+        """Allocate a host port for private port. See allocate_host_ports
+
+        :type docker_host: DockerHostServer
+        :param docker_host: the host where container will run
+
+        :type private_port: int
+        :param private_port: the port exposed by container
+
+        :rtype: int
+        :return the allocated host port
         """
-        We use double operation to ensure ports not conflicted, first we get ports from host machine, but in multiple
-        threads situation, the interval between two requests is too short, maybe the first thread do not get port
-        ended, so the host machine don't update ports in time, thus the second thread may get the same port.
-        To avoid this condition, we use static variable host_ports to cache the latest host_port_max_num ports.
-        Every thread visit variable host_ports is synchronized.
-        To save space, we will release the ports if the number over host_port_max_num.
-        :param docker_host:
-        :param private_port:
-        :return:
-        """
-        self.log.debug("try to assign docker port %d on server %r" % (private_port, docker_host))
-        containers = self.__containers_info(docker_host)
-        host_ports = flatten(map(lambda p: p['Ports'], containers))
+        return self.allocate_host_ports(docker_host, [private_port])[0]
+
+    def allocate_host_ports(self, docker_host, private_ports):
+        """Allocate host ports for all private ports of a container in one operation
+
+        Used ports of each host are kept in a PortAllocator which is seeded from DB table PortBinding and docker host
+        once per 'docker.port_allocator.resync_seconds'. In between, only PortBindings added by other processes are
+        synced from DB. So there is no docker API call in most cases.
+
+        :type docker_host: DockerHostServer
+        :param docker_host: the host where container will run
 
-        # todo if azure return -1
-        def sub(port):
-            return port["PublicPort"] if "PublicPort" in port else -1
+        :type private_ports: list
+        :param private_ports: ports exposed by container
 
-        host_public_ports = map(lambda x: sub(x), host_ports)
-        return self.__get_available_host_port(host_public_ports, private_port)
+        :rtype: list
+        :return host ports in the same order of private_ports
+        """
+        allocator = self.__get_port_allocator(docker_host)
+        host_ports = allocator.allocate(private_ports)
+        self.log.debug("host ports %r allocated for %r on server %r" % (host_ports, private_ports, docker_host))
+        return host_ports
 
     def stop(self, name, **kwargs):
         """
@@ -154,12 +178,60 @@ class HostedDockerFormation(DockerFormationBase, Component):
         container = kwargs["container"]
         expr_id = kwargs["expr_id"]
         docker_host = self.docker_host_manager.get_host_server_by_id(container.host_server_id)
-        if self.__get_container(name, docker_host) is not None:
+        if self.__get_container(name, self.get_vm_url(docker_host)) is not None:
             containers_url = '%s/containers/%s/stop' % (self.get_vm_url(docker_host), name)
-            req = requests.post(containers_url)
+            req = get_http_client(containers_url).post(containers_url)
             self.log.debug(req.content)
         self.__stop_container(expr_id, docker_host)
 
+    def remote_stop(self, vm_url, names):
+        """Stop containers on a docker host by remote API only. It doesn't touch DB so it's safe in any thread
+
+        The containers list of docker host is queried only once no matter how many containers to stop.
+
+        :type vm_url: str|unicode
+        :param vm_url: docker remote API url of the docker host
+
+        :type names: list
+        :param names: names of containers to stop
+
+        :rtype: list
+        :return names of containers that have been stopped or don't exist on docker host any more
+        """
+        existing = set(n.lstrip("/") for c in self.__containers_info(vm_url) for n in c["Names"])
+        stopped = []
+        for name in names:
+            if name in existing:
+                try:
+                    containers_url = '%s/containers/%s/stop' % (vm_url, name)
+                    req = get_http_client(containers_url).post(containers_url)
+                    # 304: container already stopped, 404: no such container
+                    if req.status_code >= 300 and req.status_code not in (304, 404):
+                        self.log.error("fail to stop container %s: %s" % (name, req.content))
+                        continue
+                except Exception as e:
+                    self.log.error("fail to stop container %s" % name)
+                    self.log.error(e)
+                    continue
+            stopped.append(name)
+        return stopped
+
+    def complete_stop(self, docker_host, expr_ids, container_count):
+        """Save the result of remote_stop in batch: release ports of experiments and decrease container count of host
+
+        :type docker_host: DockerHostServer
+        :param docker_host: the docker host where containers stopped
+
+        :type expr_ids: list
+        :param expr_ids: ids of experiments whose containers on docker_host all stopped
+
+        :type container_count: int
+        :param container_count: how many containers stopped on docker_host
+        """
+        self.__release_ports_of_exprs(expr_ids, docker_host)
+        self.__release_container_count(docker_host, container_count)
+        self.db.commit()
+
     def delete(self, name, **kwargs):
         """
         delete a container
@@ -171,7 +243,7 @@ class HostedDockerFormation(DockerFormationBase, Component):
         expr_id = kwargs["expr_id"]
         docker_host = self.docker_host_manager.get_host_server_by_id(container.host_server_id)
         containers_url = '%s/containers/%s?force=1' % (self.get_vm_url(docker_host), name)
-        req = requests.delete(containers_url)
+        req = get_http_client(containers_url).delete(containers_url)
         self.log.debug(req.content)
 
         self.__stop_container(expr_id, docker_host)
@@ -183,96 +255,137 @@ class HostedDockerFormation(DockerFormationBase, Component):
         :param docker_host:
         :return:
         """
+        container, context = self.prepare_start(unit, **kwargs)
+        container_id = self.remote_start(context)
+        return self.complete_start(container, container_id)
+
+    def prepare_start(self, unit, **kwargs):
+        """Do all the DB work before starting a container: choose host, save container, assign ports and guacamole
+
+        It touches the DB session so it must be called in the thread where kwargs are loaded.
+
+        :type unit: DockerTemplateUnit
+        :param unit: docker template unit
+
+        :return tuple of the DockerContainer saved and the Context for remote_start
+        """
         virtual_environment = kwargs["virtual_environment"]
         hackathon = kwargs["hackathon"]
         experiment = kwargs["experiment"]
         container_name = unit.get_name()
-        host_server = self.docker_host_manager.get_available_docker_host(1, hackathon)
-
-        container = DockerContainer(experiment,
-                                    name=container_name,
-                                    host_server_id=host_server.id,
-                                    virtual_environment=virtual_environment,
-                                    image=unit.get_image_with_tag())
-        self.db.add_object(container)
-        self.db.commit()
+        # one container is reserved on the host, see DockerHostScheduler
+        host_server = self.docker_host_manager.get_available_docker_host(1, hackathon,
+                                                                         images=[unit.get_image_with_tag()])
+        if host_server is None:
+            raise Exception("no docker host available for container %s" % container_name)
 
-        # port binding
-        map(lambda p:
-            [p.port_from, p.port_to],
-            self.__assign_ports(experiment, host_server, virtual_environment, unit.get_ports()))
-
-        # guacamole config
-        guacamole = unit.get_remote()
-        port_cfg = filter(lambda p:
-                          p[DOCKER_UNIT.PORTS_PORT] == guacamole[DOCKER_UNIT.REMOTE_PORT],
-                          unit.get_ports())
-        if len(port_cfg) > 0:
-            gc = {
-                "displayname": container_name,
-                "name": container_name,
-                "protocol": guacamole[DOCKER_UNIT.REMOTE_PROTOCOL],
-                "hostname": host_server.public_ip,
-                "port": port_cfg[0].get("public_port")
-            }
-            if DOCKER_UNIT.REMOTE_USERNAME in guacamole:
-                gc["username"] = guacamole[DOCKER_UNIT.REMOTE_USERNAME]
-            if DOCKER_UNIT.REMOTE_PASSWORD in guacamole:
-                gc["password"] = guacamole[DOCKER_UNIT.REMOTE_PASSWORD]
-            # save guacamole config into DB
-            virtual_environment.remote_paras = json.dumps(gc)
-
-        exist = self.__get_container(container_name, host_server)
-        if exist is not None:
-            container.container_id = exist["Id"]
-            host_server.container_count += 1
+        try:
+            container = DockerContainer(experiment,
+                                        name=container_name,
+                                        host_server_id=host_server.id,
+                                        virtual_environment=virtual_environment,
+                                        image=unit.get_image_with_tag())
+            self.db.add_object(container)
             self.db.commit()
-        else:
-            container_config = unit.get_container_config()
-            # create container
-            try:
-                container_create_result = self.__create(host_server, container_config, container_name)
-            except Exception as e:
-                self.log.error(e)
-                self.log.error("container %s fail to create" % container_name)
-                return None
-            container.container_id = container_create_result["Id"]
-            # start container
-            try:
-                self.__start(host_server, container_create_result["Id"])
-                host_server.container_count += 1
-                self.db.commit()
-            except Exception as e:
-                self.log.error(e)
-                self.log.error("container %s fail to start" % container["Id"])
-                return None
-            # check
-            if self.__get_container(container_name, host_server) is None:
-                self.log.error(
-                    "container %s has started, but can not find it in containers' info, maybe it exited again."
-                    % container_name)
-                return None
-
-        self.log.debug("starting container %s is ended ... " % container_name)
-        virtual_environment.status = VEStatus.RUNNING
+
+            # port binding
+            self.__assign_ports(experiment, host_server, virtual_environment, unit.get_ports())
+
+            # guacamole config
+            guacamole = unit.get_remote()
+            port_cfg = filter(lambda p:
+                              p[DOCKER_UNIT.PORTS_PORT] == guacamole[DOCKER_UNIT.REMOTE_PORT],
+                              unit.get_ports())
+            if len(port_cfg) > 0:
+                gc = {
+                    "displayname": container_name,
+                    "name": container_name,
+                    "protocol": guacamole[DOCKER_UNIT.REMOTE_PROTOCOL],
+                    "hostname": host_server.public_ip,
+                    "port": port_cfg[0].get("public_port")
+                }
+                if DOCKER_UNIT.REMOTE_USERNAME in guacamole:
+                    gc["username"] = guacamole[DOCKER_UNIT.REMOTE_USERNAME]
+                if DOCKER_UNIT.REMOTE_PASSWORD in guacamole:
+                    gc["password"] = guacamole[DOCKER_UNIT.REMOTE_PASSWORD]
+                # save guacamole config into DB
+                virtual_environment.remote_paras = json.dumps(gc)
+            self.db.commit()
+        except Exception:
+            self.log.error("fail to prepare container %s, release its reservation on server %r" %
+                           (container_name, host_server))
+            self.__release_prepared(virtual_environment, host_server)
+            raise
+
+        context = Context(container_name=container_name,
+                          vm_url=self.get_vm_url(host_server),
+                          container_config=unit.get_container_config())
+        return container, context
+
+    def remote_start(self, context):
+        """Create and start the container on docker host, or reuse the existing one with the same name
+
+        Only docker remote API is called and nothing touches DB, so it's safe to run in any thread.
+
+        :type context: Context
+        :param context: the context returned by prepare_start
+
+        :rtype: str|unicode
+        :return id of the container on docker host or None if fail to start
+        """
+        container_name, vm_url = context.container_name, context.vm_url
+        exist = self.__get_container(container_name, vm_url)
+        if exist is not None:
+            return exist["Id"]
+
+        # create container
+        try:
+            container_create_result = self.__create(vm_url, context.container_config, container_name)
+        except Exception as e:
+            self.log.error(e)
+            self.log.error("container %s fail to create" % container_name)
+            return None
+        # start container
+        try:
+            self.__start(vm_url, container_create_result["Id"])
+        except Exception as e:
+            self.log.error(e)
+            self.log.error("container %s fail to start" % container_name)
+            return None
+        # check
+        if self.__get_container(container_name, vm_url) is None:
+            self.log.error(
+                "container %s has started, but can not find it in containers' info, maybe it exited again."
+                % container_name)
+            return None
+
+        return container_create_result["Id"]
+
+    def complete_start(self, container, container_id):
+        """Save the result of remote_start. It must be called in the same thread of prepare_start
+
+        :type container: DockerContainer
+        :param container: the container returned by prepare_start
+
+        :type container_id: str|unicode
+        :param container_id: id of container on docker host returned by remote_start
+
+        :rtype: DockerContainer
+        :return the container or None if it failed to start
+        """
+        if container_id is None:
+            return None
+
+        # container_count of host has been increased when it's reserved in prepare_start
+        container.container_id = container_id
+        container.virtual_environment.status = VEStatus.RUNNING
         self.db.commit()
+        self.log.debug("starting container %s is ended ... " % container.name)
         return container
 
     def get_vm_url(self, docker_host):
         return 'http://%s:%d' % (docker_host.public_dns, docker_host.public_docker_api_port)
 
-    def pull_image(self, context):
-        docker_host, image_name, tag = context.docker_host, context.image_name, context.tag
-        pull_image_url = self.get_vm_url(docker_host) + "/images/create?fromImage=" + image_name + '&tag=' + tag
-        self.log.debug(" send request to pull image:" + pull_image_url)
-        return requests.post(pull_image_url)
-
-    def get_pulled_images(self, docker_host):
-        get_images_url = self.get_vm_url(docker_host) + "/images/json?all=0"
-        current_images_info = json.loads(requests.get(get_images_url).content)  # [{},{},{}]
-        current_images_tags = map(lambda x: x['RepoTags'], current_images_info)  # [[],[],[]]
-        return flatten(current_images_tags)  # [ imange:tag, image:tag ]
-
     def ensure_images(self):
         hackathons = self.hackathon_manager.get_online_hackathons()
         map(lambda h: self.__ensure_images_for_hackathon(h), hackathons)
@@ -298,6 +411,78 @@ class HostedDockerFormation(DockerFormationBase, Component):
         else:
             return False
 
+    def remote_info(self, vm_url):
+        """Query system-wide information of docker host by remote API. It doesn't touch DB so it's safe in any thread
+
+        :type vm_url: str|unicode
+        :param vm_url: docker remote API url of the docker host
+
+        :rtype: dict
+        :return the response of docker API '/info' or None if docker host is not alive
+        """
+        try:
+            info_url = '%s/info' % vm_url
+            req = get_http_client(info_url).get(info_url)
+            if req.status_code == 200:
+                return json.loads(req.content)
+            self.log.debug("fail to get info of docker %s: %s" % (vm_url, req.content))
+        except Exception as e:
+            self.log.error(e)
+        return None
+
+    def remote_images(self, vm_url):
+        """List images on docker host by remote API. It doesn't touch DB so it's safe in any thread
+
+        :type vm_url: str|unicode
+        :param vm_url: docker remote API url of the docker host
+
+        :rtype: set
+        :return references of all images present, both 'repository:tag' and 'repository@digest'. None if docker host
+                 is not alive
+        """
+        try:
+            images_url = '%s/images/json?all=0' % vm_url
+            req = get_http_client(images_url).get(images_url)
+            if req.status_code == 200:
+                references = set()
+                for image in json.loads(req.content):
+                    references.update(image.get("RepoTags") or [])
+                    references.update(image.get("RepoDigests") or [])
+                return set(r for r in references if not r.startswith("<none>"))
+            self.log.debug("fail to list images of docker %s: %s" % (vm_url, req.content))
+        except Exception as e:
+            self.log.error(e)
+        return None
+
+    def remote_pull_image(self, vm_url, repository, tag, on_progress=None):
+        """Pull image to docker host by remote API and return after the pull finishes. Safe in any thread
+
+        :type repository: str|unicode
+        :param repository: repository of image
+
+        :type tag: str|unicode
+        :param tag: tag or digest of image
+
+        :type on_progress: function
+        :param on_progress: called with every progress message(dict) docker reports
+
+        :raise Exception if docker fails to pull the image
+        """
+        pull_url = '%s/images/create?fromImage=%s&tag=%s' % (vm_url, urllib.quote(repository), urllib.quote(tag))
+        timeout = self.util.safe_get_config("docker.pull_image_timeout_seconds", 1800)
+        req = get_http_client(pull_url).post(pull_url, stream=True, timeout=timeout)
+        if req.status_code != 200:
+            raise Exception("fail to pull image %s:%s on %s: %s" % (repository, tag, vm_url, req.content))
+        # docker streams progress as json objects until the pull ends, and an error message if it fails
+        for line in req.iter_lines():
+            if not line:
+                continue
+            message = json.loads(line)
+            if "error" in message:
+                raise Exception("fail to pull image %s:%s on %s: %s" % (repository, tag, vm_url, message["error"]))
+            if on_progress:
+                on_progress(message)
+
     def ping(self, docker_host):
         """Ping docker host to check running status
 
@@ -310,7 +495,7 @@ class HostedDockerFormation(DockerFormationBase, Component):
         """
         try:
             ping_url = '%s/_ping' % self.__get_vm_url(docker_host)
-            req = requests.get(ping_url)
+            req = get_http_client(ping_url).get(ping_url)
             self.log.debug(req.content)
             return req.status_code == 200 and req.content == 'OK'
         except Exception as e:
@@ -338,93 +523,134 @@ class HostedDockerFormation(DockerFormationBase, Component):
                                     id=self.__get_schedule_job_id(hackathon),
                                     context=context,
                                     next_run_time=next_run_time,
+                                    pool="maintenance",
                                     minutes=60)
 
     def __get_vm_url(self, docker_host):
         return 'http://%s:%d' % (docker_host.public_dns, docker_host.public_docker_api_port)
 
-    def __clear_ports_cache(self):
-        """
-        cache ports, if ports' number more than host_port_max_num, release the ports.
-        But if there is a thread apply new ports, we will do this operation in the next loop.
-        Because the host machine do not update the ports information,
-        if we release ports now, the new ports will be lost.
-        :return:
+    def __release_prepared(self, ve, docker_host):
+        """Undo what prepare_start did for a container before it failed: port bindings, container and reservation
+
+        The rollback of experiment releases only containers saved, so nothing of the failed container is left for it.
+        Errors are logged only so that the caller re-raises the original one.
         """
-        num = self.db.count(Experiment, Experiment.status == EStatus.STARTING)
-        if num > 0:
-            self.log.debug("there are %d experiment is starting, host ports will updated in next loop" % num)
-            return
-        self.log.debug("-----release ports cache successfully------")
-        self.host_ports = []
+        try:
+            if not self.db.in_transaction():
+                # a failed commit leaves the session unusable. Inside a transaction scope it's rolled back already
+                self.db.rollback()
+            session = self.db.session()
+            bindings = session.query(PortBinding).filter(PortBinding.virtual_environment_id == ve.id).all()
+            if bindings:
+                public_ports = [b.port_to for b in bindings if b.binding_type == PortBindingType.CLOUD_SERVICE]
+                if public_ports and self.util.safe_get_config("environment", "prod") != "local":
+                    self.__release_public_ports(ve.experiment_id, docker_host, public_ports)
+                allocator = port_allocators.get(docker_host.id)
+                if allocator is not None:
+                    allocator.release([b.port_from for b in bindings if b.binding_type == PortBindingType.DOCKER])
+                session.query(PortBinding).filter(PortBinding.virtual_environment_id == ve.id) \
+                    .delete(synchronize_session=False)
+            session.query(DockerContainer).filter(DockerContainer.virtual_environment_id == ve.id) \
+                .delete(synchronize_session=False)
+            self.__release_container_count(docker_host, 1)
+            self.db.commit()
+        except Exception as e:
+            self.log.error("fail to release the container reserved on server %r" % docker_host)
+            self.log.error(e)
+            if not self.db.in_transaction():
+                self.db.rollback()
+
+    def __get_port_allocator(self, docker_host):
+        """Get the PortAllocator of docker host, seed or sync it from DB if necessary"""
+        with port_allocators_lock:
+            allocator = port_allocators.get(docker_host.id)
+            if allocator is None:
+                allocator = PortAllocator(pending_seconds=self.util.safe_get_config(
+                    "docker.port_allocator.pending_seconds", 300))
+                port_allocators[docker_host.id] = allocator
+
+        resync_seconds = self.util.safe_get_config("docker.port_allocator.resync_seconds", 600)
+        if allocator.seed_time is None or time.time() - allocator.seed_time > resync_seconds:
+            self.__seed_port_allocator(allocator, docker_host)
+        else:
+            bindings = self.__query_docker_port_bindings(docker_host, allocator.synced_binding_id)
+            if bindings:
+                allocator.mark_used([b.port_from for b in bindings], max(b.id for b in bindings))
+        return allocator
+
+    def __seed_port_allocator(self, allocator, docker_host):
+        bindings = self.__query_docker_port_bindings(docker_host)
+        used_ports = [b.port_from for b in bindings]
+
+        containers = self.__containers_info(self.get_vm_url(docker_host))
+        used_ports += [p["PublicPort"] for p in flatten(map(lambda c: c['Ports'], containers)) if "PublicPort" in p]
+
+        allocator.seed(used_ports, max([b.id for b in bindings] or [0]))
+        self.log.debug("port allocator of server %r seeded with %d used ports" % (docker_host, len(used_ports)))
+
+    def __query_docker_port_bindings(self, docker_host, after_id=0):
+        """Query id and host port of docker PortBindings on docker host which id is greater than after_id"""
+        return self.db.session().query(PortBinding.id, PortBinding.port_from) \
+            .filter(PortBinding.binding_type == PortBindingType.DOCKER,
+                    PortBinding.binding_resource_id == docker_host.id,
+                    PortBinding.id > after_id).all()
 
     def __stop_container(self, expr_id, docker_host):
         self.__release_ports(expr_id, docker_host)
-        docker_host.container_count -= 1
-        if docker_host.container_count < 0:
-            docker_host.container_count = 0
+        self.__release_container_count(docker_host, 1)
         self.db.commit()
 
-    def __containers_info(self, docker_host):
-        containers_url = '%s/containers/json' % self.get_vm_url(docker_host)
-        req = requests.get(containers_url)
+    def __release_container_count(self, docker_host, count):
+        """Decrease container count of host by an atomic UPDATE
+
+        A read-modify-write in python would overwrite reservations made by DockerHostScheduler.reserve concurrently
+        """
+        session = self.db.session()
+        session.query(DockerHostServer).filter(DockerHostServer.id == docker_host.id).update(
+            {DockerHostServer.container_count: case([(DockerHostServer.container_count > count,
+                                                      DockerHostServer.container_count - count)],
+                                                    else_=0)},
+            synchronize_session=False)
+        if docker_host in session:
+            # reload on next access instead of serving the count read before update
+            session.expire(docker_host, ["container_count"])
+
+    def __containers_info(self, vm_url):
+        containers_url = '%s/containers/json' % vm_url
+        req = get_http_client(containers_url).get(containers_url)
         self.log.debug(req.content)
         return self.util.convert(json.loads(req.content))
 
-    def __get_available_host_port(self, port_bindings, port):
-        """
-        simple lock mechanism, visit static variable ports synchronize, because port_bindings is not in real-time,
-        so we should cache the latest ports, when the cache ports number is more than host_port_max_num,
-        we will release it to save space.
-        :param port_bindings:
-        :param port:
-        :return:
-        """
-        self.lock.acquire()
-        try:
-            host_port = port + 10000
-            while host_port in port_bindings or host_port in self.host_ports:
-                host_port += 1
-            if host_port >= 65535:
-                self.log.error("port used up on this host server")
-                raise Exception("no port available")
-            if len(self.host_ports) >= self.host_port_max_num:
-                self.__clear_ports_cache()
-            self.host_ports.append(host_port)
-            self.log.debug("host_port is %d " % host_port)
-            return host_port
-        finally:
-            self.lock.release()
-
-    def __get_container(self, name, docker_host):
-        containers = self.__containers_info(docker_host)
+    def __get_container(self, name, vm_url):
+        containers = self.__containers_info(vm_url)
         return next((c for c in containers if name in c["Names"] or '/' + name in c["Names"]), None)
 
-    def __create(self, docker_host, container_config, container_name):
+    def __create(self, vm_url, container_config, container_name):
         """
         only create a container, in this step, we cannot start a container.
-        :param docker_host:
+        :param vm_url:
         :param container_config:
         :param container_name:
         :return:
         """
-        containers_url = '%s/containers/create?name=%s' % (self.get_vm_url(docker_host), container_name)
-        req = requests.post(containers_url, data=json.dumps(container_config), headers=self.application_json)
+        containers_url = '%s/containers/create?name=%s' % (vm_url, container_name)
+        req = get_http_client(containers_url).post(containers_url, data=json.dumps(container_config),
+                                                  headers=self.application_json)
         self.log.debug(req.content)
         container = json.loads(req.content)
         if container is None:
             raise AssertionError("container is none")
         return container
 
-    def __start(self, docker_host, container_id):
+    def __start(self, vm_url, container_id):
         """
         start a container
-        :param docker_host:
+        :param vm_url:
         :param container_id:
         :return:
         """
-        url = '%s/containers/%s/start' % (self.get_vm_url(docker_host), container_id)
-        req = requests.post(url, headers=self.application_json)
+        url = '%s/containers/%s/start' % (vm_url, container_id)
+        req = get_http_client(url).post(url, headers=self.application_json)
         self.log.debug(req.content)
 
     def __get_available_public_ports(self, expr_id, host_server, host_ports):
@@ -453,13 +679,8 @@ class HostedDockerFormation(DockerFormationBase, Component):
         :param port_cfg:
         :return:
         """
-        # get 'host_port'
-        map(lambda p:
-            p.update(
-                {DOCKER_UNIT.PORTS_HOST_PORT: self.get_available_host_port(host_server, p[
-                    DOCKER_UNIT.PORTS_PORT])}
-            ),
-            port_cfg)
+        # get 'host_port' and save docker port bindings
+        binding_dockers = self.__add_docker_port_bindings(expr, host_server, ve, port_cfg)
 
         # get 'public' cfg
         public_ports_cfg = filter(lambda p: DOCKER_UNIT.PORTS_PUBLIC in p, port_cfg)
@@ -472,8 +693,6 @@ class HostedDockerFormation(DockerFormationBase, Component):
             for i in range(len(public_ports_cfg)):
                 public_ports_cfg[i][DOCKER_UNIT.PORTS_PUBLIC_PORT] = public_ports[i]
 
-        binding_dockers = []
-
         # update port binding
         for public_cfg in public_ports_cfg:
             binding_cloud_service = PortBinding(name=public_cfg[DOCKER_UNIT.PORTS_NAME],
@@ -485,49 +704,81 @@ class HostedDockerFormation(DockerFormationBase, Component):
                                                 experiment=expr,
                                                 url=public_cfg[DOCKER_UNIT.PORTS_URL]
                                                 if DOCKER_UNIT.PORTS_URL in public_cfg else None)
-            binding_docker = PortBinding(name=public_cfg[DOCKER_UNIT.PORTS_NAME],
-                                         port_from=public_cfg[DOCKER_UNIT.PORTS_HOST_PORT],
-                                         port_to=public_cfg[DOCKER_UNIT.PORTS_PORT],
-                                         binding_type=PortBindingType.DOCKER,
-                                         binding_resource_id=host_server.id,
-                                         virtual_environment=ve,
-                                         experiment=expr)
-            binding_dockers.append(binding_docker)
             self.db.add_object(binding_cloud_service)
-            self.db.add_object(binding_docker)
-        self.db.commit()
-
-        local_ports_cfg = filter(lambda p: DOCKER_UNIT.PORTS_PUBLIC not in p, port_cfg)
-        for local_cfg in local_ports_cfg:
-            port_binding = PortBinding(name=local_cfg[DOCKER_UNIT.PORTS_NAME],
-                                       port_from=local_cfg[DOCKER_UNIT.PORTS_HOST_PORT],
-                                       port_to=local_cfg[DOCKER_UNIT.PORTS_PORT],
-                                       binding_type=PortBindingType.DOCKER,
-                                       binding_resource_id=host_server.id,
-                                       virtual_environment=ve,
-                                       experiment=expr)
-            binding_dockers.append(port_binding)
-            self.db.add_object(port_binding)
         self.db.commit()
         return binding_dockers
 
+    def __add_docker_port_bindings(self, expr, host_server, ve, port_cfg):
+        """Allocate host ports and save them as docker PortBindings
+
+        PortBinding is unique on (binding_type, binding_resource_id, port_from). The port allocator syncs PortBindings
+        of other processes by id, so it misses a binding with lower id that is committed late and may allocate the
+        same port again. Then the insert conflicts, all used ports of the host are reloaded from DB and the ports are
+        allocated again.
+
+        :rtype: list
+        :return the docker PortBindings saved
+        """
+        retries = self.util.safe_get_config("docker.port_allocator.conflict_retries", 3)
+        session = self.db.session()
+        for attempt in range(retries + 1):
+            host_ports = self.allocate_host_ports(host_server, [p[DOCKER_UNIT.PORTS_PORT] for p in port_cfg])
+            binding_dockers = []
+            try:
+                # bindings join the session once related to expr, so create them in the savepoint
+                with session.begin_nested():
+                    for p, host_port in zip(port_cfg, host_ports):
+                        binding_dockers.append(PortBinding(name=p[DOCKER_UNIT.PORTS_NAME],
+                                                           port_from=host_port,
+                                                           port_to=p[DOCKER_UNIT.PORTS_PORT],
+                                                           binding_type=PortBindingType.DOCKER,
+                                                           binding_resource_id=host_server.id,
+                                                           virtual_environment=ve,
+                                                           experiment=expr))
+                    session.add_all(binding_dockers)
+            except IntegrityError:
+                self.log.warn("host ports %r on server %r conflict with another process, attempt %d" %
+                              (host_ports, host_server, attempt + 1))
+                allocator = self.__get_port_allocator(host_server)
+                allocator.release(host_ports)
+                allocator.mark_used([b.port_from for b in self.__query_docker_port_bindings(host_server)])
+                continue
+
+            for p, host_port in zip(port_cfg, host_ports):
+                p[DOCKER_UNIT.PORTS_HOST_PORT] = host_port
+            self.db.commit()
+            return binding_dockers
+
+        raise Exception("fail to allocate host ports on server %r after %d conflicts" % (host_server, retries + 1))
+
     def __release_ports(self, expr_id, host_server):
         """
         release the specified experiment's ports
         """
-        self.log.debug("Begin to release ports: expr_id: %d, host_server: %r" % (expr_id, host_server))
-        ports_binding = self.db.find_all_objects_by(PortBinding, experiment_id=expr_id)
-        if ports_binding is not None:
-            docker_binding = filter(
-                lambda u: self.util.safe_get_config("environment", "prod") != "local" and u.binding_type == 1,
-                ports_binding)
-            ports_to = [d.port_to for d in docker_binding]
-            if len(ports_to) != 0:
-                self.__release_public_ports(expr_id, host_server, ports_to)
-            for port in ports_binding:
-                self.db.delete_object(port)
+        self.__release_ports_of_exprs([expr_id], host_server)
+
+    def __release_ports_of_exprs(self, expr_ids, host_server):
+        """
+        release the ports of all specified experiments on a docker host in one batch
+        """
+        self.log.debug("Begin to release ports: expr_ids: %r, host_server: %r" % (expr_ids, host_server))
+        ports_binding = self.db.find_all_objects(PortBinding, PortBinding.experiment_id.in_(expr_ids))
+        if ports_binding:
+            if self.util.safe_get_config("environment", "prod") != "local":
+                public_ports = {}
+                for p in ports_binding:
+                    if p.binding_type == PortBindingType.CLOUD_SERVICE:
+                        public_ports.setdefault(p.experiment_id, []).append(p.port_to)
+                for expr_id, ports_to in public_ports.iteritems():
+                    self.__release_public_ports(expr_id, host_server, ports_to)
+
+            allocator = port_allocators.get(host_server.id)
+            if allocator is not None:
+                allocator.release([p.port_from for p in ports_binding if p.binding_type == PortBindingType.DOCKER])
+            self.db.session().query(PortBinding).filter(PortBinding.experiment_id.in_(expr_ids)) \
+                .delete(synchronize_session=False)
             self.db.commit()
-        self.log.debug("End to release ports: expr_id: %d, host_server: %r" % (expr_id, host_server))
+        self.log.debug("End to release ports: expr_ids: %r, host_server: %r" % (expr_ids, host_server))
 
     def __release_public_ports(self, expr_id, host_server, host_ports):
         ep = Endpoint(Service(self.load_azure_key_id(expr_id)))
@@ -548,8 +799,8 @@ class HostedDockerFormation(DockerFormationBase, Component):
         :return dic object of the container info if not None
         """
         try:
-            get_container_url = self.get_vm_url(docker_host) + "/container/%s/json?all=0" % container_id
-            req = requests.get(get_container_url)
+            get_container_url = self.get_vm_url(docker_host) + "/containers/%s/json?all=0" % container_id
+            req = get_http_client(get_container_url).get(get_container_url)
             if 300 > req.status_code >= 200:
                 container_info = json.loads(req.content)
                 return container_info
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("..")
+import time
+from collections import deque
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+from hackathon import Component, RequiredFeature, Context
+from hackathon.database.models import DockerHostServer
+from hackathon.constants import DockerHostServerStatus, DockerHostServerDisable
+from hackathon.util import safe_get_config
+
+__all__ = ["ImageDistributor", "normalize_image", "split_image"]
+
+# status of pulls
+PULL_QUEUED = "queued"
+PULL_PULLING = "pulling"
+PULL_DONE = "done"
+PULL_FAILED = "failed"
+
+# status of layer in docker pull progress that means the layer is on the host
+LAYER_DONE_STATUSES = ["Pull complete", "Already exists"]
+
+
+def split_image(image):
+    """Split image reference into repository and tag(or digest)
+
+    :Example:
+        split_image("ubuntu") # ("ubuntu", "latest")
+        split_image("registry:5000/ubuntu:14.04") # ("registry:5000/ubuntu", "14.04")
+        split_image("ubuntu@sha256:45b2") # ("ubuntu", "sha256:45b2")
+    """
+    if "@" in image:
+        return tuple(image.split("@", 1))
+    slash = image.rfind("/")
+    colon = image.rfind(":")
+    if colon > slash:
+        return image[:colon], image[colon + 1:]
+    return image, "latest"
+
+
+def normalize_image(image):
+    """Return image reference as docker lists it: 'repository:tag' or 'repository@digest'"""
+    repository, tag = split_image(image)
+    return "%s%s%s" % (repository, "@" if "@" in image else ":", tag)
+
+
+# (host id, image) -> Context of the latest pull of image to host in this process
+pull_states = {}
+# host id -> deque of pulls waiting for a free slot of the host
+host_queues = {}
+# host id -> count of pulls running on the host
+host_active_counts = {}
+pull_lock = Lock()
+
+# thread pool to pull images. Created on first use
+pull_executor = None
+
+
+def get_pull_executor():
+    global pull_executor
+    with pull_lock:
+        if pull_executor is None:
+            pull_executor = ThreadPoolExecutor(max_workers=safe_get_config("docker.image_pull.max_workers", 8))
+        return pull_executor
+
+
+class ImageDistributor(Component):
+    """Pull images of docker templates to all docker hosts of hackathon ahead of containers starting
+
+    Images present on every host are listed in parallel(see DockerHostScheduler.get_host_images), and only the missing
+    ones are pulled. Pulls to different hosts run concurrently while every host runs at most 'per_host_concurrency'
+    pulls at a time so that the host's disk and network aren't saturated. A pull already queued or running is never
+    queued again. Progress and duration of every pull are kept for reporting.
+
+    A host is ready for a template only when all images of the template are present on it. DockerHostScheduler
+    prefers such hosts to start containers.
+    """
+    hosted_docker = RequiredFeature("hosted_docker")
+    docker_host_scheduler = RequiredFeature("docker_host_scheduler")
+    hackathon_template_manager = RequiredFeature("hackathon_template_manager")
+
+    def distribute(self, hackathon_id):
+        """Pull missing images of all docker templates of hackathon to its docker hosts
+
+        It returns once pulls are queued, pulls run in background.
+
+        :type hackathon_id: int
+        :param hackathon_id: id of hackathon
+
+        :rtype: int
+        :return count of pulls queued
+        """
+        # it's a background job, so wait for templates still being downloaded
+        timeout = safe_get_config("template.compiled_cache.load_timeout_seconds", 60)
+        template_images = self.hackathon_template_manager.get_template_images(hackathon_id, timeout)
+        expected = set(normalize_image(i) for images in template_images.values() for i in images)
+        if not expected:
+            return 0
+
+        hosts = self.__get_hosts(hackathon_id)
+        host_images = self.docker_host_scheduler.get_host_images(hosts)
+        queued = 0
+        for host in hosts:
+            present = host_images.get(host.id)
+            if present is None:
+                self.log.warn("skip pulling images to docker host %d since it's not alive" % host.id)
+                continue
+            for image in sorted(expected - present):
+                if self.__queue_pull(host.id, self.hosted_docker.get_vm_url(host), image):
+                    queued += 1
+        self.log.debug("%d image pulls queued for hackathon %d" % (queued, hackathon_id))
+        return queued
+
+    def get_template_readiness(self, hackathon_id):
+        """Return which templates every docker host of hackathon is ready for. Hosts are probed at once
+
+        It's for API GET /api/admin/template/readiness. Templates still being downloaded are not included.
+
+        :rtype: list
+        :return list of dict including host id, ids of templates ready and missing images of the other templates
+        """
+        template_images = self.hackathon_template_manager.get_template_images(hackathon_id)
+        hosts = self.__get_hosts(hackathon_id)
+        host_images = self.docker_host_scheduler.get_host_images(hosts)
+        readiness = []
+        for host in hosts:
+            present = host_images.get(host.id)
+            ready, missing = [], {}
+            for template_id, images in template_images.iteritems():
+                lack = sorted(set(normalize_image(i) for i in images) - (present or set()))
+                if lack:
+                    missing[template_id] = lack
+                else:
+                    ready.append(template_id)
+            readiness.append({
+                "host_id": host.id,
+                "alive": present is not None,
+                "ready_templates": ready,
+                "missing_images": missing
+            })
+        return readiness
+
+    def get_pull_stats(self):
+        """Return progress of pulls in this process
+
+        :rtype: list
+        :return list of dict including host id, image, status, layers, layers done, bytes downloaded, queued seconds,
+                 duration and error
+        """
+        now = time.time()
+        with pull_lock:
+            states = pull_states.values()
+        stats = []
+        for s in states:
+            layers = s.layers.values()
+            stats.append({
+                "host_id": s.host_id,
+                "image": s.image,
+                "status": s.status,
+                "layers": len(layers),
+                "layers_done": len(filter(lambda l: l["status"] in LAYER_DONE_STATUSES, layers)),
+                "bytes_current": sum(l["current"] for l in layers),
+                "bytes_total": sum(l["total"] for l in layers),
+                "queued_seconds": round((s.start_time or now) - s.queue_time, 1),
+                "duration_seconds": round((s.end_time or now) - s.start_time, 1) if s.start_time else None,
+                "error": s.error
+            })
+        return stats
+
+    # ---------------------------------------- helpers ---------------------------------------- #
+
+    def __get_hosts(self, hackathon_id):
+        return self.db.find_all_objects(DockerHostServer,
+                                        DockerHostServer.hackathon_id == hackathon_id,
+                                        DockerHostServer.state == DockerHostServerStatus.DOCKER_READY,
+                                        DockerHostServer.disable == DockerHostServerDisable.ABLE)
+
+    def __queue_pull(self, host_id, vm_url, image):
+        """Queue a pull unless the same one is queued or running. Return True if queued"""
+        with pull_lock:
+            state = pull_states.get((host_id, image))
+            if state is not None and state.status in [PULL_QUEUED, PULL_PULLING]:
+                return False
+            state = Context(host_id=host_id,
+                            image=image,
+                            status=PULL_QUEUED,
+                            queue_time=time.time(),
+                            start_time=None,
+                            end_time=None,
+                            layers={},
+                            error=None)
+            pull_states[(host_id, image)] = state
+            host_queues.setdefault(host_id, deque()).append((vm_url, state))
+        self.__start_pulls(host_id)
+        return True
+
+    def __start_pulls(self, host_id):
+        """Start queued pulls of host as long as it has free slots"""
+        per_host = safe_get_config("docker.image_pull.per_host_concurrency", 2)
+        to_start = []
+        with pull_lock:
+            queue = host_queues.get(host_id)
+            while queue and host_active_counts.get(host_id, 0) < per_host:
+                to_start.append(queue.popleft())
+                host_active_counts[host_id] = host_active_counts.get(host_id, 0) + 1
+
+        for vm_url, state in to_start:
+            get_pull_executor().submit(self.__pull, vm_url, state)
+
+    def __pull(self, vm_url, state):
+        """Pull image to host. It doesn't touch DB so it's safe in any thread"""
+        state.status = PULL_PULLING
+        state.start_time = time.time()
+        try:
+            repository, tag = split_image(state.image)
+            self.hosted_docker.remote_pull_image(vm_url, repository, tag,
+                                                 on_progress=lambda message: self.__on_progress(state, message))
+            state.status = PULL_DONE
+            self.docker_host_scheduler.add_host_image(state.host_id, state.image)
+        except Exception as e:
+            self.log.error(e)
+            state.status = PULL_FAILED
+            state.error = str(e)
+        finally:
+            state.end_time = time.time()
+            self.log.debug("pull of %s to docker host %d %s in %.1f seconds" % (
+                state.image, state.host_id, state.status, state.end_time - state.start_time))
+            with pull_lock:
+                host_active_counts[state.host_id] -= 1
+            self.__start_pulls(state.host_id)
+
+    def __on_progress(self, state, message):
+        layer_id = message.get("id")
+        if not layer_id or layer_id == split_image(state.image)[1]:
+            # not about a layer, e.g. "Pulling from library/ubuntu" or the digest summary
+            return
+        detail = message.get("progressDetail") or {}
+        layer = state.layers.setdefault(layer_id, {"status": None, "current": 0, "total": 0})
+        layer["status"] = message.get("status")
+        if detail.get("total"):
+            layer["current"] = detail.get("current", 0)
+            layer["total"] = detail["total"]
+        elif layer["status"] in LAYER_DONE_STATUSES:
+            layer["current"] = layer["total"]
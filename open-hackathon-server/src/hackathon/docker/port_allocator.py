@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("..")
+import time
+from threading import Lock
+
+__all__ = ["PortAllocator"]
+
+
+class PortAllocator(object):
+    """Allocate host ports of a single docker host
+
+    Used ports are kept in a bitmap so allocating is a scan in memory instead of listing containers on docker host. The
+    bitmap is seeded from DB and docker host by the caller(see HostedDockerFormation) and all ports of a unit are
+    allocated in one locked operation.
+
+    Ports allocated but not seen in DB or docker host yet are 'pending'. They survive a re-seed for pending_seconds so
+    that a container being started won't lose its ports.
+
+    :Example:
+        allocator = PortAllocator()
+        allocator.seed([10022, 18080])
+        allocator.allocate([22, 8080])  # [10023, 18081]
+        allocator.release([10023, 18081])
+    """
+
+    def __init__(self, port_min=10000, port_max=65535, pending_seconds=300):
+        """
+        :type port_min: int
+        :param port_min: the minimum host port to allocate
+
+        :type port_max: int
+        :param port_max: the maximum host port to allocate(exclusive)
+
+        :type pending_seconds: int
+        :param pending_seconds: how long a newly allocated port is kept in use even if the seed doesn't include it
+        """
+        self.port_min = port_min
+        self.port_max = port_max
+        self.pending_seconds = pending_seconds
+        self.seed_time = None
+        self.synced_binding_id = 0
+        self.__lock = Lock()
+        self.__used = bytearray(port_max)
+        self.__pending = {}  # host port -> allocated time
+
+    def seed(self, used_ports, synced_binding_id=0):
+        """Replace all used ports. Ports allocated in recent pending_seconds are kept
+
+        :type used_ports: list
+        :param used_ports: host ports used according to DB and docker host
+
+        :type synced_binding_id: int
+        :param synced_binding_id: the max id of PortBinding that used_ports include
+        """
+        now = time.time()
+        with self.__lock:
+            self.__pending = dict((p, t) for p, t in self.__pending.iteritems() if now - t < self.pending_seconds)
+            self.__used = bytearray(self.port_max)
+            self.__mark(used_ports)
+            self.__mark(self.__pending.keys())
+            self.seed_time = now
+            self.synced_binding_id = synced_binding_id
+
+    def mark_used(self, ports, synced_binding_id=None):
+        """Mark ports used by others, e.g. allocated by another server process
+
+        :type synced_binding_id: int
+        :param synced_binding_id: the max id of PortBinding that ports include. Ignored if None
+        """
+        with self.__lock:
+            self.__mark(ports)
+            if synced_binding_id is not None:
+                self.synced_binding_id = max(self.synced_binding_id, synced_binding_id)
+
+    def allocate(self, private_ports):
+        """Allocate a host port for each private port
+
+        A host port is preferred to be private port + port_min, or the next free one above. All or nothing: no port will
+        be allocated if there is not enough free ports.
+
+        :type private_ports: list
+        :param private_ports: ports exposed by container
+
+        :rtype: list
+        :return host ports in the same order of private_ports
+
+        :raise Exception if ports used up on this host
+        """
+        now = time.time()
+        with self.__lock:
+            allocated = []
+            for private_port in private_ports:
+                port = self.__find_free(private_port + self.port_min)
+                if port is None:
+                    for p in allocated:
+                        self.__used[p] = 0
+                        self.__pending.pop(p, None)
+                    raise Exception("no port available")
+                self.__used[port] = 1
+                self.__pending[port] = now
+                allocated.append(port)
+            return allocated
+
+    def release(self, ports):
+        """Return host ports so that they can be allocated again"""
+        with self.__lock:
+            for port in ports:
+                if self.port_min <= port < self.port_max:
+                    self.__used[port] = 0
+                    self.__pending.pop(port, None)
+
+    def is_used(self, port):
+        return self.__used[port] == 1
+
+    def free_count(self):
+        with self.__lock:
+            return self.port_max - self.port_min - sum(self.__used[self.port_min:])
+
+    def __mark(self, ports):
+        for port in ports:
+            if self.port_min <= port < self.port_max:
+                self.__used[port] = 1
+
+    def __find_free(self, preferred):
+        start = preferred if self.port_min <= preferred < self.port_max else self.port_min
+        port = self.__used.find(b"\x00", start)
+        if port < 0:
+            port = self.__used.find(b"\x00", self.port_min, start)
+        return port if port >= 0 else None
@@ -31,21 +31,83 @@ from datetime import timedelta
 import json
 import random
 import string
+import time
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, wait
 from werkzeug.exceptions import PreconditionFailed, NotFound
 
-from sqlalchemy import and_
+from sqlalchemy import and_, or_
 
-from hackathon import Component, RequiredFeature
+from hackathon import Component, RequiredFeature, Context
+from hackathon.util import safe_get_config, get_config
+from hackathon.cache.lru_cache import LRUCache
 from hackathon.constants import EStatus, VERemoteProvider, VE_PROVIDER, PortBindingType, VEStatus, ReservedUser, \
     AVMStatus, CLOUD_ECLIPSE
 from hackathon.database import VirtualEnvironment, DockerHostServer, Experiment, Hackathon, Template, User, \
-    HackathonTemplateRel
+    DockerContainer
+from hackathon.database.models import date_serializer
 from hackathon.azureformation.azureFormation import AzureFormation
 from hackathon.hackathon_response import internal_server_error, precondition_failed, not_found, ok
-from hackathon.template import DockerTemplateUnit, TEMPLATE
 
 __all__ = ["ExprManager"]
 
+# page size of experiment list of hackathon, see ExprManager.get_expr_list_by_hackathon_id
+EXPR_LIST_DEFAULT_PER_PAGE = 20
+EXPR_LIST_MAX_PER_PAGE = 200
+
+# thread pool to start containers of the same experiment in parallel. Created on first use
+container_start_executor = None
+container_start_executor_lock = Lock()
+
+
+def get_container_start_executor():
+    global container_start_executor
+    with container_start_executor_lock:
+        if container_start_executor is None:
+            max_workers = safe_get_config("docker.parallel_start.max_workers", 8)
+            container_start_executor = ThreadPoolExecutor(max_workers=max_workers)
+        return container_start_executor
+
+
+# thread pool to stop containers of different docker hosts in parallel when recycling. Created on first use
+container_stop_executor = None
+container_stop_executor_lock = Lock()
+
+
+def get_container_stop_executor():
+    global container_stop_executor
+    with container_stop_executor_lock:
+        if container_stop_executor is None:
+            max_workers = safe_get_config("docker.recycle.max_workers", 8)
+            container_stop_executor = ThreadPoolExecutor(max_workers=max_workers)
+        return container_stop_executor
+
+
+# thread pool to provision experiments in background if 'expr.async_start.enabled'. Created on first use
+expr_start_executor = None
+expr_start_executor_lock = Lock()
+
+# count of experiments waiting in expr_start_executor
+expr_start_queue_depth = 0
+
+# expr id -> Context(submit_time, begin_time, end_time, stages) of experiments started by this process
+start_progress = LRUCache(max_size=10000, ttl=3600)
+
+
+def get_expr_start_executor():
+    global expr_start_executor
+    with expr_start_executor_lock:
+        if expr_start_executor is None:
+            max_workers = safe_get_config("expr.async_start.max_workers", 8)
+            expr_start_executor = ThreadPoolExecutor(max_workers=max_workers)
+        return expr_start_executor
+
+
+def change_expr_start_queue_depth(delta):
+    global expr_start_queue_depth
+    with expr_start_executor_lock:
+        expr_start_queue_depth += delta
+
 
 class ExprManager(Component):
     register_manager = RequiredFeature("register_manager")
@@ -56,6 +118,8 @@ class ExprManager(Component):
     hackathon_template_manager = RequiredFeature("hackathon_template_manager")
     hosted_docker = RequiredFeature("hosted_docker")
     alauda_docker = RequiredFeature("alauda_docker")
+    warm_pool_manager = RequiredFeature("warm_pool_manager")
+    heart_beat_buffer = RequiredFeature("heart_beat_buffer")
 
     def start_expr(self, user_id, template_name, hackathon_name=None):
         """
@@ -78,12 +142,9 @@ class ExprManager(Component):
         return self.__start_new_expr(hackathon, template, user_id)
 
     def heart_beat(self, expr_id):
-        expr = self.db.find_first_object_by(Experiment, id=expr_id, status=EStatus.RUNNING)
-        if expr is None:
+        """Record heart beat in memory. It's written to DB in batch later, see HeartBeatBuffer"""
+        if not self.heart_beat_buffer.beat(expr_id):
             return not_found('Experiment is not running')
-
-        expr.last_heart_beat_time = self.util.get_now()
-        self.db.commit()
         return ok()
 
     def stop_expr(self, expr_id, force=0):
@@ -117,6 +178,7 @@ class ExprManager(Component):
                 else:
                     expr.status = EStatus.STOPPED
                 self.db.commit()
+                self.heart_beat_buffer.discard([expr_id])
             else:
                 try:
                     # todo support delete azure vm
@@ -140,31 +202,107 @@ class ExprManager(Component):
             return not_found('Experiment Not found')
 
     def get_expr_list_by_hackathon_id(self, hackathon_id, **kwargs):
-        condition = self.__get_filter_condition(hackathon_id, **kwargs)
-        experiments = self.db.find_all_objects(Experiment, condition)
-        return map(lambda u: self.__get_expr_with_user_info(u), experiments)
+        """Get experiments of hackathon page by page, newest first
+
+        Experiments, their users and templates are loaded in a single joined query and only the columns needed are
+        returned. Two kinds of paging are supported:
+        - page/per_page: offset based. 'total' is always counted
+        - cursor/per_page: keyset based on experiment id, recommended for large hackathons since the cost of a page
+          doesn't grow with its depth. Pass 0 as cursor for the first page and then the 'next_cursor' of last result.
+          'total' is counted on the first page only
+
+        :type hackathon_id: int
+        :param hackathon_id: id of hackathon
+
+        :param kwargs: optional filters and paging args: status(-1 means all), user_name, template_name,
+            host_server_id, page, per_page, cursor
+
+        :rtype: dict
+        :return: {"items": [...], "per_page": 20, "total": 100, "page": 1} or {..., "next_cursor": 15}
+        """
+        # a negative LIMIT is an SQL error
+        per_page = max(min(kwargs.get("per_page") or EXPR_LIST_DEFAULT_PER_PAGE, EXPR_LIST_MAX_PER_PAGE), 1)
+        query = self.__get_expr_list_query(hackathon_id, **kwargs)
+
+        cursor = kwargs.get("cursor")
+        if cursor is not None:
+            total = query.order_by(None).count() if cursor <= 0 else None
+            if cursor > 0:
+                query = query.filter(Experiment.id < cursor)
+            rows = query.limit(per_page).all()
+            next_cursor = rows[-1].id if len(rows) == per_page else None
+            return {
+                "items": map(self.__get_expr_list_item, rows),
+                "per_page": per_page,
+                "total": total,
+                "next_cursor": next_cursor
+            }
+
+        page = max(kwargs.get("page") or 1, 1)
+        total = query.order_by(None).count()
+        rows = query.offset((page - 1) * per_page).limit(per_page).all()
+        return {
+            "items": map(self.__get_expr_list_item, rows),
+            "page": page,
+            "per_page": per_page,
+            "total": total
+        }
 
     def scheduler_recycle_expr(self):
         """recycle experiment acrroding to hackathon basic info on recycle configuration
 
-        According to the hackathon's basic info on 'recycle_enabled', find out time out experiments
-        Then call function to recycle them
+        According to the hackathon's basic info on 'recycle_enabled', find out time out experiments of all hackathons by
+        one query. Hosted docker containers are stopped in parallel grouped by docker host and status of experiments
+        are updated in batch. Experiments without docker container are assigned to default user.
 
         :return:
         """
         self.log.debug("start checking recyclable experiment ... ")
-        for hackathon in self.hackathon_manager.get_recyclable_hackathon_list():
-            # check recycle enabled
-            mins = self.hackathon_manager.get_recycle_minutes(hackathon)
-            expr_time_cond = Experiment.create_time < self.util.get_now() - timedelta(minutes=mins)
-            status_cond = Experiment.status == EStatus.RUNNING
-            # filter out the experiments that need to be recycled
-            exprs = self.db.find_all_objects(Experiment,
-                                             status_cond,
-                                             expr_time_cond,
-                                             Experiment.hackathon_id == hackathon.id)
-            for expr in exprs:
-                self.__recycle_expr(expr)
+        self.__roll_back_stale_starting_exprs()
+        # make last_heart_beat_time in DB up to date for this process
+        self.heart_beat_buffer.flush(force=True)
+        recycle_minutes = self.hackathon_manager.get_recycle_minutes_of_hackathons()
+        if not recycle_minutes:
+            return
+
+        now = self.util.get_now()
+        expired_cond = or_(*[and_(Experiment.hackathon_id == hackathon_id,
+                                  Experiment.create_time < now - timedelta(minutes=mins))
+                             for hackathon_id, mins in recycle_minutes.iteritems()])
+        rows = self.db.session().query(Experiment.id,
+                                       VirtualEnvironment.id,
+                                       VirtualEnvironment.name,
+                                       VirtualEnvironment.provider,
+                                       DockerContainer.host_server_id) \
+            .outerjoin(VirtualEnvironment, VirtualEnvironment.experiment_id == Experiment.id) \
+            .outerjoin(DockerContainer, DockerContainer.virtual_environment_id == VirtualEnvironment.id) \
+            .filter(Experiment.status == EStatus.RUNNING, expired_cond).all()
+
+        expr_ves = {}
+        for row in rows:
+            expr_ves.setdefault(row[0], []).append(row)
+
+        to_admin_ids = []
+        host_containers = {}
+        for expr_id, ves in expr_ves.iteritems():
+            providers = [ve[3] for ve in ves]
+            if VE_PROVIDER.DOCKER not in providers:
+                to_admin_ids.append(expr_id)
+            elif all(ve[3] == VE_PROVIDER.DOCKER and ve[4] for ve in ves):
+                for ve in ves:
+                    host_containers.setdefault(ve[4], []).append(ve)
+            else:
+                # containers not on hosted docker, e.g. alauda
+                self.stop_expr(expr_id)
+
+        if to_admin_ids:
+            self.db.session().query(Experiment).filter(Experiment.id.in_(to_admin_ids)) \
+                .update({Experiment.user_id: ReservedUser.DefaultUserID}, synchronize_session=False)
+            self.db.commit()
+            self.log.debug("assign %r to default admin" % to_admin_ids)
+
+        if host_containers:
+            self.__recycle_hosted_containers(host_containers)
 
     def schedule_pre_allocate_expr_job(self):
         next_run_time = self.util.get_now() + timedelta(seconds=1)
@@ -172,51 +310,12 @@ class ExprManager(Component):
                                     method="pre_allocate_expr",
                                     id="pre_allocate_expr",
                                     next_run_time=next_run_time,
+                                    pool="provisioning",
                                     minutes=self.util.safe_get_config("pre_allocate.check_interval_minutes", 5))
 
     def pre_allocate_expr(self):
-        # only deal with online hackathons
-        hackathon_id_list = self.hackathon_manager.get_pre_allocate_enabled_hackathon_list()
-        htrs = self.db.find_all_objects(HackathonTemplateRel, HackathonTemplateRel.hackathon_id.in_(hackathon_id_list))
-        templates = map(lambda x: x.template, htrs)
-        for template in templates:
-            try:
-                pre_num = template.hackathon.get_pre_allocate_number()
-                curr_num = self.db.count(Experiment,
-                                         Experiment.user_id == ReservedUser.DefaultUserID,
-                                         Experiment.template_id == template.id,
-                                         (Experiment.status == EStatus.STARTING) | (
-                                             Experiment.status == EStatus.RUNNING))
-                if template.provider == VE_PROVIDER.AZURE:
-                    if curr_num < pre_num:
-                        remain_num = pre_num - curr_num
-                        start_num = self.db.count_by(Experiment,
-                                                     user_id=ReservedUser.DefaultUserID,
-                                                     template=template,
-                                                     status=EStatus.STARTING)
-                        if start_num > 0:
-                            self.log.debug("there is an azure env starting, will check later ... ")
-                            return
-                        else:
-                            self.log.debug(
-                                "no starting template: %s , remain num is %d ... " % (template.name, remain_num))
-                            self.start_expr(template.hackathon.name, template.name, ReservedUser.DefaultUserID)
-                            break
-                            # curr_num += 1
-                            # self.log.debug("all template %s start complete" % template.name)
-                elif template.provider == VE_PROVIDER.DOCKER:
-                    self.log.debug(
-                        "template name is %s, hackathon name is %s" % (template.name, template.hackathon.name))
-                    if curr_num < pre_num:
-                        remain_num = pre_num - curr_num
-                        self.log.debug("no idle template: %s, remain num is %d ... " % (template.name, remain_num))
-                        self.start_expr(template.hackathon.name, template.name, ReservedUser.DefaultUserID)
-                        # curr_num += 1
-                        break
-                        # self.log.debug("all template %s start complete" % template.name)
-            except Exception as e:
-                self.log.error(e)
-                self.log.error("check default experiment failed")
+        """Refill the pools of pre-allocated experiments. See WarmPoolManager.refill"""
+        self.warm_pool_manager.refill()
 
     def assign_expr_to_admin(self, expr):
         """assign expr to admin to trun expr into pre_allocate_expr
@@ -259,54 +358,114 @@ class ExprManager(Component):
             return self.hosted_docker
 
     def __start_new_expr(self, hackathon, template, user_id):
+        async_start = get_config("expr.async_start.enabled")
+        if not async_start and template.provider == VE_PROVIDER.DOCKER \
+                and self.template_library.load_compiled_template(template) is None:
+            # never download the template in request, it's compiled in background meanwhile
+            return precondition_failed("template %s is still loading, please retry later" % template.name)
+
         # new expr
         expr = self.db.add_object_kwargs(Experiment,
                                          user_id=user_id,
                                          hackathon_id=hackathon.id,
-                                         status=EStatus.INIT,
-                                         template_id=template.id)
+                                         status=EStatus.STARTING,
+                                         template_id=template.id,
+                                         create_time=self.util.get_now())
         self.db.commit()
+        progress = Context(submit_time=time.time(), begin_time=None, end_time=None, stages=[])
+        start_progress.set(expr.id, progress)
 
-        curr_num = self.db.count(Experiment,
-                                 Experiment.user_id == ReservedUser.DefaultUserID,
-                                 Experiment.template == template,
-                                 (Experiment.status == EStatus.STARTING) |
-                                 (Experiment.status == EStatus.RUNNING))
-        if template.provider == VE_PROVIDER.DOCKER:
-            try:
-                template_dic = self.template_library.load_template(template)
-                virtual_environments_list = template_dic[TEMPLATE.VIRTUAL_ENVIRONMENTS]
-                if curr_num != 0 and curr_num >= self.util.get_config("pre_allocate.docker"):
-                    return
-                expr.status = EStatus.STARTING
-                self.db.commit()
-                map(lambda virtual_environment_dic:
-                    self.__remote_start_container(hackathon, expr, virtual_environment_dic),
-                    virtual_environments_list)
-                expr.status = EStatus.RUNNING
-                self.db.commit()
-            except Exception as e:
-                self.log.error(e)
-                self.log.error("Failed starting containers")
-                self.__roll_back(expr.id)
-                return internal_server_error('Failed starting containers')
-        else:
-            if curr_num != 0 and curr_num >= self.util.get_config("pre_allocate.azure"):
-                return
-            expr.status = EStatus.STARTING
-            self.db.commit()
-            try:
-                af = AzureFormation(self.hosted_docker.load_azure_key_id(expr.id))
-                af.create(expr.id)
-            except Exception as e:
-                self.log.error(e)
-                return internal_server_error('Failed starting azure vm')
+        if async_start:
+            # provision in background, caller polls get_expr_status until it's not STARTING. The thread loads expr by
+            # id so it's handed over only once expr is committed
+            self.db.after_commit(self.__submit_provision_expr, expr.id, progress)
+            return self.__report_expr_status(expr)
+
+        return self.__provision_expr(hackathon, template, expr, progress)
+
+    def __submit_provision_expr(self, expr_id, progress):
+        change_expr_start_queue_depth(1)
+        get_expr_start_executor().submit(self.__provision_expr_async, expr_id, progress)
+
+    def __provision_expr_async(self, expr_id, progress):
+        """Provision experiment in a thread of expr_start_executor. Everything is reloaded by id in the thread's session"""
+        change_expr_start_queue_depth(-1)
+        try:
+            expr = self.db.get_object(Experiment, expr_id)
+            # wait for the template to be downloaded in background, it's not in request
+            self.__provision_expr(expr.hackathon, expr.template, expr, progress,
+                                  safe_get_config("template.compiled_cache.load_timeout_seconds", 60))
+        except Exception as e:
+            self.log.error("fail to provision experiment %d" % expr_id)
+            self.log.error(e)
+        finally:
+            self.db.remove()
+
+    def __provision_expr(self, hackathon, template, expr, progress, load_timeout=0):
+        """Start containers or azure VMs of a new experiment and record the time of every stage in progress
+
+        :type load_timeout: int|float
+        :param load_timeout: seconds to wait for the template to be downloaded. 0 in request
+        """
+        progress.begin_time = time.time()
+        try:
+            if template.provider == VE_PROVIDER.DOCKER:
+                try:
+                    stage_time = time.time()
+                    compiled = self.template_library.load_compiled_template(template, load_timeout)
+                    if compiled is None:
+                        raise Exception("template %s is not loaded in %d seconds" % (template.name, load_timeout))
+                    stage_time = self.__record_stage(progress, "load_template", stage_time)
+                    self.__start_containers(hackathon, expr, compiled.new_units())
+                    self.__record_stage(progress, "start_containers", stage_time)
+                    expr.status = EStatus.RUNNING
+                    self.db.commit()
+                except Exception as e:
+                    self.log.error(e)
+                    self.log.error("Failed starting containers")
+                    self.__roll_back(expr.id)
+                    return internal_server_error('Failed starting containers')
+            else:
+                try:
+                    stage_time = time.time()
+                    af = AzureFormation(self.hosted_docker.load_azure_key_id(expr.id))
+                    af.create(expr.id)
+                    self.__record_stage(progress, "create_azure_vm", stage_time)
+                except Exception as e:
+                    self.log.error(e)
+                    expr.status = EStatus.FAILED
+                    self.db.commit()
+                    return internal_server_error('Failed starting azure vm')
+        finally:
+            progress.end_time = time.time()
         # after everything is ready, set the expr state to running
         # response to caller
         return self.__report_expr_status(expr)
 
+    def __record_stage(self, progress, name, stage_time):
+        now = time.time()
+        progress.stages.append({"name": name, "seconds": round(now - stage_time, 3)})
+        return now
+
+    def __get_start_progress(self, expr_id):
+        """Report queue depth and time of every stage if the experiment is started by this process"""
+        progress = start_progress.get(expr_id)
+        if progress is None:
+            return None
+
+        now = time.time()
+        begin_time = progress.begin_time or now
+        end_time = progress.end_time or now
+        return {
+            "queue_depth": expr_start_queue_depth,
+            "queued_seconds": round(begin_time - progress.submit_time, 3),
+            "provision_seconds": round(end_time - begin_time, 3) if progress.begin_time else 0,
+            "stages": list(progress.stages)
+        }
+
     def __report_expr_status(self, expr):
-        containers = self.__get_containers_by_exper(expr)
+        # containers of a starting experiment might not be created yet
+        containers = self.__get_containers_by_exper(expr) if expr.status == EStatus.RUNNING else []
         for container in containers:
             # expr status(restarting or running) is not match container running status on docker host
             if not self.hosted_docker.check_container_status_is_normal(container):
@@ -321,8 +480,11 @@ class ExprManager(Component):
             "status": expr.status,
             "hackathon": expr.hackathon.name,
             "create_time": str(expr.create_time),
-            "last_heart_beat_time": str(expr.last_heart_beat_time),
+            "last_heart_beat_time": str(self.heart_beat_buffer.get(expr.id, expr.last_heart_beat_time)),
         }
+        progress = self.__get_start_progress(expr.id)
+        if progress is not None:
+            ret["start_progress"] = progress
 
         if expr.status != EStatus.RUNNING:
             return ret
@@ -394,8 +556,52 @@ class ExprManager(Component):
 
         return template
 
-    def __remote_start_container(self, hackathon, expr, virtual_environment_dic):
-        docker_template_unit = DockerTemplateUnit(virtual_environment_dic)
+    def __start_containers(self, hackathon, expr, units):
+        """Start all containers of an experiment. Exception raised if any of them fails
+
+        Containers on hosted docker are started in parallel if 'docker.parallel_start.enabled'. DB work of every unit is
+        done in current thread(see HostedDockerFormation.prepare_start) and only docker API calls are fanned out to
+        the thread pool. The results are saved in current thread after all containers started.
+        """
+        docker = self.__get_docker(hackathon)
+        parallel = self.util.safe_get_config("docker.parallel_start.enabled", False)
+        if not parallel or not hasattr(docker, "prepare_start") or len(units) < 2:
+            for unit in units:
+                self.__remote_start_container(hackathon, expr, unit)
+            return
+
+        prepared = []
+        for unit in units:
+            docker_template_unit, ve = self.__prepare_virtual_environment(expr, unit)
+            container, context = docker.prepare_start(docker_template_unit,
+                                                      hackathon=hackathon,
+                                                      virtual_environment=ve,
+                                                      experiment=expr)
+            prepared.append((container, context))
+
+        executor = get_container_start_executor()
+        futures = [executor.submit(docker.remote_start, context) for container, context in prepared]
+        wait(futures)
+
+        failed = []
+        for (container, context), future in zip(prepared, futures):
+            container_id = None
+            if future.exception() is not None:
+                self.log.error(future.exception())
+            else:
+                container_id = future.result()
+            if docker.complete_start(container, container_id) is None:
+                failed.append(context.container_name)
+        if failed:
+            self.log.error("containers %r fail to run" % failed)
+            raise Exception("container_ret is none")
+
+    def __prepare_virtual_environment(self, expr, docker_template_unit):
+        """Rename the unit uniquely and save the VirtualEnvironment
+
+        :type docker_template_unit: DockerTemplateUnit
+        :param docker_template_unit: unit created for this experiment, see CompiledTemplate.new_units
+        """
         old_name = docker_template_unit.get_name()
         suffix = "".join(random.sample(string.ascii_letters + string.digits, 8))
         new_name = '%d-%s-%s' % (expr.id, old_name, suffix)
@@ -409,6 +615,11 @@ class ExprManager(Component):
                                 remote_provider=VERemoteProvider.Guacamole,
                                 experiment=expr)
         self.db.add_object(ve)
+        return docker_template_unit, ve
+
+    def __remote_start_container(self, hackathon, expr, unit):
+        docker_template_unit, ve = self.__prepare_virtual_environment(expr, unit)
+        new_name = docker_template_unit.get_name()
 
         # start container remotely , use hosted docker or alauda docker
         docker = self.__get_docker(hackathon)
@@ -441,19 +652,27 @@ class ExprManager(Component):
         if expr is not None:
             return expr
 
-        expr = self.db.find_first_object_by(Experiment,
-                                            status=EStatus.RUNNING,
-                                            hackathon_id=hackathon.id,
-                                            user_id=ReservedUser.DefaultUserID,
-                                            template=template)
+        expr = self.warm_pool_manager.claim(hackathon, template, user_id)
         if expr is not None:
-            self.db.update_object(expr, user_id=user_id)
-            self.db.commit()
-            self.log.debug("experiment had been assigned, check experiment and start new job ... ")
+            self.log.debug("pre-allocated experiment %d had been assigned to user %d" % (expr.id, user_id))
+        return expr
 
-            # add a job to start new pre-allocate experiment
-            self.schedule_pre_allocate_expr_job()
-            return expr
+    def __roll_back_stale_starting_exprs(self):
+        """Roll back docker experiments still STARTING long after created, e.g. the process starting them exited
+
+        Experiments are provisioned in threads of the process which created them and nothing else would finish or clean
+        them up. Azure experiments are left alone since they are updated by the callbacks of azure operations.
+        """
+        stale_minutes = self.util.safe_get_config("expr.async_start.stale_minutes", 60)
+        stale_time = self.util.get_now() - timedelta(minutes=stale_minutes)
+        expr_ids = self.db.session().query(Experiment.id) \
+            .join(Template, Template.id == Experiment.template_id) \
+            .filter(Experiment.status == EStatus.STARTING,
+                    Experiment.create_time < stale_time,
+                    Template.provider == VE_PROVIDER.DOCKER).all()
+        for (expr_id,) in expr_ids:
+            self.log.warn("experiment %d is still starting after %d minutes, roll it back" % (expr_id, stale_minutes))
+            self.__roll_back(expr_id)
 
     def __roll_back(self, expr_id):
         """
@@ -484,22 +703,60 @@ class ExprManager(Component):
             self.log.info("Rollback failed")
             self.log.error(e)
 
-    def __get_expr_with_user_info(self, experiment):
-        info = experiment.dic()
-        info['user_info'] = self.user_manager.user_display_info(experiment.user)
-        return info
+    def __get_expr_list_query(self, hackathon_id, **kwargs):
+        """Query of the compact projection of experiments with the filters in kwargs applied"""
+        query = self.db.session().query(Experiment.id,
+                                        Experiment.status,
+                                        Experiment.create_time,
+                                        Experiment.update_time,
+                                        Experiment.last_heart_beat_time,
+                                        Experiment.template_id,
+                                        Template.name.label("template_name"),
+                                        Experiment.user_id,
+                                        User.name.label("user_name"),
+                                        User.nickname.label("user_nickname"),
+                                        User.avatar_url.label("user_avatar_url")) \
+            .outerjoin(Template, Template.id == Experiment.template_id) \
+            .outerjoin(User, User.id == Experiment.user_id) \
+            .filter(Experiment.hackathon_id == hackathon_id)
 
-    def __get_filter_condition(self, hackathon_id, **kwargs):
-        condition = Experiment.hackathon_id == hackathon_id
         # check status: -1 means query all status
-        if kwargs['status'] != -1:
-            condition = and_(condition, Experiment.status == kwargs['status'])
-        # check user name
-        if len(kwargs['user_name']) > 0:
-            users = self.db.find_all_objects(User, User.nickname.like('%' + kwargs['user_name'] + '%'))
-            uids = map(lambda x: x.id, users)
-            condition = and_(condition, Experiment.user_id.in_(uids))
-        return condition
+        status = kwargs.get("status")
+        if status is not None and status != -1:
+            query = query.filter(Experiment.status == status)
+        if kwargs.get("user_name"):
+            query = query.filter(User.nickname.like('%' + kwargs["user_name"] + '%'))
+        if kwargs.get("template_name"):
+            query = query.filter(Template.name == kwargs["template_name"])
+        if kwargs.get("host_server_id"):
+            expr_ids = self.db.session().query(VirtualEnvironment.experiment_id) \
+                .join(DockerContainer, DockerContainer.virtual_environment_id == VirtualEnvironment.id) \
+                .filter(DockerContainer.host_server_id == kwargs["host_server_id"])
+            query = query.filter(Experiment.id.in_(expr_ids))
+
+        return query.order_by(Experiment.id.desc())
+
+    def __get_expr_list_item(self, row):
+        def serialize(date):
+            return date_serializer(date) if date else None
+
+        return {
+            "id": row.id,
+            "status": row.status,
+            "create_time": serialize(row.create_time),
+            "update_time": serialize(row.update_time),
+            "last_heart_beat_time": serialize(row.last_heart_beat_time),
+            "template": {
+                "id": row.template_id,
+                "name": row.template_name
+            },
+            "user_info": {
+                "id": row.user_id,
+                "name": row.user_name,
+                "nickname": row.user_nickname,
+                "avatar_url": row.user_avatar_url
+            }
+        }
 
     def __get_cloud_eclipse_url(self, experiment):
         reg = self.register_manager.get_registration_by_user_and_hackathon(experiment.user_id, experiment.hackathon_id)
@@ -526,20 +783,60 @@ class ExprManager(Component):
         ves = self.db.find_all_objects_by(VirtualEnvironment, experiment_id=expr.id, provider=VE_PROVIDER.DOCKER)
         return map(lambda x: x.container, ves)
 
-    def __recycle_expr(self, expr):
-        """recycle expr
+    def __recycle_hosted_containers(self, host_containers):
+        """Stop containers of expired experiments on hosted docker
 
-        If it is a docker experiment , stop it ; else assign it to default user
+        Containers are stopped by remote API in a bounded thread pool, one task per docker host, and DB is updated in
+        batch afterwards in current thread. An experiment is stopped only if all its containers stopped, otherwise it
+        keeps running and will be recycled in next round.
 
-        :type expr: Experiment
-        :param expr: the exper which you want to recycle
-
-        :return:
+        :type host_containers: dict
+        :param host_containers: docker host id to list of (expr_id, ve_id, ve_name, provider, host_server_id)
         """
-        providers = map(lambda x: x.provider, expr.virtual_environments.all())
-        if VE_PROVIDER.DOCKER in providers:
-            self.stop_expr(expr.id)
-            self.log.debug("it's stopping " + str(expr.id) + " inactive experiment now")
-        else:
-            self.assign_expr_to_admin(expr)
-            self.log.debug("assign " + str(expr.id) + " to default admin")
+        hosts = self.db.find_all_objects(DockerHostServer, DockerHostServer.id.in_(host_containers.keys()))
+        hosts = dict((h.id, h) for h in hosts)
+        executor = get_container_stop_executor()
+        futures = {}
+        for host_id, containers in host_containers.iteritems():
+            if host_id not in hosts:
+                self.log.error("docker host %d not found, cannot stop its containers" % host_id)
+                continue
+            vm_url = self.hosted_docker.get_vm_url(hosts[host_id])
+            futures[executor.submit(self.hosted_docker.remote_stop, vm_url, [c[2] for c in containers])] = host_id
+        wait(futures.keys())
+
+        stopped_ves = {}
+        for future, host_id in futures.iteritems():
+            try:
+                names = set(future.result())
+            except Exception as e:
+                self.log.error("fail to stop containers on docker host %d" % host_id)
+                self.log.error(e)
+                continue
+            stopped_ves[host_id] = [c for c in host_containers[host_id] if c[2] in names]
+
+        failed_expr_ids = set(c[0] for host_id, containers in host_containers.iteritems() for c in containers
+                              if c not in stopped_ves.get(host_id, []))
+        # containers of failed experiments are counted and marked in the round that stops all containers of them.
+        # Otherwise they would be released again then since the experiments keep running
+        stopped_expr_ids = set()
+        ve_ids = []
+        for host_id, containers in stopped_ves.iteritems():
+            containers = [c for c in containers if c[0] not in failed_expr_ids]
+            if containers:
+                expr_ids = set(c[0] for c in containers)
+                self.hosted_docker.complete_stop(hosts[host_id], list(expr_ids), len(containers))
+                stopped_expr_ids |= expr_ids
+                ve_ids += [c[1] for c in containers]
+
+        if ve_ids:
+            self.db.session().query(VirtualEnvironment).filter(VirtualEnvironment.id.in_(ve_ids)) \
+                .update({VirtualEnvironment.status: VEStatus.STOPPED}, synchronize_session=False)
+        if stopped_expr_ids:
+            self.db.session().query(Experiment).filter(Experiment.id.in_(stopped_expr_ids),
+                                                       Experiment.status == EStatus.RUNNING) \
+                .update({Experiment.status: EStatus.STOPPED}, synchronize_session=False)
+        self.db.commit()
+        self.heart_beat_buffer.discard(stopped_expr_ids)
+        self.log.debug("recycled %d experiments, %d failed and will be retried: %r" %
+                       (len(stopped_expr_ids), len(failed_expr_ids), list(failed_expr_ids)))
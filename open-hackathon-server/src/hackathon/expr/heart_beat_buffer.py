@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("..")
+import time
+from threading import Lock
+
+from sqlalchemy import case
+
+from hackathon import Component
+from hackathon.constants import EStatus
+from hackathon.database import Experiment
+from hackathon.cache.lru_cache import LRUCache
+from hackathon.util import safe_get_config
+
+__all__ = ["HeartBeatBuffer", "heart_beat_buffer"]
+
+
+class HeartBeatBuffer(Component):
+    """Coalesce heart beats of experiments in memory and write them to DB in batch
+
+    Every open workspace sends heart beat periodically. Instead of an UPDATE and a commit per heart beat, the latest
+    time of every experiment is buffered and all of them are written by a bulk 'UPDATE ... CASE' at most once per flush
+    interval. Whether an experiment is running is also cached for a while so that a heart beat doesn't query DB.
+
+    Staleness is bounded: last_heart_beat_time in DB is at most flush_interval behind the latest heart beat received by
+    the process, as long as the process receives heart beats or runs the scheduled flush job. Readers in the same
+    process should call get() which returns the buffered time. Jobs relying on last_heart_beat_time of all processes,
+    like recycle, should call flush(force=True) first and allow flush_interval of delay for the other processes.
+
+    :Example:
+        heart_beat_buffer.beat(expr_id)
+        heart_beat_buffer.get(expr.id, expr.last_heart_beat_time)
+    """
+
+    def __init__(self, flush_interval=30, running_check_seconds=60, batch_size=500):
+        """
+        :type flush_interval: int|float
+        :param flush_interval: minimum seconds between two flushes. It's the max staleness of last_heart_beat_time
+
+        :type running_check_seconds: int
+        :param running_check_seconds: how long an experiment is regarded as running after checked in DB
+
+        :type batch_size: int
+        :param batch_size: max count of experiments updated by one UPDATE
+        """
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.__beats = {}  # expr_id -> datetime of the latest heart beat not written yet
+        self.__running = LRUCache(max_size=100000, ttl=running_check_seconds)
+        self.__next_flush = time.time() + flush_interval
+        self.__lock = Lock()
+        self.__flush_lock = Lock()
+
+    def beat(self, expr_id):
+        """Record a heart beat of experiment
+
+        :type expr_id: int
+        :param expr_id: id of experiment
+
+        :rtype: bool
+        :return False if experiment isn't running else True
+        """
+        if not self.__running.get(expr_id):
+            if self.db.count_by(Experiment, id=expr_id, status=EStatus.RUNNING) == 0:
+                return False
+            self.__running.set(expr_id, True)
+
+        with self.__lock:
+            self.__beats[expr_id] = self.util.get_now()
+        self.flush()
+        return True
+
+    def get(self, expr_id, default=None):
+        """Get the latest heart beat time of experiment that hasn't been written to DB
+
+        :rtype: datetime
+        :return the buffered time or default if no heart beat buffered
+        """
+        return self.__beats.get(expr_id, default)
+
+    def discard(self, expr_ids):
+        """Forget experiments once they are stopped, so that their heart beats are rejected at once
+
+        :type expr_ids: list
+        :param expr_ids: ids of experiments
+        """
+        with self.__lock:
+            for expr_id in expr_ids:
+                self.__beats.pop(expr_id, None)
+                self.__running.invalidate(expr_id)
+
+    def flush(self, force=False):
+        """Write buffered heart beats to DB by bulk UPDATE
+
+        It's called after every heart beat and by a scheduled job, but DB is updated at most once per flush interval
+        and never by two threads at the same time.
+
+        :type force: bool
+        :param force: flush right now ignoring the flush interval
+
+        :rtype: int
+        :return count of experiments updated
+        """
+        now = time.time()
+        if not force and now < self.__next_flush:
+            return 0
+        if not self.__flush_lock.acquire(False):
+            return 0
+
+        try:
+            with self.__lock:
+                beats, self.__beats = self.__beats, {}
+                self.__next_flush = now + self.flush_interval
+            if not beats:
+                return 0
+
+            items = beats.items()
+            try:
+                session = self.db.session()
+                for i in range(0, len(items), self.batch_size):
+                    batch = dict(items[i:i + self.batch_size])
+                    session.query(Experiment) \
+                        .filter(Experiment.id.in_(batch.keys()), Experiment.status == EStatus.RUNNING) \
+                        .update({Experiment.last_heart_beat_time: case(batch, value=Experiment.id)},
+                                synchronize_session=False)
+                self.db.commit()
+                return len(beats)
+            except Exception as e:
+                self.log.error("fail to flush %d heart beats" % len(beats))
+                self.log.error(e)
+                self.db.rollback()
+                # keep them for next flush unless newer heart beats arrived
+                with self.__lock:
+                    for expr_id, beat_time in beats.iteritems():
+                        self.__beats.setdefault(expr_id, beat_time)
+                return 0
+        finally:
+            self.__flush_lock.release()
+
+
+# shared by all components in the same process
+heart_beat_buffer = HeartBeatBuffer(flush_interval=safe_get_config("expr.heart_beat.flush_interval_seconds", 30),
+                                    running_check_seconds=safe_get_config("expr.heart_beat.running_check_seconds", 60))
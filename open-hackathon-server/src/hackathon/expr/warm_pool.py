@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("..")
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func
+
+from hackathon import Component, RequiredFeature
+from hackathon.constants import EStatus, VE_PROVIDER, ReservedUser
+from hackathon.database import Experiment, Hackathon, Template, HackathonTemplateRel
+from hackathon.util import safe_get_config
+
+__all__ = ["WarmPoolManager"]
+
+# (hackathon_id, template_id) -> count of pre-allocated experiments being started by this process
+starting_counts = {}
+starting_counts_lock = Lock()
+
+# thread pool to start pre-allocated experiments. Created on first use
+refill_executor = None
+refill_executor_lock = Lock()
+
+# only one thread refills pools at a time
+refill_lock = Lock()
+
+
+def get_refill_executor():
+    global refill_executor
+    with refill_executor_lock:
+        if refill_executor is None:
+            refill_executor = ThreadPoolExecutor(max_workers=safe_get_config("pre_allocate.max_concurrency", 4))
+        return refill_executor
+
+
+class WarmPoolManager(Component):
+    """Keep a pool of pre-allocated(warm) experiments for every template of hackathons that enable pre-allocation
+
+    Pre-allocated experiments belong to ReservedUser.DefaultUserID. The target size of pool is the basic property
+    'pre_allocate_number' of hackathon. refill() starts the missing experiments in parallel, and claim() hands a
+    running one over to user so that user needn't wait for containers starting.
+    """
+    expr_manager = RequiredFeature("expr_manager")
+    hackathon_manager = RequiredFeature("hackathon_manager")
+
+    def get_pool_stats(self):
+        """Return depth of all pools
+
+        :rtype: list
+        :return list of dict including target, ready(running), starting and deficit of pool
+        """
+        hackathon_ids = self.hackathon_manager.get_pre_allocate_enabled_hackathon_list()
+        if not hackathon_ids:
+            return []
+
+        session = self.db.session()
+        targets = dict((h.id, h.get_pre_allocate_number())
+                       for h in self.db.find_all_objects(Hackathon, Hackathon.id.in_(hackathon_ids)))
+        pools = session.query(Hackathon.id, Hackathon.name, Template.id, Template.name, Template.provider) \
+            .join(HackathonTemplateRel, HackathonTemplateRel.hackathon_id == Hackathon.id) \
+            .join(Template, Template.id == HackathonTemplateRel.template_id) \
+            .filter(Hackathon.id.in_(hackathon_ids)).all()
+        counts = session.query(Experiment.hackathon_id, Experiment.template_id, Experiment.status,
+                               func.count(Experiment.id)) \
+            .filter(Experiment.user_id == ReservedUser.DefaultUserID,
+                    Experiment.hackathon_id.in_(hackathon_ids),
+                    Experiment.status.in_([EStatus.INIT, EStatus.STARTING, EStatus.RUNNING])) \
+            .group_by(Experiment.hackathon_id, Experiment.template_id, Experiment.status).all()
+        count_dict = dict(((h, t, s), c) for h, t, s, c in counts)
+
+        stats = []
+        for hackathon_id, hackathon_name, template_id, template_name, provider in pools:
+            target = targets.get(hackathon_id, 0)
+            ready = count_dict.get((hackathon_id, template_id, EStatus.RUNNING), 0)
+            starting = count_dict.get((hackathon_id, template_id, EStatus.INIT), 0) + \
+                count_dict.get((hackathon_id, template_id, EStatus.STARTING), 0)
+            stats.append({
+                "hackathon_id": hackathon_id,
+                "hackathon": hackathon_name,
+                "template_id": template_id,
+                "template": template_name,
+                "provider": provider,
+                "target": target,
+                "ready": ready,
+                "starting": starting,
+                "in_flight": starting_counts.get((hackathon_id, template_id), 0),
+                "deficit": max(target - ready - starting, 0)
+            })
+        return stats
+
+    def refill(self):
+        """Start missing pre-allocated experiments of all pools in parallel. It's a scheduled job
+
+        At most 'pre_allocate.max_concurrency' experiments are being started by this process at the same time. A pool
+        is skipped while its previous batch is still in flight in this process since those experiments may not be
+        in database yet. Azure templates start one experiment at a time since a VM takes long and costs much.
+        """
+        if not refill_lock.acquire(False):
+            self.log.debug("warm pools are being refilled by another thread")
+            return
+
+        try:
+            self.__refill()
+        finally:
+            refill_lock.release()
+
+    def schedule_refill(self):
+        """Refill pools in a moment, e.g. after an experiment claimed"""
+        self.scheduler.add_once(feature="warm_pool_manager",
+                                method="refill",
+                                id="refill_warm_pool",
+                                pool="provisioning",
+                                seconds=1)
+
+    def claim(self, hackathon, template, user_id):
+        """Hand a running pre-allocated experiment over to user
+
+        The owner is swapped by an UPDATE conditioned on the owner still being DefaultUserID. The UPDATE locks the row
+        and only one of the concurrent claims of the same experiment updates a row, the others try the next one.
+
+        :type hackathon: Hackathon
+        :param hackathon: the hackathon that user is in
+
+        :type template: Template
+        :param template: the template user wants to start
+
+        :type user_id: int
+        :param user_id: id of user who claims
+
+        :rtype: Experiment
+        :return the claimed experiment or None if pool is empty
+        """
+        session = self.db.session()
+        candidates = session.query(Experiment.id) \
+            .filter(Experiment.user_id == ReservedUser.DefaultUserID,
+                    Experiment.hackathon_id == hackathon.id,
+                    Experiment.template_id == template.id,
+                    Experiment.status == EStatus.RUNNING) \
+            .order_by(Experiment.id).limit(safe_get_config("pre_allocate.claim_attempts", 5)).all()
+
+        for candidate in candidates:
+            claimed = session.query(Experiment) \
+                .filter(Experiment.id == candidate.id,
+                        Experiment.user_id == ReservedUser.DefaultUserID,
+                        Experiment.status == EStatus.RUNNING) \
+                .update({Experiment.user_id: user_id}, synchronize_session=False)
+            self.db.commit()
+            if claimed == 1:
+                self.log.debug("pre-allocated experiment %d claimed by user %d" % (candidate.id, user_id))
+                self.schedule_refill()
+                return self.db.get_object(Experiment, candidate.id)
+
+        self.db.commit()
+        return None
+
+    def __refill(self):
+        max_concurrency = safe_get_config("pre_allocate.max_concurrency", 4)
+        with starting_counts_lock:
+            available = max_concurrency - sum(starting_counts.values())
+
+        for stat in self.get_pool_stats():
+            if available <= 0:
+                self.log.debug("pre-allocation reaches max concurrency, others will be started next time")
+                return
+            if stat["in_flight"] > 0:
+                continue
+
+            count = stat["deficit"]
+            if stat["provider"] == VE_PROVIDER.AZURE:
+                count = min(count, 0 if stat["starting"] > 0 else 1)
+            count = min(count, available)
+            if count <= 0:
+                continue
+
+            self.log.debug("start %d pre-allocated experiments for template %s of hackathon %s: %r" %
+                           (count, stat["template"], stat["hackathon"], stat))
+            available -= count
+            key = (stat["hackathon_id"], stat["template_id"])
+            with starting_counts_lock:
+                starting_counts[key] = starting_counts.get(key, 0) + count
+            for i in range(count):
+                get_refill_executor().submit(self.__start_pre_allocated_expr, key, stat["hackathon"], stat["template"])
+
+    def __start_pre_allocated_expr(self, key, hackathon_name, template_name):
+        try:
+            self.expr_manager.start_expr(ReservedUser.DefaultUserID, template_name, hackathon_name)
+        except Exception as e:
+            self.log.error("fail to start pre-allocated experiment of template %s" % template_name)
+            self.log.error(e)
+        finally:
+            with starting_counts_lock:
+                starting_counts[key] -= 1
+            self.db.remove()
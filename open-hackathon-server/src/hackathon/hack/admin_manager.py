@@ -55,7 +55,8 @@ class AdminManager(Component):
         :rtype: bool
         :return True if specific user has admin privilidge on specific hackathon otherwise False
         """
-        return self.is_hackathon_admin(g.hackathon.id, g.user.id)
+        hack_ids = self.user_manager.get_login_user_hackathon_ids()
+        return -1 in hack_ids or g.hackathon.id in hack_ids
 
     def get_entitled_hackathon_ids(self, user_id):
         """Get hackathon id list that specific user is entitled to manage
@@ -124,6 +125,7 @@ class AdminManager(Component):
                     create_time=self.util.get_now()
                 )
                 self.db.add_object(ahl)
+                self.user_manager.invalidate_user_tokens(user.id)
             return ok()
         except Exception as e:
             self.log.error(e)
@@ -146,6 +148,7 @@ class AdminManager(Component):
             return precondition_failed("hackathon creator can not be deleted")
 
         self.db.delete_all_objects(AdminHackathonRel, AdminHackathonRel.id == ahl_id)
+        self.user_manager.invalidate_user_tokens(ahl.user_id)
         return ok()
 
     def update_admin(self, args):
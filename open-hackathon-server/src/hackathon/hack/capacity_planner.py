@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("..")
+import math
+import time
+from datetime import timedelta
+
+from sqlalchemy import func
+
+from hackathon import Component, RequiredFeature, Context
+from hackathon.job_lock import get_job_lock
+from hackathon.database.models import Experiment, VirtualEnvironment, DockerContainer, DockerHostServer, \
+    HackathonStat
+from hackathon.constants import EStatus, HACKATHON_STAT, DockerHostServerStatus, DockerHostServerDisable
+
+__all__ = ["CapacityPlanner", "PLAN_JOB_ID"]
+
+# id of the interval job of CapacityPlanner.run
+PLAN_JOB_ID = "plan_docker_host_capacity"
+
+
+def get_provision_job_id(hackathon_id):
+    return "provision_docker_host_%d" % hackathon_id
+
+
+class CapacityPlanner(Component):
+    """Provision docker host VMs ahead of container demand
+
+    Creating an azure VM takes many minutes, so creating it after capacity runs out fails users' starts for all that
+    time. The planner forecasts, for every online hackathon that uses hosted docker, how many containers it needs within
+    the lead time(the time to boot a VM) and creates VMs for the difference to current capacity.
+
+    Demand of experiments is the larger one of:
+        - current experiments plus the recent start rate over the lead time
+        - registered users times 'expected_concurrency' if the event starts within the lead time or is going on
+    plus the target of pre-allocated experiments, converted to containers by the observed containers per experiment
+    and a headroom. Capacity includes hosts still booting and VMs requested from Azure but not created yet, which are
+    rows in state REQUESTED(see DockerHostManager.create_docker_host_vm) so that every process counts them.
+
+    Set 'docker.capacity_planner.dry_run' to log the plan without creating anything.
+    """
+    docker_host_manager = RequiredFeature("docker_host_manager")
+    hackathon_manager = RequiredFeature("hackathon_manager")
+    warm_pool_manager = RequiredFeature("warm_pool_manager")
+
+    def run(self, dry_run=None):
+        """Plan and provision docker host VMs for all hackathons. It's a scheduled job
+
+        :type dry_run: bool
+        :param dry_run: only log the plan. Default value is config 'docker.capacity_planner.dry_run'
+
+        :rtype: list
+        :return the plan, see plan()
+        """
+        if dry_run is None:
+            dry_run = self.util.get_config("docker.capacity_planner.dry_run")
+
+        plans = self.plan()
+        for p in plans:
+            if dry_run:
+                self.log.info("capacity plan(dry run): %r" % p)
+            elif p["vms_to_create"] > 0:
+                self.log.debug("capacity plan: %r" % p)
+                for i in range(p["vms_to_create"]):
+                    self.__create_vm(p["hackathon_id"])
+        return plans
+
+    def provision_now(self, hackathon):
+        """Create a docker host VM soon if no VM is being created for the hackathon
+
+        Called when no docker host is available. It's the fallback if the forecast was too low. The VM is created by a
+        scheduled job, see provision_for_hackathon, so that requests don't wait for Azure.
+
+        :type hackathon: Hackathon
+        :param hackathon: the hackathon that runs out of docker hosts
+        """
+        self.scheduler.add_once("capacity_planner", "provision_for_hackathon",
+                                context=Context(hackathon_id=hackathon.id),
+                                id=get_provision_job_id(hackathon.id),
+                                pool="provisioning",
+                                seconds=0)
+
+    def provision_for_hackathon(self, context):
+        """Create a docker host VM if no VM is being created for the hackathon. Run by scheduler
+
+        It takes a lease of the hackathon(see job_lock.py) so that no other process creates one meanwhile.
+
+        :type context: Context
+        :param context: context with hackathon_id
+        """
+        job_id = get_provision_job_id(context.hackathon_id)
+        lock = get_job_lock()
+        start_time = time.time()
+        if not lock.acquire(job_id, 0):
+            self.log.debug("docker host VM for hackathon %d is being created by another process" %
+                           context.hackathon_id)
+            return
+        try:
+            if self.__get_pending_counts([context.hackathon_id]).get(context.hackathon_id):
+                self.log.debug("docker host VM for hackathon %d is being created" % context.hackathon_id)
+                return
+            if self.util.get_config("docker.capacity_planner.dry_run"):
+                self.log.info("capacity plan(dry run): hackathon %d runs out of docker hosts" % context.hackathon_id)
+                return
+            self.__create_vm(context.hackathon_id)
+        finally:
+            lock.release(job_id, 0, start_time)
+
+    def plan(self):
+        """Forecast container demand of hackathons and the docker host VMs to create
+
+        :rtype: list
+        :return list of dict for every online hackathon on hosted docker
+        """
+        now = self.util.get_now()
+        lead_minutes = self.util.safe_get_config("docker.capacity_planner.lead_minutes", 30)
+        hackathons = [h for h in self.hackathon_manager.get_online_hackathons()
+                      if not h.is_alauda_enabled() and (h.event_end_time is None or h.event_end_time > now)]
+        if not hackathons:
+            return []
+
+        ids = [h.id for h in hackathons]
+        registered = self.__count_by_hackathon(HackathonStat.count,
+                                               HackathonStat.hackathon_id.in_(ids),
+                                               HackathonStat.type == HACKATHON_STAT.REGISTER,
+                                               aggregate=func.sum)
+        active = self.__count_by_hackathon(Experiment.id,
+                                           Experiment.hackathon_id.in_(ids),
+                                           Experiment.status.in_([EStatus.STARTING, EStatus.RUNNING]))
+        window_minutes = self.util.safe_get_config("docker.capacity_planner.rate_window_minutes", 30)
+        recent = self.__count_by_hackathon(Experiment.id,
+                                           Experiment.hackathon_id.in_(ids),
+                                           Experiment.create_time >= now - timedelta(minutes=window_minutes))
+        containers = dict(self.db.session().query(Experiment.hackathon_id, func.count(DockerContainer.id))
+                          .join(VirtualEnvironment, VirtualEnvironment.experiment_id == Experiment.id)
+                          .join(DockerContainer, DockerContainer.virtual_environment_id == VirtualEnvironment.id)
+                          .filter(Experiment.hackathon_id.in_(ids), Experiment.status == EStatus.RUNNING)
+                          .group_by(Experiment.hackathon_id).all())
+        running = self.__count_by_hackathon(Experiment.id,
+                                            Experiment.hackathon_id.in_(ids),
+                                            Experiment.status == EStatus.RUNNING)
+        hosts = self.db.session().query(DockerHostServer.hackathon_id,
+                                        func.sum(DockerHostServer.container_max_count),
+                                        func.sum(DockerHostServer.container_count)) \
+            .filter(DockerHostServer.hackathon_id.in_(ids),
+                    DockerHostServer.state.notin_([DockerHostServerStatus.UNAVAILABLE,
+                                                   DockerHostServerStatus.REQUESTED]),
+                    DockerHostServer.disable == DockerHostServerDisable.ABLE) \
+            .group_by(DockerHostServer.hackathon_id).all()
+        capacity = dict((h, (int(m or 0), int(c or 0))) for h, m, c in hosts)
+        pending_vms = self.__get_pending_counts(ids)
+        pool_targets = {}
+        for pool in self.warm_pool_manager.get_pool_stats():
+            pool_targets[pool["hackathon_id"]] = pool_targets.get(pool["hackathon_id"], 0) + pool["target"]
+        self.db.commit()
+
+        concurrency = self.util.safe_get_config("docker.capacity_planner.expected_concurrency", 0.8)
+        headroom = self.util.safe_get_config("docker.capacity_planner.headroom", 0.2)
+        min_free = self.util.safe_get_config("docker.capacity_planner.min_free_containers", 5)
+        vm_capacity = self.util.safe_get_config("dockerhostserver.vm.container_max_count", 50)
+        max_new_vms = self.util.safe_get_config("docker.capacity_planner.max_new_vms_per_run", 3)
+
+        plans = []
+        for h in hackathons:
+            start_rate = float(recent.get(h.id, 0)) / window_minutes
+            minutes_to_start = (h.event_start_time - now).total_seconds() / 60 if h.event_start_time else 0
+            kickoff = minutes_to_start <= lead_minutes
+            forecast_exprs = max(active.get(h.id, 0) + start_rate * lead_minutes,
+                                 int(registered.get(h.id) or 0) * concurrency if kickoff else 0)
+            forecast_exprs += pool_targets.get(h.id, 0)
+            containers_per_expr = float(containers[h.id]) / running[h.id] if running.get(h.id) else 1.0
+            needed = int(math.ceil(forecast_exprs * containers_per_expr * (1 + headroom)))
+            pending = pending_vms.get(h.id, 0)
+            max_count, used = capacity.get(h.id, (0, 0))
+            total = max_count + pending * vm_capacity
+            deficit = max(needed, used + min_free) - total
+            plans.append({
+                "hackathon_id": h.id,
+                "hackathon": h.name,
+                "registered": int(registered.get(h.id) or 0),
+                "active_experiments": active.get(h.id, 0),
+                "start_rate_per_minute": round(start_rate, 2),
+                "minutes_to_start": int(minutes_to_start),
+                "forecast_experiments": int(math.ceil(forecast_exprs)),
+                "containers_per_experiment": round(containers_per_expr, 2),
+                "needed_containers": needed,
+                "used_containers": used,
+                "capacity": total,
+                "pending_vms": pending,
+                "vms_to_create": min(int(math.ceil(float(deficit) / vm_capacity)), max_new_vms) if deficit > 0 else 0
+            })
+        return plans
+
+    def __count_by_hackathon(self, column, *criterion, **kwargs):
+        aggregate = kwargs.get("aggregate", func.count)
+        entity = column.class_
+        return dict(self.db.session().query(entity.hackathon_id, aggregate(column))
+                    .filter(*criterion).group_by(entity.hackathon_id).all())
+
+    def __get_pending_counts(self, hackathon_ids):
+        """Count VMs requested in the boot time but not created yet. Older ones are never created"""
+        expire = self.util.get_now() - timedelta(
+            minutes=self.util.safe_get_config("docker.capacity_planner.vm_boot_minutes", 30))
+        return self.__count_by_hackathon(DockerHostServer.id,
+                                         DockerHostServer.hackathon_id.in_(hackathon_ids),
+                                         DockerHostServer.state == DockerHostServerStatus.REQUESTED,
+                                         DockerHostServer.create_time >= expire)
+
+    def __create_vm(self, hackathon_id):
+        if not self.docker_host_manager.create_docker_host_vm(hackathon_id):
+            self.log.error("fail to create docker host VM for hackathon %d" % hackathon_id)
@@ -29,6 +29,8 @@ import sys
 sys.path.append("..")
 import imghdr
 
+from sqlalchemy import func, case
+from sqlalchemy.exc import IntegrityError
 from werkzeug.exceptions import PreconditionFailed, InternalServerError, BadRequest
 from flask import g, request
 
@@ -69,7 +71,7 @@ class HackathonManager(Component):
 
     def is_recycle_enabled(self, hackathon):
         key = HACKATHON_BASIC_INFO.RECYCLE_ENABLED
-        return self.get_basic_property(hackathon, key, False)
+        return self.util.str2bool(self.get_basic_property(hackathon, key, "0"))
 
     def get_hackathon_by_name(self, name):
         """Get hackathon accoring the unique name
@@ -104,8 +106,7 @@ class HackathonManager(Component):
         def internal_get_stat():
             return self.__get_hackathon_stat(hackathon)
 
-        cache_key = "hackathon_stat_%s" % hackathon.id
-        return self.cache.get_cache(key=cache_key, createfunc=internal_get_stat)
+        return self.cache.get_cache(key=self.__get_stat_cache_key(hackathon.id), createfunc=internal_get_stat)
 
     def get_hackathon_list(self, args):
         # get values from request's QueryString
@@ -135,11 +136,10 @@ class HackathonManager(Component):
         if self.user_manager.validate_login():
             user = g.user
 
-        def func(hackathon):
-            return self.__get_hackathon_detail(hackathon, user)
-
         # return serializable items as well as total count
-        return self.util.paginate(pagination, func)
+        result = self.util.paginate(pagination)
+        result["items"] = self.__get_hackathon_detail_list(pagination.items, user)
+        return result
 
     def get_pre_allocate_enabled_hackathon_list(self):
         # only online hackathons will be in consideration
@@ -153,14 +153,29 @@ class HackathonManager(Component):
     def get_user_hackathon_list_with_detail(self, user_id):
         user = self.user_manager.get_user_by_id(user_id)
         user_hack_list = self.db.session().query(Hackathon, UserHackathonRel) \
-            .outerjoin(UserHackathonRel, UserHackathonRel.user_id == user_id) \
+            .outerjoin(UserHackathonRel, UserHackathonRel.hackathon_id == Hackathon.id) \
             .filter(UserHackathonRel.deleted != 1, UserHackathonRel.user_id == user_id).all()
 
-        return map(lambda h: self.__get_hackathon_detail(h, user), user_hack_list)
+        return self.__get_hackathon_detail_list([h for h, rel in user_hack_list], user)
+
+    def get_recycle_minutes_of_hackathons(self):
+        """Get recycle minutes of all hackathons whose recycle is enabled by one query on HackathonConfig
 
-    def get_recyclable_hackathon_list(self):
-        all_hackathon = self.db.find_all_objects(Hackathon)
-        return filter(lambda h: self.is_recycle_enabled(h), all_hackathon)
+        :rtype: dict
+        :return dict from hackathon id to recycle minutes
+        """
+        configs = self.db.session().query(HackathonConfig.hackathon_id, HackathonConfig.key, HackathonConfig.value) \
+            .filter(HackathonConfig.key.in_([HACKATHON_BASIC_INFO.RECYCLE_ENABLED,
+                                             HACKATHON_BASIC_INFO.RECYCLE_MINUTES])).all()
+        enabled = set(h for h, k, v in configs if k == HACKATHON_BASIC_INFO.RECYCLE_ENABLED and self.util.str2bool(v))
+        minutes = {}
+        for h, k, v in configs:
+            if k == HACKATHON_BASIC_INFO.RECYCLE_MINUTES and h in enabled:
+                try:
+                    minutes[h] = int(v)
+                except (TypeError, ValueError):
+                    self.log.warn("invalid recycle minutes %r of hackathon %d, use the default" % (v, h))
+        return dict((h, minutes.get(h, 60)) for h in enabled)
 
     def get_entitled_hackathon_list_with_detail(self, user):
         hackathon_ids = self.admin_manager.get_entitled_hackathon_ids(user.id)
@@ -169,7 +184,7 @@ class HackathonManager(Component):
         else:
             hackathon_list = self.db.find_all_objects(Hackathon, Hackathon.id.in_(hackathon_ids))
 
-        return map(lambda h: self.__get_hackathon_detail(h, user), hackathon_list)
+        return self.__get_hackathon_detail_list(hackathon_list, user)
 
     def get_basic_property(self, hackathon, key, default=None):
         """Get basic property of hackathon from HackathonConfig"""
@@ -179,8 +194,7 @@ class HackathonManager(Component):
         return default
 
     def get_all_properties(self, hackathon):
-        configs = self.db.find_all_objects_by(HackathonConfig, hackathon_id=hackathon.id)
-        return [c.dic() for c in configs]
+        return self.db.find_all_dics_by(HackathonConfig, hackathon_id=hackathon.id)
 
     def set_basic_property(self, hackathon, properties):
         """Set basic property in table HackathonConfig"""
@@ -328,10 +342,13 @@ class HackathonManager(Component):
             stat.count = count
         else:
             stat = HackathonStat(hackathon_id=hackathon.id, type=stat_type, count=count)
+            self.db.add_object(stat)
 
         if stat.count < 0:
             stat.count = 0
+        stat.update_time = self.util.get_now()
         self.db.commit()
+        self.cache.invalidate(self.__get_stat_cache_key(hackathon.id))
 
     def increase_hackathon_stat(self, hackathon, stat_type, increase):
         """Increase or descrease the count for certain hackathon stat
@@ -345,16 +362,96 @@ class HackathonManager(Component):
         :type increase: int
         :param increase: increase of the count. Can be positive or negative
         """
-        stat = self.db.find_first_object_by(HackathonStat, hackathon_id=hackathon.id, type=stat_type)
-        if stat:
-            stat.count += increase
-        else:
-            stat = HackathonStat(hackathon_id=hackathon.id, type=stat_type, count=increase)
-            self.db.add_object(stat)
+        self.__increase_stat(hackathon.id, stat_type, increase)
+        self.db.commit()
+        self.cache.invalidate(self.__get_stat_cache_key(hackathon.id))
 
-        if stat.count < 0:
-            stat.count = 0
+    def increase_register_stat(self, hackathon, user, increase):
+        """Update register/online/offline stat once an approved registration is added or removed
+
+        :type hackathon: Hackathon
+        :param hackathon: the hackathon registered
+
+        :type user: User
+        :param user: the registered user. Online or offline count is updated according to the user's online status
+
+        :type increase: int
+        :param increase: 1 if a registration approved, -1 if an approved registration removed or rejected
+        """
+        self.__increase_stat(hackathon.id, HACKATHON_STAT.REGISTER, increase)
+        online_type = HACKATHON_STAT.ONLINE if user.online == 1 else HACKATHON_STAT.OFFLINE
+        self.__increase_stat(hackathon.id, online_type, increase)
         self.db.commit()
+        self.cache.invalidate(self.__get_stat_cache_key(hackathon.id))
+
+    def increase_online_stat(self, user, increase):
+        """Update online/offline stat of all hackathons that user registered once user login or logout
+
+        :type user: User
+        :param user: the user whose online status changed
+
+        :type increase: int
+        :param increase: 1 when user goes online and -1 when user goes offline
+        """
+        hackathon_ids = [r.hackathon_id for r in self.db.session().query(UserHackathonRel.hackathon_id).filter(
+            UserHackathonRel.user_id == user.id,
+            UserHackathonRel.deleted != 1,
+            UserHackathonRel.status.in_([RGStatus.AUTO_PASSED, RGStatus.AUDIT_PASSED]))]
+        for hackathon_id in hackathon_ids:
+            self.__increase_stat(hackathon_id, HACKATHON_STAT.ONLINE, increase)
+            self.__increase_stat(hackathon_id, HACKATHON_STAT.OFFLINE, -increase)
+        self.db.commit()
+
+        for hackathon_id in hackathon_ids:
+            self.cache.invalidate(self.__get_stat_cache_key(hackathon_id))
+
+    def reconcile_hackathon_stat(self):
+        """Recount register/online/offline stat of all hackathons and fix the counters if they drift
+
+        Counters are updated incrementally. Logout goes through API server(see UserManager.logout) but user login
+        happens in the client app which never touches the counters. So a login is not counted as online until this job
+        runs, every hackathon_stat.reconcile_interval_minutes(10 by default). It's a scheduled job.
+        """
+        hackathon_ids = [h.id for h in self.db.find_all_objects(Hackathon)]
+        if not hackathon_ids:
+            return
+
+        current = self.__get_hackathon_stat_list(hackathon_ids)
+        online_count = func.sum(case([(User.online == 1, 1)], else_=0))
+        reg_counts = self.db.session().query(UserHackathonRel.hackathon_id,
+                                             func.count(UserHackathonRel.id),
+                                             online_count) \
+            .outerjoin(User, User.id == UserHackathonRel.user_id) \
+            .filter(UserHackathonRel.deleted != 1,
+                    UserHackathonRel.status.in_([RGStatus.AUTO_PASSED, RGStatus.AUDIT_PASSED])) \
+            .group_by(UserHackathonRel.hackathon_id).all()
+
+        expected = dict((hackathon_id, {
+            HACKATHON_STAT.REGISTER: 0,
+            HACKATHON_STAT.ONLINE: 0,
+            HACKATHON_STAT.OFFLINE: 0
+        }) for hackathon_id in hackathon_ids)
+        for hackathon_id, reg_count, online in reg_counts:
+            if hackathon_id not in expected:
+                continue
+            online = int(online or 0)
+            expected[hackathon_id] = {
+                HACKATHON_STAT.REGISTER: reg_count,
+                HACKATHON_STAT.ONLINE: online,
+                HACKATHON_STAT.OFFLINE: reg_count - online
+            }
+
+        for hackathon_id, counts in expected.iteritems():
+            drifted = False
+            for stat_type, count in counts.iteritems():
+                if current[hackathon_id].get(stat_type, 0) != count:
+                    self.__set_stat(hackathon_id, stat_type, count)
+                    drifted = True
+
+            if drifted:
+                self.log.debug("hackathon stat of %d reconciled: %r" % (hackathon_id, counts))
+                self.db.commit()
+                self.cache.invalidate(self.__get_stat_cache_key(hackathon_id))
 
     def get_hackathon_tags(self, hackathon):
         tags = self.db.find_all_objects_by(HackathonTag, hackathon_id=hackathon.id)
@@ -435,6 +532,133 @@ class HackathonManager(Component):
 
         return detail
 
+    def __get_hackathon_detail_list(self, hackathons, user=None):
+        """Return details of a list of hackathons, the same as __get_hackathon_detail for each hackathon
+
+        Instead of querying configs, stat, tags, organizers, like and registration for every hackathon, they are queried
+        for all hackathons at once. So the count of DB queries is fixed no matter how many hackathons in the list.
+
+        :type hackathons: list
+        :param hackathons: list of Hackathon
+
+        :type user: User
+        :param user: the login user or None for anonymous user
+
+        :rtype: list
+        :return list of hackathon details in the same order of hackathons
+        """
+        if not hackathons:
+            return []
+
+        details = Hackathon.dic_many(hackathons)
+        hackathon_ids = [d["id"] for d in details]
+        configs = self.__find_all_by_hackathon_ids(HackathonConfig, hackathon_ids)
+        tags = self.__find_all_by_hackathon_ids(HackathonTag, hackathon_ids)
+        organizers = self.__find_all_by_hackathon_ids(HackathonOrganizer, hackathon_ids)
+        stats = self.__get_hackathon_stat_list(hackathon_ids)
+
+        user_info = None
+        likes = {}
+        registers = {}
+        if user:
+            user_info = self.user_manager.user_display_info(user)
+            likes = self.__find_all_by_hackathon_ids(HackathonLike, hackathon_ids, HackathonLike.user_id == user.id)
+            registers = self.__find_all_by_hackathon_ids(UserHackathonRel, hackathon_ids,
+                                                         UserHackathonRel.user_id == user.id)
+
+        def build_detail(detail):
+            hackathon_id = detail["id"]
+            detail["config"] = {c["key"]: c["value"] for c in configs.get(hackathon_id, [])}
+            detail["stat"] = stats[hackathon_id]
+            detail["tag"] = ",".join([t["tag"] for t in tags.get(hackathon_id, [])])
+            detail["organizer"] = organizers.get(hackathon_id, [])
+
+            if user:
+                detail["user"] = user_info
+                if hackathon_id in likes:
+                    detail["like"] = likes[hackathon_id][0]
+                if hackathon_id in registers:
+                    detail["registration"] = registers[hackathon_id][0]
+
+            return detail
+
+        return map(build_detail, details)
+
+    def __find_all_by_hackathon_ids(self, object_class, hackathon_ids, *criterion):
+        """Query objects of multiple hackathons in a single query and group them by hackathon_id
+
+        Only the columns are selected and serialized by the model serializer, no ORM object is built.
+
+        :rtype: dict
+        :return dict of hackathon_id -> list of serialized objects
+        """
+        serializer = object_class.serializer()
+        rows = self.db.session().query(*serializer.columns) \
+            .filter(object_class.hackathon_id.in_(hackathon_ids), *criterion).all()
+
+        groups = {}
+        for item in serializer.dic_many(rows):
+            groups.setdefault(item["hackathon_id"], []).append(item)
+        return groups
+
+    def __get_hackathon_stat_list(self, hackathon_ids):
+        """Return stats of multiple hackathons in a single DB query. See __get_hackathon_stat for a single hackathon
+
+        :rtype: dict
+        :return dict of hackathon_id -> stat
+        """
+        result = {}
+        for hackathon_id in hackathon_ids:
+            result[hackathon_id] = {
+                "hackathon_id": hackathon_id,
+                HACKATHON_STAT.ONLINE: 0,
+                HACKATHON_STAT.OFFLINE: 0
+            }
+
+        for hackathon_id, stats in self.__find_all_by_hackathon_ids(HackathonStat, hackathon_ids).iteritems():
+            for item in stats:
+                result[hackathon_id][item["type"]] = item["count"]
+
+        return result
+
+    def __increase_stat(self, hackathon_id, stat_type, increase):
+        """Increase the count of stat in DB without commit
+
+        Update the count in SQL rather than read-modify-write so that concurrent requests won't lose updates.
+        """
+        new_count = HackathonStat.count + increase
+        self.__upsert_stat(hackathon_id, stat_type, case([(new_count < 0, 0)], else_=new_count), max(increase, 0))
+
+    def __set_stat(self, hackathon_id, stat_type, count):
+        """Set the count of stat in DB without commit"""
+        self.__upsert_stat(hackathon_id, stat_type, count, count)
+
+    def __upsert_stat(self, hackathon_id, stat_type, update_count, insert_count):
+        """Update the count of stat, insert it if the stat doesn't exist yet
+
+        The insert is in a savepoint. If another request inserted the same stat first, the unique constraint on
+        (hackathon_id, type) rejects it and the update is retried.
+        """
+        session = self.db.session()
+
+        def update():
+            return session.query(HackathonStat) \
+                .filter(HackathonStat.hackathon_id == hackathon_id, HackathonStat.type == stat_type) \
+                .update({HackathonStat.count: update_count, HackathonStat.update_time: self.util.get_now()},
+                        synchronize_session=False)
+
+        if update() > 0:
+            return
+        try:
+            with session.begin_nested():
+                session.add(HackathonStat(hackathon_id=hackathon_id, type=stat_type, count=insert_count))
+        except IntegrityError:
+            self.log.debug("stat %s of hackathon %d inserted concurrently, update it" % (stat_type, hackathon_id))
+            update()
+
+    def __get_stat_cache_key(self, hackathon_id):
+        return "hackathon_stat_%s" % hackathon_id
+
     def __create_hackathon(self, context):
         """Insert hackathon and admin_hackathon_rel to database
 
@@ -482,6 +706,8 @@ class HackathonManager(Component):
             self.log.error(ex)
             raise InternalServerError("fail to create the default administrator")
 
+        # hackathon ids entitled to the creator are cached with the token, reload them for the new hackathon
+        self.user_manager.invalidate_user_tokens(g.user.id)
         return new_hack
 
     def __get_hackathon_configs(self, hackathon):
@@ -496,8 +722,7 @@ class HackathonManager(Component):
         return self.cache.get_cache(key=cache_key, createfunc=__internal_get_config)
 
     def __get_hackathon_organizers(self, hackathon):
-        organizers = self.db.find_all_objects_by(HackathonOrganizer, hackathon_id=hackathon.id)
-        return [o.dic() for o in organizers]
+        return self.db.find_all_dics_by(HackathonOrganizer, hackathon_id=hackathon.id)
 
     def __parse_update_items(self, args, hackathon):
         """Parse properties that need to update
@@ -527,27 +752,12 @@ class HackathonManager(Component):
         return result
 
     def __get_hackathon_stat(self, hackathon):
-        stats = self.db.find_all_objects_by(HackathonStat, hackathon_id=hackathon.id)
-        result = {
-            "hackathon_id": hackathon.id,
-            "online": 0,
-            "offline": 0
-        }
-        for item in stats:
-            result[item.type] = item.count
-
-        reg_list = hackathon.registers.filter(UserHackathonRel.deleted != 1,
-                                              UserHackathonRel.status.in_([RGStatus.AUTO_PASSED,
-                                                                           RGStatus.AUDIT_PASSED])).all()
-
-        reg_count = len(reg_list)
-        if reg_count > 0:
-            user_id_list = [r.user_id for r in reg_list]
-            user_id_online = self.db.count(User, (User.id.in_(user_id_list) & (User.online == 1)))
-            result["online"] = user_id_online
-            result["offline"] = reg_count - user_id_online
+        """Return all stat of hackathon. Counters are maintained incrementally so it's a single query
 
-        return result
+        The online/offline counters may lag behind user login until reconcile_hackathon_stat runs.
+        see increase_register_stat, increase_online_stat and reconcile_hackathon_stat
+        """
+        return self.__get_hackathon_stat_list([hackathon.id])[hackathon.id]
 
     def __get_config_cache_key(self, hackathon):
         return "hackathon_config_%s" % hackathon.id
@@ -26,12 +26,10 @@ THE SOFTWARE.
 import sys
 
 sys.path.append("..")
-from compiler.ast import flatten
-
 from flask import g
 
-from hackathon import Component, RequiredFeature, Context
-from hackathon.database import HackathonTemplateRel, Template, DockerHostServer
+from hackathon import Component, RequiredFeature
+from hackathon.database import HackathonTemplateRel, Template
 from hackathon.template import TEMPLATE, DOCKER_UNIT
 from hackathon.constants import VE_PROVIDER, TEMPLATE_STATUS
 from hackathon.hackathon_response import ok, not_found, internal_server_error
@@ -45,7 +43,7 @@ class HackathonTemplateManager(Component):
     team_manager = RequiredFeature("team_manager")
     hackathon_manager = RequiredFeature("hackathon_manager")
     template_library = RequiredFeature("template_library")
-    hosted_docker = RequiredFeature("hosted_docker")
+    image_distributor = RequiredFeature("image_distributor")
 
     def add_template_to_hackathon(self, template_id, team_id=-1):
         template = self.db.find_first_object_by(Template, id=template_id)
@@ -63,6 +61,8 @@ class HackathonTemplateManager(Component):
                                       template_id=template.id,
                                       team_id=team_id,
                                       update_time=self.util.get_now())
+            # compile it in background so that the first experiment of it needn't wait
+            self.template_library.load_compiled_template(template)
             return ok()
         except Exception as ex:
             self.log.error(ex)
@@ -84,6 +84,14 @@ class HackathonTemplateManager(Component):
         template_list = self.__get_templates_by_user(user, hackathon)
         settings = []
         for template in template_list:
+            if template.get('loading'):
+                settings.append({
+                    'name': template['name'],
+                    'description': template['description'] or "",
+                    'units': [],
+                    'loading': True
+                })
+                continue
             template_units = []
             for ve in template['data'][TEMPLATE.VIRTUAL_ENVIRONMENTS]:
                 template_units.append({
@@ -100,29 +108,31 @@ class HackathonTemplateManager(Component):
         return settings
 
     def pull_images_for_hackathon(self, context):
-        hackathon_id = context.hackathon_id
-        # get templates which is online and provided by docker
+        """Pull images of docker templates to docker hosts of hackathon. It's a scheduled job, see ImageDistributor"""
+        self.image_distributor.distribute(context.hackathon_id)
+
+    def get_template_images(self, hackathon_id, timeout=0):
+        """Get images of the online docker templates of hackathon
+
+        :type hackathon_id: int
+        :param hackathon_id: id of hackathon
+
+        :type timeout: int|float
+        :param timeout: seconds to wait for templates still being downloaded. Only wait in background jobs
+
+        :rtype: dict
+        :return template id -> list of images('image:tag'). Templates still loading are left out
+        """
         templates = self.__get_templates_for_pull(hackathon_id)
-        # get expected images on hackathons' templates
-        images = map(lambda x: self.__get_images_from_template(x), templates)
-        expected_images = flatten(images)
-        self.log.debug('expected images: %s on hackathon: %s' % (expected_images, hackathon_id))
-        # get all docker host server on hackathon
-        hosts = self.db.find_all_objects_by(DockerHostServer, hackathon_id=hackathon_id)
-        # loop to get every docker host
-        for docker_host in hosts:
-            download_images = self.__get_undownloaded_images_on_docker_host(docker_host, expected_images)
-            self.log.debug('need to pull images: %s on host: %s' % (download_images, docker_host.vm_name))
-            for dl_image in download_images:
-                image = dl_image.split(':')[0]
-                tag = dl_image.split(':')[1]
-                context = Context(image=image,
-                                  tag=tag,
-                                  docker_host=docker_host)
-                self.scheduler.add_once(feature="hosted_docker",
-                                        method="pull_image",
-                                        context=context,
-                                        seconds=3)
+        compiled_templates = self.template_library.load_compiled_templates(templates, timeout)
+        images = {}
+        for template in templates:
+            compiled = compiled_templates.get(template.id)
+            if compiled is None:
+                self.log.debug("images of template %s unknown since it's still loading" % template.name)
+            else:
+                images[template.id] = list(compiled.images)  # [image:tag, image:tag]
+        return images
 
     def __init__(self):
         pass
@@ -139,20 +149,20 @@ class HackathonTemplateManager(Component):
             htrs = self.db.find_all_objects_by(HackathonTemplateRel, hackathon_id=hackathon.id, team_id=-1)
 
         templates = map(lambda x: x.template, htrs)
+        # never wait for downloading in request, templates not compiled yet are compiled in background meanwhile
+        compiled_templates = self.template_library.load_compiled_templates(templates)
         data = []
         for template in templates:
+            compiled = compiled_templates.get(template.id)
             dic = template.dic()
-            dic['data'] = self.template_library.load_template(template)
+            if compiled is None:
+                dic['loading'] = True
+                data.append(dic)
+                continue
+            dic['data'] = compiled.to_dict()
             data.append(dic)
         return data
 
-    # template may have multiple images
-    def __get_images_from_template(self, template):
-        template_dic = self.template_library.load_template(template)
-        ves = template_dic[TEMPLATE.VIRTUAL_ENVIRONMENTS]
-        images = map(lambda x: x[DOCKER_UNIT.IMAGE], ves)
-        return images  # [image:tag, image:tag]
-
     def __get_templates_for_pull(self, hackathon_id):
         hackathon = self.hackathon_manager.get_hackathon_by_id(hackathon_id)
         htrs = hackathon.hackathon_template_rels
@@ -162,12 +172,3 @@ class HackathonTemplateManager(Component):
                                              Template.provider == VE_PROVIDER.DOCKER,
                                              Template.status == TEMPLATE_STATUS.CHECK_PASS)
         return templates
-
-    def __get_undownloaded_images_on_docker_host(self, docker_host, expected_images):
-        images = []
-        current_images = self.hosted_docker.get_pulled_images(docker_host)
-        self.log.debug('already exist images: %s on host: %s' % (current_images, docker_host.vm_name))
-        for ex_image in expected_images:
-            if ex_image not in current_images:
-                images.append(ex_image)
-        return flatten(images)
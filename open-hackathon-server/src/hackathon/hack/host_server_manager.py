@@ -25,9 +25,9 @@ THE SOFTWARE.
 __author__ = 'ZGQ'
 
 import sys
-import requests
 from uuid import uuid1
-from time import strftime, sleep
+from time import strftime
+from datetime import timedelta
 
 sys.path.append("..")
 
@@ -36,23 +36,32 @@ from azure.servicemanagement import (ConfigurationSet, ConfigurationSetInputEndp
                                      LinuxConfigurationSet, ServiceManagementService)
 
 from hackathon import Component, RequiredFeature, Context
+from hackathon.http_client import get_http_client
 from hackathon.database.models import DockerHostServer, HackathonAzureKey, Hackathon
+from hackathon.hack.capacity_planner import PLAN_JOB_ID
 from hackathon.constants import (AzureApiExceptionMessage, DockerPingResult, AVMStatus, AzureVMPowerState,
                                  DockerHostServerStatus, DockerHostServerDisable, AzureVMStartMethod,
                                  ServiceDeploymentSlot, AzureVMSize, AzureVMEndpointName, TCPProtocol,
-                                 AzureVMEndpointDefaultPort, AzureVMEnpointConfigType, AzureOperationStatus)
+                                 AzureVMEndpointDefaultPort, AzureVMEnpointConfigType)
 
 __all__ = ["DockerHostManager"]
 
+# called by azure operation tracker once vm creation succeeds
+VM_CREATED_CALLBACK = ['hackathon.hack.host_server_manager', 'DockerHostManager', 'on_vm_created']
+VM_FAILED_CALLBACK = ['hackathon.hack.host_server_manager', 'DockerHostManager', 'on_vm_failed']
+
 
 class DockerHostManager(Component):
     """Component to manage docker host server"""
     hosted_docker = RequiredFeature("hosted_docker")
+    docker_host_scheduler = RequiredFeature("docker_host_scheduler")
+    capacity_planner = RequiredFeature("capacity_planner")
+    operation_tracker = RequiredFeature("azure_operation_tracker")
     sche = RequiredFeature("scheduler")
 
-    def get_available_docker_host(self, req_count, hackathon):
+    def get_available_docker_host(self, req_count, hackathon, images=None):
         """
-        Get available docker host from DB
+        Get available docker host and reserve req_count containers on it. See DockerHostScheduler
         If there is no qualified host, then create one
 
         :param req_count: the number of containers needed
@@ -61,24 +70,21 @@ class DockerHostManager(Component):
         :param hackathon: a record in DB table:hackathon
         :type hackathon: Hackathon object
 
+        :param images: images of the containers, hosts that have them already are preferred
+        :type images: list
+
         :return: a docker host if there is a qualified one, otherwise None
         :rtype: DockerHostServer object
         """
-        vms = self.db.find_all_objects(DockerHostServer,
-                                       DockerHostServer.container_count + req_count <=
-                                       DockerHostServer.container_max_count,
-                                       DockerHostServer.hackathon_id == hackathon.id,
-                                       DockerHostServer.state == DockerHostServerStatus.DOCKER_READY,
-                                       DockerHostServer.disable == DockerHostServerDisable.ABLE)
+        docker_host = self.docker_host_scheduler.reserve(req_count, hackathon, images)
+        if docker_host is not None:
+            return docker_host
         # todo connect to azure to launch new VM if no existed VM meet the requirement
         # since it takes some time to launch VM,
         # it's more reasonable to launch VM when the existed ones are almost used up.
         # The new-created VM must run 'cloudvm service by default(either cloud-init or python remote ssh)
         # todo the VM public/private IP will change after reboot, need sync the IP in db with azure in this case
-        for docker_host in vms:
-            if self.hosted_docker.ping(docker_host):
-                return docker_host
-        self.create_docker_host_vm(hackathon.id)
+        self.capacity_planner.provision_now(hackathon)
         return None
         # raise Exception("No available VM.")
 
@@ -96,15 +102,15 @@ class DockerHostManager(Component):
 
     def schedule_pre_allocate_host_server_job(self):
         """
-        Schedule pre-allocate host server for every hackathon found in DB table:hackathon
+        Schedule job to pre-allocate host servers for hackathons according to the forecast of CapacityPlanner
         """
-        self.log.debug('Begin to check host server and prepare resource.')
-        min_avavilabe_container = 5
-        for hackathon in self.db.find_all_objects(Hackathon):
-            if self.__exist_request_host_server_by_hackathon_id(min_avavilabe_container, hackathon.id):
-                continue
-            if not self.create_docker_host_vm(hackathon.id):
-                self.log.error('Schedule pre-allocate host server for hackathon:%s failed.' % hackathon.display_name)
+        next_run_time = self.util.get_now() + timedelta(seconds=30)
+        self.sche.add_interval(feature="capacity_planner",
+                               method="run",
+                               id=PLAN_JOB_ID,
+                               next_run_time=next_run_time,
+                               pool="provisioning",
+                               minutes=self.util.safe_get_config("docker.capacity_planner.interval_minutes", 5))
 
     def create_docker_host_vm(self, hackathon_id):
         """
@@ -180,19 +186,25 @@ class DockerHostManager(Component):
             except Exception as e:
                 self.log.error(e)
                 return False
+        # record the requested VM so that capacity planner of every process counts it until Azure creates it
+        self.db.add_object_kwargs(DockerHostServer, vm_name=host_name, container_count=0,
+                                  container_max_count=self.util.safe_get_config(
+                                      'dockerhostserver.vm.container_max_count', 50),
+                                  is_auto=AzureVMStartMethod.AUTO, state=DockerHostServerStatus.REQUESTED,
+                                  disable=DockerHostServerDisable.ABLE, hackathon_id=hackathon_id,
+                                  create_time=self.util.get_now())
         # storage parameters in context
         context = Context(hackathon_id=hackathon_id, request_id=result.request_id,
                           service_name=service_name, role_name=host_name,
                           deployment_name=service_name, deployment_slot=deployment_slot,
                           host_name=host_name)
-        # start schedule
-        self.sche.add_once('docker_host_manager', 'check_vm_status', context=context, minutes=5)
+        self.check_vm_status(context)
         return True
 
     def check_vm_status(self, context):
         """
-        Check vm status, including Azure creation operation feedback and docker api port
-        and then add it to DB
+        Track Azure creation operation of vm without blocking. on_vm_created will be called once the operation succeeds,
+        or on_vm_failed if it fails
 
         :param context: must has key:
                         "hackathon_id": value type is integer, the id of hackathon;
@@ -208,21 +220,26 @@ class DockerHostManager(Component):
         assert context.get('hackathon_id') and context.get('request_id') and context.get('service_name')
         assert context.get('role_name') and context.get('deployment_name') and context.get('deployment_slot')
         assert context.get('host_name')
+        hackathon_azure_key = self.db.find_first_object_by(HackathonAzureKey, hackathon_id=context.hackathon_id)
+        if hackathon_azure_key is None:
+            self.log.error('Something wrong with Azure account of Hackathon:%d' % context.hackathon_id)
+            return
+        self.operation_tracker.track_async(hackathon_azure_key.azure_key_id,
+                                           context.request_id,
+                                           (VM_CREATED_CALLBACK, (), (context,)),
+                                           (VM_FAILED_CALLBACK, (), (context,)))
+
+    def on_vm_created(self, context):
+        """
+        Add the created vm to DB after checking its network config and docker api port
+
+        :param context: the same as check_vm_status
+        :type context: Context
+        """
         sms = self.__get_sms_object(context.hackathon_id)
         if sms is None:
             self.log.error('Something wrong with Azure account of Hackathon:%d' % context.hackathon_id)
-            return
-        # check Azure vm creation operation status
-        result = sms.get_operation_status(context.request_id)
-        try:
-            while result.status == AzureOperationStatus.IN_PROGRESS:
-                sleep(5)
-                result = sms.get_operation_status(context.request_id)
-            if result.status != AzureOperationStatus.SUCCESS:
-                self.log.error('VM creation operation failed according to Azure response.')
-                return
-        except Exception as e:
-            self.log.error(e)
+            self.on_vm_failed(context)
             return
         # get network config
         public_dns = ''
@@ -252,22 +269,29 @@ class DockerHostManager(Component):
                                     public_ip = endpoint.vip
         except Exception as e:
             self.log.error(e)
+            self.on_vm_failed(context)
             return
-        # add this VM to db
+        # fill in the VM requested by create_docker_host_vm
         self.log.debug(public_dns)
-        db_object = self.db.add_object_kwargs(DockerHostServer, vm_name=context.host_name, public_dns=public_dns,
-                                              public_ip=public_ip, public_docker_api_port=public_docker_api_port,
-                                              private_ip=private_ip, private_docker_api_port=private_docker_api_port,
-                                              container_count=0, is_auto=AzureVMStartMethod.AUTO, state=state,
-                                              disable=DockerHostServerDisable.ABLE,
-                                              container_max_count=self.util.safe_get_config(
-                                                  'dockerhostserver.vm.container_max_count', 50),
-                                              hackathon_id=context.hackathon_id)
+        fields = dict(public_dns=public_dns, public_ip=public_ip, public_docker_api_port=public_docker_api_port,
+                      private_ip=private_ip, private_docker_api_port=private_docker_api_port, state=state,
+                      update_time=self.util.get_now())
+        db_object = self.__get_requested_vm(context)
+        if db_object is None:
+            db_object = self.db.add_object_kwargs(DockerHostServer, vm_name=context.host_name, container_count=0,
+                                                  is_auto=AzureVMStartMethod.AUTO,
+                                                  disable=DockerHostServerDisable.ABLE,
+                                                  container_max_count=self.util.safe_get_config(
+                                                      'dockerhostserver.vm.container_max_count', 50),
+                                                  hackathon_id=context.hackathon_id,
+                                                  **fields)
+        else:
+            self.db.update_object(db_object, **fields)
         self.db.commit()
         # check docker _ping port
         try:
             ping_url = 'http://%s:%d/_ping' % (public_dns, public_docker_api_port)
-            req = requests.get(ping_url)
+            req = get_http_client(ping_url).get(ping_url)
             self.log.debug(req.content)
             if req.status_code == 200 and req.content == DockerPingResult.OK:
                 self.db.update_object(db_object, state=DockerHostServerStatus.DOCKER_READY)
@@ -275,6 +299,23 @@ class DockerHostManager(Component):
         except Exception as e:
             self.log.error(e)
 
+    def on_vm_failed(self, context):
+        """Mark the requested VM unavailable if Azure fails to create it, so that it's no longer counted as capacity
+
+        :param context: the same as check_vm_status
+        :type context: Context
+        """
+        self.log.error("fail to create docker host VM %s for hackathon %d" % (context.host_name, context.hackathon_id))
+        db_object = self.__get_requested_vm(context)
+        if db_object is not None:
+            self.db.update_object(db_object, state=DockerHostServerStatus.UNAVAILABLE, update_time=self.util.get_now())
+
+    def __get_requested_vm(self, context):
+        return self.db.find_first_object_by(DockerHostServer,
+                                            vm_name=context.host_name,
+                                            hackathon_id=context.hackathon_id,
+                                            state=DockerHostServerStatus.REQUESTED)
+
     def __get_sms_object(self, hackathon_id):
         """
         Get ServiceManagementService object by Azure account which is related to hackathon_id
@@ -497,24 +538,3 @@ class DockerHostManager(Component):
                 return False
             else:
                 raise Exception('Something wrong with checking deployment of service:' % service_name)
-
-    def __exist_request_host_server_by_hackathon_id(self, request_count, hackathon_id):
-        """
-        check whether there is a host server, belonging to a hackathon, that can hold a few more containers
-
-        :param request_count: the number of containers needed
-        :type request_count: integer
-
-        :param hackathon_id: the id of hackathon
-        :type hackathon_id: integer
-
-        :return: True if there exists one host server at least, otherwise False
-        :rtype: bool
-        """
-        vms = self.db.find_all_objects(DockerHostServer,
-                                       DockerHostServer.container_count + request_count <=
-                                       DockerHostServer.container_max_count,
-                                       DockerHostServer.hackathon_id == hackathon_id,
-                                       DockerHostServer.state == DockerHostServerStatus.DOCKER_READY,
-                                       DockerHostServer.disable == DockerHostServerDisable.ABLE)
-        return len(vms) > 0
@@ -33,7 +33,7 @@ from flask import g
 from hackathon import Component, RequiredFeature
 from hackathon.database import UserHackathonRel, Experiment
 from hackathon.hackathon_response import bad_request, precondition_failed, internal_server_error, not_found, ok
-from hackathon.constants import EStatus, RGStatus, HACKATHON_BASIC_INFO, HACKATHON_STAT
+from hackathon.constants import EStatus, RGStatus, HACKATHON_BASIC_INFO
 
 __all__ = ["RegisterManager"]
 
@@ -96,7 +96,8 @@ class RegisterManager(Component):
             if hackathon.is_auto_approve():
                 self.team_manager.create_default_team(hackathon, user)
 
-            self.__update_register_stat(hackathon)
+            if args["status"] == RGStatus.AUTO_PASSED:
+                self.hackathon_manager.increase_register_stat(hackathon, user, 1)
             return user_hackathon_rel
         except Exception as e:
             self.log.error(e)
@@ -110,6 +111,7 @@ class RegisterManager(Component):
                 # we can also create a new object here.
                 return not_found("registration not found")
 
+            was_passed = self.__is_passed(register)
             register.update_time = self.util.get_now()
             register.status = context.status
             self.db.commit()
@@ -117,8 +119,10 @@ class RegisterManager(Component):
             if register.status == RGStatus.AUDIT_PASSED:
                 self.team_manager.create_default_team(register.hackathon, register.user)
 
-            hackathon = self.hackathon_manager.get_hackathon_by_id(register.hackathon_id)
-            self.__update_register_stat(hackathon)
+            is_passed = self.__is_passed(register)
+            if was_passed != is_passed:
+                self.hackathon_manager.increase_register_stat(register.hackathon, register.user,
+                                                              1 if is_passed else -1)
 
             return register.dic()
         except Exception as e:
@@ -129,11 +133,14 @@ class RegisterManager(Component):
         if "id" not in args:
             return bad_request("id not invalid")
         try:
-            register = self.db.find_first_object_by(UserHackathonRel, id == args['id'])
+            register = self.db.find_first_object(UserHackathonRel, UserHackathonRel.id == args['id'])
             if register is not None:
+                was_passed = self.__is_passed(register)
+                hackathon = register.hackathon
+                user = register.user
                 self.db.delete_object(register)
-                hackathon = self.hackathon_manager.get_hackathon_by_id(register.hackathon_id)
-                self.__update_register_stat(hackathon)
+                if was_passed:
+                    self.hackathon_manager.increase_register_stat(hackathon, user, -1)
             return ok()
         except Exception as ex:
             self.log.error(ex)
@@ -163,12 +170,9 @@ class RegisterManager(Component):
 
         return detail
 
-    def __update_register_stat(self, hackathon):
-        count = self.db.count(UserHackathonRel,
-                              UserHackathonRel.hackathon_id == hackathon.id,
-                              UserHackathonRel.status.in_([RGStatus.AUDIT_PASSED, RGStatus.AUTO_PASSED]),
-                              UserHackathonRel.deleted == 0)
-        self.hackathon_manager.update_hackathon_stat(hackathon, HACKATHON_STAT.REGISTER, count)
+    def __is_passed(self, registration):
+        """Whether the registration is counted in the register stat of hackathon"""
+        return registration.deleted != 1 and registration.status in [RGStatus.AUDIT_PASSED, RGStatus.AUTO_PASSED]
 
     def is_user_registered(self, user_id, hackathon):
         """Check whether use registered certain hackathon"""
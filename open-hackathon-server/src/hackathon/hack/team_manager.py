@@ -391,8 +391,7 @@ class TeamManager(Component):
         return ok()
 
     def get_team_show_list(self, team_id):
-        show_list = self.db.find_all_objects_by(TeamShow, team_id=team_id)
-        return [s.dic() for s in show_list]
+        return self.db.find_all_dics_by(TeamShow, team_id=team_id)
 
     def __init__(self):
         pass
@@ -23,22 +23,48 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 import os
+import sys
+import time
+import itertools
 from pytz import utc
 from datetime import timedelta
+from threading import Lock, Thread
+from Queue import PriorityQueue
 import inspect
 
 from apscheduler.jobstores.base import JobLookupError
+from apscheduler.executors.base import BaseExecutor, run_job
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.util import undefined
-from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
+from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED
 
 from hackathon.hackathon_factory import RequiredFeature
 from hackathon.util import safe_get_config, get_config, get_now
 from hackathon.log import log
+from hackathon.job_lock import get_job_lock
 
 
 __all__ = ["HackathonScheduler"]
 
+# job id -> execution metrics of interval job in this process. See interval_executor
+job_metrics = {}
+job_metrics_lock = Lock()
+
+# pool used when job doesn't specify one or specifies an unknown one
+DEFAULT_POOL = "default"
+
+# pools of worker threads that scheduled jobs run in, overridden by config 'scheduler.pools'. A job of lower priority
+# value runs earlier than others queued in the same pool
+DEFAULT_POOLS = {
+    DEFAULT_POOL: {"max_workers": 10, "priority": 5},
+    # short jobs that users are waiting for, e.g. status callbacks
+    "interactive": {"max_workers": 8, "priority": 0},
+    # creating experiments, VMs and their callbacks
+    "provisioning": {"max_workers": 6, "priority": 5},
+    # slow background work such as image pulls and recycling
+    "maintenance": {"max_workers": 4, "priority": 9}
+}
+
 
 def scheduler_listener(event):
     """Custom listener for apscheduler
@@ -47,7 +73,10 @@ def scheduler_listener(event):
 
     :param event: the event executed and related to the apscheduler job
     """
-    if event.code == EVENT_JOB_ERROR:
+    if event.code == EVENT_JOB_MISSED:
+        log.warn("The schedule job %s missed its run time" % event.job_id)
+        update_job_metrics(event.job_id, missed=1)
+    elif event.code == EVENT_JOB_ERROR:
         print('The job crashed :(')
         log.warn("The schedule job crashed because of %s" % repr(event.exception))
     else:
@@ -55,7 +84,7 @@ def scheduler_listener(event):
         log.debug("The schedule job %s executed and return value is '%s'" % (event.job_id, event.retval))
 
 
-def scheduler_executor(feature, method, context):
+def scheduler_executor(feature, method, context, priority=None):
     """task for all apscheduler jobs
 
     While the context of apscheduler job will be serialized and saved into MySQL, it's hard that add a instance method
@@ -75,18 +104,165 @@ def scheduler_executor(feature, method, context):
 
     :type context: Context, see definition in hackathon/__init__.py
     :param context: the expected execution context of target method
+
+    :type priority: int
+    :param priority: priority in the pool, read by PriorityPoolExecutor. Not used here
     """
     log.debug("prepare to execute '%s.%s' with context: %s" % (feature, method, context))
     inst = RequiredFeature(feature)
     mtd = getattr(inst, method)
     args_len = len(inspect.getargspec(mtd).args)
 
-    if args_len < 2:
-        # if target method doesn't expect any parameter except 'self', the args_len is 1
-        mtd()
-    else:
-        # call with execution context
-        mtd(context)
+    # DB reads don't commit, end the session after every job so that the next job in this thread reads fresh data
+    db = RequiredFeature("db")
+    try:
+        if args_len < 2:
+            # if target method doesn't expect any parameter except 'self', the args_len is 1
+            mtd()
+        else:
+            # call with execution context
+            mtd(context)
+        db.commit()
+    except:
+        db.rollback()
+        raise
+    finally:
+        db.remove()
+
+
+def interval_executor(job_id, period, singleton, feature, method, context, priority=None):
+    """task for all interval jobs. It redirects to scheduler_executor and records metrics of the job
+
+    Every server process schedules the same interval jobs. A singleton job runs only in the process that takes its lease
+    from the job lock(see job_lock.py), the others skip the run. So the job runs about once per period in all processes
+    and never concurrently, however many uwsgi workers or nodes there are.
+
+    :type job_id: str|unicode
+    :param job_id: id of APScheduler job
+
+    :type period: int|float
+    :param period: seconds between two runs
+
+    :type singleton: bool
+    :param singleton: whether only one process runs the job at a time
+
+    See scheduler_executor for other parameters
+    """
+    lock = get_job_lock() if singleton else None
+    if lock and not lock.acquire(job_id, period):
+        log.debug("job %s skipped since it's run by another process" % job_id)
+        update_job_metrics(job_id, period=period, skipped=1)
+        return
+
+    start_time = time.time()
+    succeeded = False
+    try:
+        scheduler_executor(feature, method, context)
+        succeeded = True
+    finally:
+        if lock:
+            lock.release(job_id, period, start_time)
+        duration = time.time() - start_time
+        update_job_metrics(job_id,
+                           period=period,
+                           duration=duration,
+                           runs=1,
+                           errors=0 if succeeded else 1,
+                           overruns=1 if duration > period else 0)
+
+
+def update_job_metrics(job_id, period=None, duration=None, **counters):
+    """Accumulate counters(runs, errors, skipped, missed, overruns) of job and record duration of the last run"""
+    with job_metrics_lock:
+        metrics = job_metrics.get(job_id)
+        if metrics is None:
+            metrics = job_metrics[job_id] = {
+                "period_seconds": period,
+                "runs": 0,
+                "errors": 0,
+                "skipped": 0,
+                "missed": 0,
+                "overruns": 0,
+                "last_run_time": None,
+                "last_duration_seconds": None,
+                "max_duration_seconds": 0
+            }
+        if period is not None:
+            metrics["period_seconds"] = period
+        for name, value in counters.iteritems():
+            metrics[name] += value
+        if duration is not None:
+            metrics["last_run_time"] = get_now()
+            metrics["last_duration_seconds"] = round(duration, 3)
+            metrics["max_duration_seconds"] = max(metrics["max_duration_seconds"], round(duration, 3))
+
+
+class PriorityPoolExecutor(BaseExecutor):
+    """APScheduler executor running jobs in a bounded pool of threads
+
+    Every pool has its own threads so that a backlog of slow jobs in one pool doesn't delay jobs of other pools. Queued
+    jobs of a pool run in order of priority(job kwarg 'priority', or the default priority of pool), and then in order of
+    submission.
+    """
+
+    def __init__(self, max_workers=10, priority=5):
+        super(PriorityPoolExecutor, self).__init__()
+        self.max_workers = int(max_workers)
+        self.priority = priority
+        self.__queue = PriorityQueue()
+        self.__sequence = itertools.count()
+        self.__threads = []
+        self.__busy = 0
+        self.__stats_lock = Lock()
+
+    def get_stats(self):
+        """Return max workers, default priority, count of busy workers and count of queued jobs of the pool"""
+        with self.__stats_lock:
+            busy = self.__busy
+        return {
+            "max_workers": self.max_workers,
+            "priority": self.priority,
+            "busy": busy,
+            "queued": self.__queue.qsize()
+        }
+
+    def shutdown(self, wait=True):
+        for t in self.__threads:
+            # sorted after all jobs
+            self.__queue.put((sys.maxint, next(self.__sequence), None, None))
+        if wait:
+            for t in self.__threads:
+                t.join()
+
+    def _do_submit_job(self, job, run_times):
+        priority = job.kwargs.get("priority")
+        if priority is None:
+            priority = self.priority
+        self.__queue.put((priority, next(self.__sequence), job, run_times))
+        with self.__stats_lock:
+            if len(self.__threads) < self.max_workers and self.__queue.qsize() > len(self.__threads) - self.__busy:
+                t = Thread(target=self.__work, name="%s-%d" % (self._logger.name, len(self.__threads)))
+                t.daemon = True
+                self.__threads.append(t)
+                t.start()
+
+    def __work(self):
+        while True:
+            priority, sequence, job, run_times = self.__queue.get()
+            if job is None:
+                return
+            with self.__stats_lock:
+                self.__busy += 1
+            try:
+                events = run_job(job, job._jobstore_alias, run_times, self._logger.name)
+            except Exception:
+                exc, tb = sys.exc_info()[1:]
+                self._run_job_error(job.id, exc, tb)
+            else:
+                self._run_job_success(job.id, events)
+            finally:
+                with self.__stats_lock:
+                    self.__busy -= 1
 
 
 class HackathonScheduler():
@@ -102,7 +278,8 @@ class HackathonScheduler():
         """
         return self.__apscheduler
 
-    def add_once(self, feature, method, context=None, id=None, replace_existing=True, run_date=None, **delta):
+    def add_once(self, feature, method, context=None, id=None, replace_existing=True, run_date=None, pool=None,
+                 priority=None, **delta):
         """Add a job to APScheduler and executed only once
 
         Job will be executed at 'run_date' or after certain timedelta.
@@ -133,6 +310,12 @@ class HackathonScheduler():
         :type run_date: datetime | None
         :param run_date: job run date. If None, job run date will be datetime.now()+timedelta(delta)
 
+        :type pool: str|unicode
+        :param pool: name of the worker pool to run the job in, see DEFAULT_POOLS. Default pool if None
+
+        :type priority: int
+        :param priority: lower value runs earlier among queued jobs of the pool. Default priority of pool if None
+
         :type delta: kwargs for timedelta
         :param delta: kwargs for timedelta. For example: minutes=5. Will be ignored if run_date is not None
         """
@@ -140,16 +323,20 @@ class HackathonScheduler():
             run_date = get_now() + timedelta(**delta)
 
         if self.__apscheduler:
-            self.__apscheduler.add_job(scheduler_executor,
-                                       trigger='date',
-                                       run_date=run_date,
-                                       id=id,
-                                       max_instances=1,
-                                       replace_existing=replace_existing,
-                                       args=[feature, method, context])
+            # the job usually reads rows just written by caller, don't let it run before they are committed
+            RequiredFeature("db").after_commit(self.__apscheduler.add_job,
+                                               scheduler_executor,
+                                               trigger='date',
+                                               run_date=run_date,
+                                               id=id,
+                                               max_instances=1,
+                                               replace_existing=replace_existing,
+                                               executor=self.__get_pool_name(pool),
+                                               args=[feature, method, context],
+                                               kwargs={"priority": priority})
 
     def add_interval(self, feature, method, context=None, id=None, replace_existing=True, next_run_time=undefined,
-                     **interval):
+                     singleton=True, pool=None, priority=None, **interval):
         """Add an interval job to APScheduler and executed.
 
         Job will be executed firstly at 'next_run_time'. And then executed in interval.
@@ -179,19 +366,53 @@ class HackathonScheduler():
         :type next_run_time: datetime | undefined
         :param next_run_time: the first time the job will be executed. leave undefined to don't execute until interval time reached
 
+        :type singleton: bool
+        :param singleton: if true, only one of all server processes runs the job at a time. Set it false for jobs that
+                          work on the state of current process such as in-process cache
+
+        :type pool: str|unicode
+        :param pool: name of the worker pool to run the job in, see DEFAULT_POOLS. Default pool if None
+
+        :type priority: int
+        :param priority: lower value runs earlier among queued jobs of the pool. Default priority of pool if None
+
         :type interval: kwargs for "interval" trigger
         :param interval: kwargs for "interval" trigger. For example: minutes=5.
         """
         if self.__apscheduler:
-            self.__apscheduler.add_job(scheduler_executor,
+            job_id = id or "%s.%s" % (feature, method)
+            period = timedelta(**interval).total_seconds()
+            self.__apscheduler.add_job(interval_executor,
                                        trigger='interval',
-                                       id=id,
+                                       id=job_id,
                                        max_instances=1,
                                        replace_existing=replace_existing,
                                        next_run_time=next_run_time,
-                                       args=[feature, method, context],
+                                       executor=self.__get_pool_name(pool),
+                                       args=[job_id, period, singleton, feature, method, context],
+                                       kwargs={"priority": priority},
                                        **interval)
 
+    def get_job_metrics(self):
+        """Return execution metrics of interval jobs in this process
+
+        :rtype: dict
+        :return job id -> dict of period_seconds, runs, errors, skipped(run by another process), missed(run time
+                 passed before executed), overruns(ran longer than period), last_run_time, last_duration_seconds and
+                 max_duration_seconds
+        """
+        with job_metrics_lock:
+            return {job_id: dict(metrics) for job_id, metrics in job_metrics.iteritems()}
+
+    def get_pool_stats(self):
+        """Return stats of worker pools in this process
+
+        :rtype: dict
+        :return pool name -> dict of max_workers, priority, busy(count of running jobs) and queued(count of jobs
+                 waiting for a worker)
+        """
+        return {name: executor.get_stats() for name, executor in self.__pools.iteritems()}
+
     def remove_job(self, job_id):
         """Remove job from APScheduler job store
 
@@ -214,19 +435,35 @@ class HackathonScheduler():
         """
         self.app = app
         self.__apscheduler = None
+        self.__pools = {}
 
         # NOT instantiate while in flask DEBUG mode or in the main thread
         # It's to avoid APScheduler being instantiated twice
         if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
             self.__apscheduler = BackgroundScheduler(timezone=utc)
 
+            # add a worker pool as executor for every kind of jobs
+            pools = dict(DEFAULT_POOLS)
+            pools.update(safe_get_config("scheduler.pools", {}))
+            for name, pool in pools.iteritems():
+                self.__pools[name] = PriorityPoolExecutor(max_workers=pool.get("max_workers", 10),
+                                                          priority=pool.get("priority", 5))
+                self.__apscheduler.add_executor(self.__pools[name], name)
+
             # add MySQL job store
             if safe_get_config("scheduler.job_store", "memory") == "mysql":
                 self.jobstore = 'sqlalchemy'
                 self.__apscheduler.add_jobstore(self.jobstore, url=get_config("scheduler.job_store_url"))
 
             # add event listener
-            self.__apscheduler.add_listener(scheduler_listener, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+            self.__apscheduler.add_listener(scheduler_listener, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
             log.info("APScheduler loaded")
             self.__apscheduler.start()
 
+    def __get_pool_name(self, pool):
+        if pool is None:
+            return DEFAULT_POOL
+        if pool not in self.__pools:
+            log.warn("unknown scheduler pool %s, use default pool instead" % pool)
+            return DEFAULT_POOL
+        return pool
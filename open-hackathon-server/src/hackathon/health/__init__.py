@@ -43,11 +43,16 @@ STATUS = "status"
 # all available health check items
 all_health_items = {
     "mysql": RequiredFeature("health_check_mysql"),
+    "db_pool": RequiredFeature("health_check_db_pool"),
     "docker": RequiredFeature("health_check_hosted_docker"),
     "alauda": RequiredFeature("health_check_alauda_docker"),
     "guacamole": RequiredFeature("health_check_guacamole"),
     "azure": RequiredFeature("health_check_azure"),
-    "storage": RequiredFeature("storage")
+    "storage": RequiredFeature("storage"),
+    "cache": RequiredFeature("health_check_cache"),
+    "warm_pool": RequiredFeature("health_check_warm_pool"),
+    "scheduler": RequiredFeature("health_check_scheduler"),
+    "image_pull": RequiredFeature("health_check_image_pull")
 }
 
 # basic health check items which are fundamental for OHP
@@ -27,14 +27,15 @@
 import sys
 
 sys.path.append("..")
-import requests
 import abc
 
 from sqlalchemy import __version__
 
 from hackathon.constants import HEALTH_STATUS
 from hackathon import RequiredFeature, Component
+from hackathon.http_client import get_http_client
 from hackathon.database.models import User, AzureKey
+from hackathon.database.routing import get_pool_stats
 from hackathon.azureformation.service import Service
 
 __all__ = [
@@ -42,7 +43,11 @@ __all__ = [
     "HostedDockerHealthCheck",
     "AlaudaDockerHealthCheck",
     "GuacamoleHealthCheck",
-    "StorageHealthCheck"
+    "StorageHealthCheck",
+    "CacheHealthCheck",
+    "WarmPoolHealthCheck",
+    "SchedulerHealthCheck",
+    "ImagePullHealthCheck"
 ]
 
 STATUS = "status"
@@ -84,6 +89,22 @@ class MySQLHealthCheck(HealthCheck):
             }
 
 
+class DBPoolHealthCheck(HealthCheck):
+    """Report connection pools of primary and replica databases in current process. See database/pool_monitor.py
+
+    Status is WARNING if any checkout timed out recently or any connection is held too long. Stacks of the threads
+    holding connections are served by /api/admin/dbpool for super admin only.
+    """
+
+    def report_health(self):
+        pools = get_pool_stats()
+        warning = any(p.get("recent_timeouts") or p.get("long_held") for p in pools.values())
+        return {
+            STATUS: HEALTH_STATUS.WARNING if warning else HEALTH_STATUS.OK,
+            "pools": pools
+        }
+
+
 class HostedDockerHealthCheck(HealthCheck):
     """Report status of hostdd docker
 
@@ -119,7 +140,7 @@ class GuacamoleHealthCheck(HealthCheck):
 
     def report_health(self):
         try:
-            req = requests.get(self.guacamole_url)
+            req = get_http_client(self.guacamole_url).get(self.guacamole_url)
             self.log.debug(req.status_code)
             if req.status_code == 200:
                 return {
@@ -161,3 +182,63 @@ class StorageHealthCheck(HealthCheck):
 
     def __init__(self):
         self.storage = RequiredFeature("storage")
+
+
+class CacheHealthCheck(HealthCheck):
+    """Report hits, misses, evictions and compute time of cache. See cache/cache_mgr.py"""
+
+    def report_health(self):
+        return {
+            STATUS: HEALTH_STATUS.OK,
+            "cache": self.cache.get_stats()
+        }
+
+
+class WarmPoolHealthCheck(HealthCheck):
+    """Report depth of pre-allocated experiment pools. See expr/warm_pool.py
+
+    Status is WARNING if any pool is drained so that users have to wait for new experiments starting
+    """
+    warm_pool_manager = RequiredFeature("warm_pool_manager")
+
+    def report_health(self):
+        pools = self.warm_pool_manager.get_pool_stats()
+        drained = any(p["target"] > 0 and p["ready"] == 0 for p in pools)
+        return {
+            STATUS: HEALTH_STATUS.WARNING if drained else HEALTH_STATUS.OK,
+            "pools": pools
+        }
+
+
+class SchedulerHealthCheck(HealthCheck):
+    """Report execution metrics of interval jobs and load of worker pools in current process. See hackathon_scheduler.py
+
+    Status is WARNING if the last run of any job took longer than its period
+    """
+
+    def report_health(self):
+        jobs = self.scheduler.get_job_metrics()
+        overrun = any(m["last_duration_seconds"] > m["period_seconds"] for m in jobs.values())
+        return {
+            STATUS: HEALTH_STATUS.WARNING if overrun else HEALTH_STATUS.OK,
+            "jobs": jobs,
+            "pools": self.scheduler.get_pool_stats()
+        }
+
+
+class ImagePullHealthCheck(HealthCheck):
+    """Report progress of image pulls to docker hosts in current process. See docker/image_distributor.py
+
+    Status is WARNING if the latest pull of any image to any host failed
+    """
+
+    def __init__(self):
+        self.image_distributor = RequiredFeature("image_distributor")
+
+    def report_health(self):
+        pulls = self.image_distributor.get_pull_stats()
+        failed = any(p["status"] == "failed" for p in pulls)
+        return {
+            STATUS: HEALTH_STATUS.WARNING if failed else HEALTH_STATUS.OK,
+            "pulls": pulls
+        }
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+from threading import Lock
+from urlparse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from hackathon.util import safe_get_config
+
+__all__ = ["HttpClient", "get_http_client"]
+
+
+class HttpClient(object):
+    """HTTP client with a keep-alive connection pool, default timeout and retry with backoff
+
+    It has the same get/post/put/delete/request methods as module 'requests'. Retries apply to connection errors and
+    to 502/503/504 responses of idempotent methods only, so a POST like creating a container is never sent twice.
+
+    :Example:
+        client = get_http_client("http://docker-host:4243")
+        client.get("http://docker-host:4243/containers/json")
+        client.post(url, data=data, timeout=600)  # override the default timeout
+    """
+
+    def __init__(self, pool_size=10, connect_timeout=5, read_timeout=60, retries=3, backoff_factor=0.5):
+        """
+        :type pool_size: int
+        :param pool_size: maximum connections kept alive
+
+        :type connect_timeout: int|float
+        :param connect_timeout: default seconds to wait for connecting
+
+        :type read_timeout: int|float
+        :param read_timeout: default seconds to wait for response
+
+        :type retries: int
+        :param retries: maximum retries
+
+        :type backoff_factor: float
+        :param backoff_factor: sleep backoff_factor * (2 ^ (retry count - 1)) seconds between retries
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(total=retries,
+                      backoff_factor=backoff_factor,
+                      status_forcelist=[502, 503, 504],
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("get", url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request("post", url, data=data, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request("put", url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("delete", url, **kwargs)
+
+
+# scheme://host:port -> HttpClient, shared by the whole process
+http_clients = {}
+http_clients_lock = Lock()
+
+
+def get_http_client(url):
+    """Get the pooled HttpClient of the host of url
+
+    Every host(e.g. a docker host) has its own client so that a slow host won't exhaust connections of others. Pool
+    size, timeouts and retries are configured by 'http_client' in config.py
+
+    :type url: str|unicode
+    :param url: any url of the host, only scheme, host and port are used
+
+    :rtype: HttpClient
+    """
+    parsed = urlparse(url)
+    key = "%s://%s" % (parsed.scheme, parsed.netloc)
+    with http_clients_lock:
+        client = http_clients.get(key)
+        if client is None:
+            client = HttpClient(pool_size=safe_get_config("http_client.pool_size", 10),
+                                connect_timeout=safe_get_config("http_client.connect_timeout_seconds", 5),
+                                read_timeout=safe_get_config("http_client.read_timeout_seconds", 60),
+                                retries=safe_get_config("http_client.retries", 3),
+                                backoff_factor=safe_get_config("http_client.backoff_factor", 0.5))
+            http_clients[key] = client
+        return client
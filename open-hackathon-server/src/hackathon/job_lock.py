@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import os
+import time
+import fcntl
+import socket
+from datetime import timedelta
+from threading import Lock
+
+from sqlalchemy.exc import IntegrityError
+
+from hackathon.util import safe_get_config, get_now
+from hackathon.log import log
+
+__all__ = ["get_job_lock", "DBJobLock", "FileJobLock", "NoJobLock"]
+
+# identity of this process in leases
+owner_id = "%s:%d" % (socket.gethostname(), os.getpid())
+
+# the lease is given back this ratio of period after the run started, so that the other processes whose trigger fires
+# later in the same period skip, while the next trigger of any process gets it
+PERIOD_RATIO = 0.9
+
+job_lock = None
+job_lock_lock = Lock()
+
+
+def get_job_lock():
+    """Return the job lock of this process according to config 'scheduler.lock.type'
+
+    "db": lease rows in table scheduler_job_lock, works for processes on multiple nodes sharing the database
+    "file": lease files under 'scheduler.lock.file_dir', works for processes on the same host
+    "none": no lock, every process runs every job
+
+    :rtype: NoJobLock
+    """
+    global job_lock
+    with job_lock_lock:
+        if job_lock is None:
+            lock_type = safe_get_config("scheduler.lock.type", "db")
+            lease = safe_get_config("scheduler.lock.lease_seconds", 600)
+            if lock_type == "db":
+                job_lock = DBJobLock(lease)
+            elif lock_type == "file":
+                job_lock = FileJobLock(lease, safe_get_config("scheduler.lock.file_dir", "/tmp/hackathon/job_lock"))
+            else:
+                job_lock = NoJobLock(lease)
+        return job_lock
+
+
+class NoJobLock(object):
+    """Lease of scheduled jobs among server processes
+
+    acquire() takes the lease of a job for the run. The lease lasts 'lease' seconds, at least the period of job, so that
+    a process that crashed while running doesn't hold it forever. release() keeps the lease until PERIOD_RATIO of period
+    after the run started. This implementation always succeeds.
+    """
+
+    def __init__(self, lease=600):
+        self.lease = lease
+
+    def acquire(self, job_id, period):
+        """Take the lease of job
+
+        :type job_id: str|unicode
+        :param job_id: id of the scheduled job
+
+        :type period: int|float
+        :param period: seconds between two runs of the job
+
+        :rtype: bool
+        :return True if this process should run the job now
+        """
+        return True
+
+    def release(self, job_id, period, start_time):
+        """Give back the lease taken by acquire
+
+        :type start_time: float
+        :param start_time: time.time() when the run started
+        """
+        pass
+
+    def get_lease_seconds(self, period):
+        return max(self.lease, period)
+
+
+class DBJobLock(NoJobLock):
+    """Lease in table scheduler_job_lock. Taking it is one conditional UPDATE, or an INSERT the first time"""
+
+    def acquire(self, job_id, period):
+        from hackathon.database import db_adapter, SchedulerJobLock
+
+        now = get_now()
+        locked_until = now + timedelta(seconds=self.get_lease_seconds(period))
+        values = {
+            SchedulerJobLock.owner: owner_id,
+            SchedulerJobLock.locked_until: locked_until,
+            SchedulerJobLock.last_start_time: now
+        }
+        session = db_adapter.session()
+        try:
+            count = session.query(SchedulerJobLock) \
+                .filter(SchedulerJobLock.job_id == job_id, SchedulerJobLock.locked_until < now) \
+                .update(values, synchronize_session=False)
+            if count == 0:
+                if session.query(SchedulerJobLock.job_id).filter(SchedulerJobLock.job_id == job_id).first():
+                    session.commit()
+                    return False
+                session.add(SchedulerJobLock(job_id=job_id, owner=owner_id, locked_until=locked_until,
+                                             last_start_time=now))
+            session.commit()
+            return True
+        except IntegrityError:
+            # another process inserted the row first
+            session.rollback()
+            return False
+        except Exception as e:
+            log.error("fail to acquire lease of job %s" % job_id)
+            log.error(e)
+            session.rollback()
+            return False
+
+    def release(self, job_id, period, start_time):
+        from hackathon.database import db_adapter, SchedulerJobLock
+
+        locked_until = get_now() + timedelta(seconds=start_time + period * PERIOD_RATIO - time.time())
+        session = db_adapter.session()
+        # retry once after rollback in case the job left the session in a failed transaction
+        for attempt in range(2):
+            try:
+                session.query(SchedulerJobLock) \
+                    .filter(SchedulerJobLock.job_id == job_id, SchedulerJobLock.owner == owner_id) \
+                    .update({SchedulerJobLock.locked_until: locked_until}, synchronize_session=False)
+                session.commit()
+                return
+            except Exception as e:
+                session.rollback()
+                if attempt > 0:
+                    log.error("fail to release lease of job %s" % job_id)
+                    log.error(e)
+
+
+class FileJobLock(NoJobLock):
+    """Lease in file '<job_id>.lock' under a directory. The file holds 'owner locked_until' and is flock-ed while read
+    or written"""
+
+    def __init__(self, lease=600, file_dir="/tmp/hackathon/job_lock"):
+        super(FileJobLock, self).__init__(lease)
+        self.file_dir = file_dir
+
+    def acquire(self, job_id, period):
+        try:
+            with self.__open(job_id, blocking=False) as f:
+                if f is None:
+                    return False
+                owner, locked_until = self.__read(f)
+                now = time.time()
+                if locked_until > now:
+                    return False
+                self.__write(f, owner_id, now + self.get_lease_seconds(period))
+                return True
+        except Exception as e:
+            log.error("fail to acquire lease of job %s" % job_id)
+            log.error(e)
+            return False
+
+    def release(self, job_id, period, start_time):
+        try:
+            with self.__open(job_id, blocking=True) as f:
+                owner, locked_until = self.__read(f)
+                if owner == owner_id:
+                    self.__write(f, owner_id, start_time + period * PERIOD_RATIO)
+        except Exception as e:
+            log.error("fail to release lease of job %s" % job_id)
+            log.error(e)
+
+    def __open(self, job_id, blocking):
+        if not os.path.isdir(self.file_dir):
+            try:
+                os.makedirs(self.file_dir)
+            except OSError:
+                # created by another process
+                pass
+        return _LockedFile(os.path.join(self.file_dir, "%s.lock" % job_id), blocking)
+
+    def __read(self, f):
+        f.seek(0)
+        content = f.read().split()
+        if len(content) != 2:
+            return None, 0
+        return content[0], float(content[1])
+
+    def __write(self, f, owner, locked_until):
+        f.seek(0)
+        f.truncate()
+        f.write("%s %f" % (owner, locked_until))
+        f.flush()
+
+
+class _LockedFile(object):
+    """Open the file and flock it exclusively. Yield None if blocking is False and it's locked by other process"""
+
+    def __init__(self, path, blocking):
+        self.path = path
+        self.blocking = blocking
+        self.f = None
+
+    def __enter__(self):
+        self.f = open(self.path, "a+")
+        try:
+            fcntl.flock(self.f, fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            self.f.close()
+            self.f = None
+        return self.f
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.f is not None:
+            fcntl.flock(self.f, fcntl.LOCK_UN)
+            self.f.close()
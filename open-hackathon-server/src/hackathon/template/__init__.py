@@ -27,3 +27,4 @@ from template_library import TemplateLibrary
 from template_constants import *
 from template_content import TemplateContent
 from docker_template_unit import DockerTemplateUnit
+from compiled_template import CompiledTemplate
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+ 
+The MIT License (MIT)
+ 
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+ 
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+ 
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+import sys
+
+sys.path.append("..")
+
+from hackathon.constants import VE_PROVIDER
+from hackathon.util import safe_get_config
+from hackathon.cache.lru_cache import LRUCache
+from template_constants import TEMPLATE, DOCKER_UNIT
+from template_content import TemplateContent
+from docker_template_unit import CompiledDockerUnit
+
+__all__ = ["CompiledTemplate", "compiled_templates", "get_compiled_template_key"]
+
+
+def get_compiled_template_key(template_id, update_time):
+    """Cache key of a compiled template. A new update_time means a new version so stale entries are never hit"""
+    return "%d:%s" % (template_id, update_time)
+
+
+# compiled templates are shared by all threads of the process and never copied on read, see CompiledTemplate
+compiled_templates = LRUCache(max_size=safe_get_config("template.compiled_cache.max_size", 200))
+
+
+class CompiledTemplate(object):
+    """Parsed template of a specific version whose docker units are compiled
+
+    It's read only once built. Call new_units to get units that can be customized for an experiment.
+    """
+
+    def __init__(self, template_id, update_time, content):
+        """Compile the template
+
+        :type template_id: int
+        :param template_id: id of Template
+
+        :type update_time: datetime
+        :param update_time: update_time of Template, identifies the version of template content
+
+        :type content: TemplateContent
+        :param content: the parsed template content
+        """
+        self.template_id = template_id
+        self.update_time = update_time
+        self.name = content.name
+        self.description = content.description
+        self.units = tuple(CompiledDockerUnit(u.dic) if u.provider == VE_PROVIDER.DOCKER else u
+                           for u in content.units if u)
+        self.images = tuple(u.dic[DOCKER_UNIT.IMAGE] for u in self.get_docker_units())
+
+    def get_docker_units(self):
+        return [u for u in self.units if isinstance(u, CompiledDockerUnit)]
+
+    def new_units(self):
+        """Create docker units for one experiment
+
+        :rtype: list
+        :return: list of DockerTemplateUnit
+        """
+        return [u.new_unit() for u in self.get_docker_units()]
+
+    def to_template_content(self):
+        """Create a new TemplateContent of the template
+
+        :rtype: TemplateContent
+        """
+        return TemplateContent(self.name, self.description, self.new_units())
+
+    def to_dict(self):
+        return {
+            TEMPLATE.TEMPLATE_NAME: self.name,
+            TEMPLATE.DESCRIPTION: self.description,
+            TEMPLATE.VIRTUAL_ENVIRONMENTS: [u.new_unit_dic() for u in self.get_docker_units()]
+        }
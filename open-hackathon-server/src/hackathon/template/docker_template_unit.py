@@ -30,7 +30,18 @@ from template_constants import DOCKER_UNIT
 from template_unit import TemplateUnit
 from hackathon.constants import VE_PROVIDER
 
-__all__ = ["DockerTemplateUnit"]
+__all__ = ["DockerTemplateUnit", "CompiledDockerUnit"]
+
+# keys that describe the unit itself rather than the container, they are not posted to docker remote api
+UNIT_ONLY_KEYS = (DOCKER_UNIT.NAME,
+                  DOCKER_UNIT.TYPE,
+                  DOCKER_UNIT.DESCRIPTION,
+                  DOCKER_UNIT.PORTS,
+                  DOCKER_UNIT.REMOTE)
+
+
+def get_port_key(port):
+    return '%d/%s' % (port[DOCKER_UNIT.PORTS_PORT], port[DOCKER_UNIT.PORTS_PROTOCOL])
 
 
 class DockerTemplateUnit(TemplateUnit):
@@ -38,11 +49,20 @@ class DockerTemplateUnit(TemplateUnit):
     Smallest unit in docker template
     """
 
-    def __init__(self, dic):
+    def __init__(self, dic=None, compiled=None):
+        """Construct a unit from the dict in template or from a CompiledDockerUnit
+
+        A unit created from CompiledDockerUnit shares the precomputed parts with it, only the per-experiment fields
+        like name and ports are copied. See CompiledDockerUnit.new_unit
+        """
         super(DockerTemplateUnit, self).__init__(VE_PROVIDER.DOCKER)
-        self.dic = self.load_default_config()
-        for key, value in dic.iteritems():
-            self.dic[key] = value
+        self.compiled = compiled
+        if compiled is not None:
+            self.dic = compiled.new_unit_dic()
+        else:
+            self.dic = self.load_default_config()
+            for key, value in dic.iteritems():
+                self.dic[key] = value
 
     def load_default_config(self):
         dic = {
@@ -127,20 +147,11 @@ class DockerTemplateUnit(TemplateUnit):
     def get_container_config(self):
         """
         Compose post data for docker remote api create
+
+        'host_port' of every port must have been assigned. Parts shared with the compiled unit must not be modified
         :return:
         """
-        for p in self.dic[DOCKER_UNIT.PORTS]:
-            key = '%d/%s' % (p[DOCKER_UNIT.PORTS_PORT], p[DOCKER_UNIT.PORTS_PROTOCOL])
-            self.dic[DOCKER_UNIT.EXPOSED_PORTS][key] = {}
-            self.dic[DOCKER_UNIT.HOST_CONFIG][DOCKER_UNIT.HOST_CONFIG_PORT_BINDING][key] = \
-                [{DOCKER_UNIT.HOST_CONFIG_HOST_IP: '',
-                  DOCKER_UNIT.HOST_CONFIG_HOST_PORT: str(p[DOCKER_UNIT.PORTS_HOST_PORT])}]
-        self.dic.pop(DOCKER_UNIT.NAME, "")
-        self.dic.pop(DOCKER_UNIT.TYPE, "")
-        self.dic.pop(DOCKER_UNIT.DESCRIPTION, "")
-        self.dic.pop(DOCKER_UNIT.PORTS, None)
-        self.dic.pop(DOCKER_UNIT.REMOTE, None)
-        return self.dic
+        return self.__get_compiled().render_container_config(self.get_ports())
 
     def get_image_with_tag(self):
         return self.dic[DOCKER_UNIT.IMAGE]
@@ -170,26 +181,87 @@ class DockerTemplateUnit(TemplateUnit):
         return ""
 
     def get_instance_env_vars(self):
-        env_vars = {}
+        return dict(self.__get_compiled().instance_env_vars)
+
+    def get_instance_ports(self):
+        return [dict(p) for p in self.__get_compiled().instance_ports]
+
+    def __get_compiled(self):
+        if self.compiled is None:
+            self.compiled = CompiledDockerUnit(self.dic)
+        return self.compiled
+
+
+class CompiledDockerUnit(object):
+    """Precomputed parts of a docker unit that are the same for every experiment
+
+    It's built once per template version and shared by all experiments started from it(see CompiledTemplate), so
+    nothing in it should be modified after construction. Per-experiment fields like container name and host ports are
+    filled in on the DockerTemplateUnit returned by new_unit.
+    """
+
+    def __init__(self, dic):
+        """Compile the unit
 
-        def convert(env):
-            arr = env.split("=")
+        :type dic: dict
+        :param dic: dict of the unit with default config merged. See DockerTemplateUnit.load_default_config
+        """
+        self.dic = dic
+        self.ports = tuple(dict(p) for p in dic[DOCKER_UNIT.PORTS])
+
+        # container config skeleton with exposed ports. Port bindings depend on host ports so they are rendered later
+        config = dict((k, v) for k, v in dic.iteritems() if k not in UNIT_ONLY_KEYS)
+        exposed_ports = dict(config[DOCKER_UNIT.EXPOSED_PORTS])
+        for p in self.ports:
+            exposed_ports[get_port_key(p)] = {}
+        config[DOCKER_UNIT.EXPOSED_PORTS] = exposed_ports
+        self.container_config = config
+
+        self.instance_env_vars = self.__compile_env_vars(dic[DOCKER_UNIT.ENV])
+        self.instance_ports = tuple({
+            "container_port": p[DOCKER_UNIT.PORTS_PORT],
+            "protocol": p[DOCKER_UNIT.PORTS_PROTOCOL] or "tcp",
+            # endpoint_type: "tcp-endpoint" or "direct-endpoint"? not sure the meanings or usages. Communicating...
+            "endpoint_type": "tcp-endpoint"
+        } for p in self.ports)
+
+    def new_unit(self):
+        """Create a DockerTemplateUnit for one experiment
+
+        :rtype: DockerTemplateUnit
+        """
+        return DockerTemplateUnit(compiled=self)
+
+    def new_unit_dic(self):
+        """Shallow copy of the unit dict with its own ports so that name and host ports can be set per experiment"""
+        dic = dict(self.dic)
+        dic[DOCKER_UNIT.PORTS] = [dict(p) for p in self.ports]
+        return dic
+
+    def render_container_config(self, ports):
+        """Fill port bindings of the container config skeleton
+
+        :type ports: list
+        :param ports: port configs of the unit whose 'host_port' have been assigned
+
+        :rtype: dict
+        :return: post data for docker remote api create
+        """
+        bindings = dict(self.container_config[DOCKER_UNIT.HOST_CONFIG][DOCKER_UNIT.HOST_CONFIG_PORT_BINDING])
+        for p in ports:
+            bindings[get_port_key(p)] = [{DOCKER_UNIT.HOST_CONFIG_HOST_IP: '',
+                                          DOCKER_UNIT.HOST_CONFIG_HOST_PORT: str(p[DOCKER_UNIT.PORTS_HOST_PORT])}]
+
+        host_config = dict(self.container_config[DOCKER_UNIT.HOST_CONFIG])
+        host_config[DOCKER_UNIT.HOST_CONFIG_PORT_BINDING] = bindings
+        config = dict(self.container_config)
+        config[DOCKER_UNIT.HOST_CONFIG] = host_config
+        return config
+
+    def __compile_env_vars(self, env):
+        env_vars = {}
+        for e in env or []:
+            arr = e.split("=")
             if len(arr) == 2:
                 env_vars[arr[0]] = arr[1]
-
-        map(lambda env: convert(env), DOCKER_UNIT.ENV or [])
         return env_vars
-
-    def get_instance_ports(self):
-        instance_ports = []
-
-        def convert(p):
-            instance_ports.append({
-                "container_port": p["port"],
-                "protocol": p["protocol"] or "tcp",
-                # endpoint_type: "tcp-endpoint" or "direct-endpoint"? not sure the meanings or usages. Communicating...
-                "endpoint_type": "tcp-endpoint"
-            })
-
-        map(lambda p: convert(p), self.dic[DOCKER_UNIT.PORTS])
-        return instance_ports
@@ -29,20 +29,40 @@ from werkzeug.exceptions import BadRequest, InternalServerError, Forbidden
 sys.path.append("..")
 from os.path import isfile
 import json
-import requests
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from sqlalchemy import and_
 from flask import g, request
 
 from hackathon import Component, RequiredFeature, Context
+from hackathon.util import safe_get_config
+from hackathon.http_client import get_http_client
 from hackathon.database import Template, Experiment, HackathonTemplateRel
 from hackathon.hackathon_response import not_found, ok, internal_server_error, forbidden
-from hackathon.constants import FILE_TYPE, TEMPLATE_STATUS
+from hackathon.constants import FILE_TYPE, TEMPLATE_STATUS, VE_PROVIDER
 from template_constants import TEMPLATE
 from template_content import TemplateContent
+from compiled_template import CompiledTemplate, compiled_templates, get_compiled_template_key
 
 __all__ = ["TemplateLibrary"]
 
+# thread pool to download and compile remote templates in this process. Created on first use
+compile_executor = None
+compile_executor_lock = Lock()
+
+# key of compiled template -> Future of the compilation in progress, so that a template is downloaded once at a time
+pending_compiles = {}
+pending_compiles_lock = Lock()
+
+
+def get_compile_executor():
+    global compile_executor
+    with compile_executor_lock:
+        if compile_executor is None:
+            compile_executor = ThreadPoolExecutor(max_workers=safe_get_config("template.compiled_cache.max_workers", 4))
+        return compile_executor
+
 
 class TemplateLibrary(Component):
     """Component to manage templates"""
@@ -72,32 +92,87 @@ class TemplateLibrary(Component):
     def search_template(self, args):
         """Search template by status, name or description"""
         criterion = self.__generate_search_criterion(args)
-        templates = self.db.find_all_objects(Template, criterion)
-        return [t.dic() for t in templates]
+        return self.db.find_all_dics(Template, criterion)
 
-    def load_template(self, template):
-        """load template into memory either from a local cache path or an remote uri
-        load template from local file > from from azure
-        :param template:
-        :return:
+    def load_template(self, template, timeout=0):
+        """load template into memory from the compiled template cache
+
+        :type template: Template
+        :param template: the template to load
+
+        :type timeout: int|float
+        :param timeout: seconds to wait for a remote template to download, see load_compiled_template
+
+        :rtype: TemplateContent
+        :return: a new TemplateContent whose units can be modified freely. None if template is still loading
         """
+        compiled = self.load_compiled_template(template, timeout)
+        return compiled.to_template_content() if compiled else None
 
-        def internal_load_template():
-            local_path = template.local_path
-            if local_path is not None and isfile(local_path):
-                with open(local_path) as template_file:
-                    return TemplateContent.from_dict(json.load(template_file))
-            else:
-                try:
-                    req = requests.get(template.url)
-                    return TemplateContent.from_dict(json.loads(req.content))
-                except Exception as e:
-                    self.log.warn("Fail to load template from remote file %s" % template.url)
-                    self.log.error(e)
-                    return None
+    def load_compiled_template(self, template, timeout=0):
+        """Get the compiled template of the current version of template
+
+        Compiled templates are cached by id and update_time so that a template is parsed and compiled only once per
+        version. On a miss it's loaded from the local cache path. A template which is stored remotely only is
+        downloaded in a thread of this process(see compile_executor) and the caller waits for it at most 'timeout'.
+
+        :type template: Template
+        :param template: the template to load
+
+        :type timeout: int|float
+        :param timeout: seconds to wait for a remote template to download. 0 to return None at once if not compiled
+
+        :rtype: CompiledTemplate
+        :return: the shared compiled template, don't modify it. None if template is still loading
+        """
+        return self.load_compiled_templates([template], timeout).get(template.id)
+
+    def load_compiled_templates(self, templates, timeout=0):
+        """Get compiled templates of a list of templates. Remote ones are downloaded in parallel
 
-        cache_key = self.__get_template_cache_key(template.id)
-        return self.cache.get_cache(key=cache_key, createfunc=internal_load_template)
+        :type templates: list
+        :param templates: list of Template
+
+        :type timeout: int|float
+        :param timeout: seconds to wait for all remote templates to download, see load_compiled_template
+
+        :rtype: dict
+        :return: template id -> CompiledTemplate. Templates still loading after timeout are left out
+        """
+        compiled = {}
+        futures = {}
+        for template in templates:
+            cache_key = get_compiled_template_key(template.id, template.update_time)
+            c = compiled_templates.get(cache_key)
+            if c is None:
+                local_path = template.local_path
+                if local_path is not None and isfile(local_path):
+                    with open(local_path) as template_file:
+                        content = TemplateContent.from_dict(json.load(template_file))
+                    c = self.__cache_compiled_template(template, content)
+                else:
+                    futures[template.id] = self.__compile_in_background(template, cache_key)
+                    continue
+            compiled[template.id] = c
+
+        if futures and timeout > 0:
+            wait(futures.values(), timeout=timeout)
+        for template_id, future in futures.iteritems():
+            if future.done() and future.result() is not None:
+                compiled[template_id] = future.result()
+        return compiled
+
+    def warm_compiled_templates(self):
+        """Compile docker templates of all hackathons in background once the process starts
+
+        So that the first experiment or template list of every template in this process doesn't wait for download.
+        """
+        templates = self.db.session().query(Template) \
+            .join(HackathonTemplateRel, HackathonTemplateRel.template_id == Template.id) \
+            .filter(Template.provider == VE_PROVIDER.DOCKER) \
+            .distinct().all()
+        self.load_compiled_templates(templates)
+        self.log.debug("compiling %d templates of hackathons" % len(templates))
 
     def create_template(self, args):
         """ Create template """
@@ -154,7 +229,7 @@ class TemplateLibrary(Component):
                 return forbidden("template already in use")
 
             # remove template cache and storage
-            self.cache.invalidate(self.__get_template_cache_key(template_id))
+            self.__invalidate_compiled_template(template_id)
             self.storage.delete(template.url)
 
             # remove record in DB
@@ -224,17 +299,17 @@ class TemplateLibrary(Component):
             provider = self.__get_provider_from_template_dic(template_content)
             if template is None:
                 self.log.debug("insert template info to db: %s" % template_content.name)
-                self.db.add_object_kwargs(Template,
-                                          name=template_content.name,
-                                          url=context.url,
-                                          local_path=context.get("physical_path"),
-                                          provider=provider,
-                                          creator_id=g.user.id,
-                                          status=TEMPLATE_STATUS.UNCHECKED,
-                                          create_time=self.util.get_now(),
-                                          update_time=self.util.get_now(),
-                                          description=template_content.description,
-                                          virtual_environment_count=len(template_content.units))
+                template = self.db.add_object_kwargs(Template,
+                                                     name=template_content.name,
+                                                     url=context.url,
+                                                     local_path=context.get("physical_path"),
+                                                     provider=provider,
+                                                     creator_id=g.user.id,
+                                                     status=TEMPLATE_STATUS.UNCHECKED,
+                                                     create_time=self.util.get_now(),
+                                                     update_time=self.util.get_now(),
+                                                     description=template_content.description,
+                                                     virtual_environment_count=len(template_content.units))
             else:
                 self.db.update_object(template,
                                       url=context.url,
@@ -243,8 +318,10 @@ class TemplateLibrary(Component):
                                       description=template_content.description,
                                       virtual_environment_count=len(template_content.units),
                                       provider=provider)
-                self.cache.invalidate(self.__get_template_cache_key(template.id))
+                self.__invalidate_compiled_template(template.id)
 
+            # compile it now that content is at hand, so other requests don't have to load it from storage again
+            self.__cache_compiled_template(template, template_content)
             return template.dic()
         except Exception as ex:
             self.log.error(ex)
@@ -285,8 +362,47 @@ class TemplateLibrary(Component):
 
         return criterion
 
-    def __get_template_cache_key(self, template_id):
-        return "__template__%d__" % template_id
+    def __compile_in_background(self, template, cache_key):
+        """Download and compile a remote template in compile_executor, at most once at a time per version
+
+        :rtype: concurrent.futures.Future
+        :return: future of the CompiledTemplate or None if it fails
+        """
+        with pending_compiles_lock:
+            future = pending_compiles.get(cache_key)
+            if future is None:
+                self.log.debug("template %s not loaded yet, loading it in background" % template.name)
+                future = get_compile_executor().submit(self.__compile_remote_template, template.id,
+                                                       template.update_time, template.url, cache_key)
+                pending_compiles[cache_key] = future
+            return future
+
+    def __compile_remote_template(self, template_id, update_time, url, cache_key):
+        """Runs in compile_executor. Only plain values are passed in since DB models are bound to the caller's session"""
+        try:
+            req = get_http_client(url).get(url)
+            compiled = CompiledTemplate(template_id, update_time, TemplateContent.from_dict(json.loads(req.content)))
+            compiled_templates.set(cache_key, compiled)
+            return compiled
+        except Exception as e:
+            self.log.warn("Fail to load template from remote file %s" % url)
+            self.log.error(e)
+            return None
+        finally:
+            with pending_compiles_lock:
+                pending_compiles.pop(cache_key, None)
+
+    def __cache_compiled_template(self, template, content):
+        compiled = CompiledTemplate(template.id, template.update_time, content)
+        compiled_templates.set(get_compiled_template_key(template.id, template.update_time), compiled)
+        return compiled
+
+    def __invalidate_compiled_template(self, template_id):
+        """Remove all versions of template from the compiled template cache of this process
+
+        Other processes will miss on the new update_time so they never use stale versions either.
+        """
+        compiled_templates.invalidate_where(lambda k, v: v.template_id == template_id)
 
     def __load_template_content(self, args):
         """ Convert dict of template content into TemplateContent object
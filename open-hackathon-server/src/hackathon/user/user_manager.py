@@ -31,21 +31,58 @@ sys.path.append("..")
 from flask import request, g
 
 from hackathon.database import UserToken, User, UserEmail
-from hackathon.constants import ReservedUser, HTTP_HEADER
+from hackathon.constants import ReservedUser, HTTP_HEADER, CACHE_CHANNEL
+from hackathon.cache.lru_cache import LRUCache
+from hackathon.cache.invalidation_bus import invalidation_bus, ALL_KEYS
+from hackathon.database.routing import primary_reads
+from hackathon.util import safe_get_config
+from hackathon.hackathon_response import ok
 from hackathon import Component, RequiredFeature
 
 __all__ = ["UserManager"]
 
+# token -> TokenCacheEntry. It's shared by all instances of UserManager in the same process
+token_cache = LRUCache(max_size=safe_get_config("login.token_cache.max_size", 10000),
+                       ttl=safe_get_config("login.token_cache.ttl_seconds", 300))
+
+
+def _invalidate_local_user_tokens(user_id):
+    if user_id == ALL_KEYS:
+        token_cache.clear()
+    else:
+        token_cache.invalidate_where(lambda token, entry: entry.user_id == int(user_id))
+
+
+invalidation_bus.subscribe(CACHE_CHANNEL.USER_TOKENS, _invalidate_local_user_tokens)
+
+
+class TokenCacheEntry(object):
+    """What we cache for a valid token. Only ids and plain values here, no db models
+
+    Attributes:
+        user_id: id of the user that the token belongs to
+        expire_date: expire date of the token. Entry will never be served after it
+        hackathon_ids: ids of hackathons that the user entitled to manage, loaded on first admin API call
+    """
+
+    def __init__(self, user_id, expire_date):
+        self.user_id = user_id
+        self.expire_date = expire_date
+        self.hackathon_ids = None
+
 
 class UserManager(Component):
     """Component for user management"""
     admin_manager = RequiredFeature("admin_manager")
+    hackathon_manager = RequiredFeature("hackathon_manager")
 
+    @primary_reads
     def validate_login(self):
         """Make sure user token is included in http request headers and it must NOT be expired
 
         If valid token is found , the related user will be set int flask global g. So you can access g.user to get the
-        current login user throughout the request. There is no need to query user from DB again.
+        current login user throughout the request. There is no need to query user from DB again. Token and user are
+        always read from primary since the token may be just created.
 
         :rtype: bool
         :return True if valid token found in DB otherwise False
@@ -60,6 +97,56 @@ class UserManager(Component):
         g.user = user
         return True
 
+    def logout(self, user):
+        """Logout user on server side
+
+        All tokens of the user will be deleted and removed from token cache. So the tokens cannot be used any more
+        even if they are not expired.
+
+        :type user: User
+        :param user: the login user
+        """
+        if user.online == 1:
+            user.online = 0
+            self.hackathon_manager.increase_online_stat(user, -1)
+        self.db.delete_all_objects_by(UserToken, user_id=user.id)
+        self.invalidate_user_tokens(user.id)
+        return ok()
+
+    def invalidate_user_tokens(self, user_id):
+        """Remove all tokens of specific user from token cache of all server processes
+
+        Should be called when user logout or user's privileges changed.
+
+        :type user_id: int
+        :param user_id: id of the user
+        """
+        invalidation_bus.publish(CACHE_CHANNEL.USER_TOKENS, str(user_id))
+
+    def get_token_cache_stats(self):
+        """Return hits/misses/evictions counters of token cache
+
+        :rtype: dict
+        """
+        return token_cache.stats()
+
+    def get_login_user_hackathon_ids(self):
+        """Get ids of hackathons that current login user is entitled to manage
+
+        The ids are kept together with the token in token cache so that admin APIs won't query AdminHackathonRel on
+        every call. validate_login must be called before calling this method.
+
+        :rtype: list
+        :return list of hackathon id
+        """
+        entry = token_cache.get(request.headers[HTTP_HEADER.TOKEN])
+        if entry is None:
+            return self.admin_manager.get_entitled_hackathon_ids(g.user.id)
+
+        if entry.hackathon_ids is None:
+            entry.hackathon_ids = self.admin_manager.get_entitled_hackathon_ids(entry.user_id)
+        return entry.hackathon_ids
+
     def get_user_by_id(self, user_id):
         """Query user by unique id
 
@@ -148,14 +235,32 @@ class UserManager(Component):
     def __validate_token(self, token):
         """Validate token to make sure it exists and not expired
 
+        Valid tokens are cached in token_cache so that user_token is queried only once for the same token in ttl. The
+        user is still loaded by primary key on every call since g.user must be a model bound to the request session.
+
         :type token: str|unicode
         :param token: token strin
 
         :rtype: User
         :return user related to the token or None if token is invalid
         """
+        now = self.util.get_now()
+        entry = token_cache.get(token)
+        if entry is not None:
+            if entry.expire_date < now:
+                token_cache.invalidate(token)
+                return None
+
+            user = self.db.get_object(User, entry.user_id)
+            if user is None:
+                token_cache.invalidate(token)
+            return user
+
         t = self.db.find_first_object_by(UserToken, token=token)
-        if t is not None and t.expire_date >= self.util.get_now():
+        if t is not None and t.expire_date >= now:
+            # never serve the token after it expires even if the default ttl is longer
+            ttl = min(token_cache.ttl, (t.expire_date - now).total_seconds())
+            token_cache.set(token, TokenCacheEntry(t.user_id, t.expire_date), ttl=ttl)
             return t.user
 
         return None
@@ -56,6 +56,7 @@ def init_routes():
 
     # APIs for user(participant) to join hackathon
     api.add_resource(GuacamoleResource, "/api/user/guacamoleconfig")  # get remote paras for guacamole
+    api.add_resource(UserLoginResource, "/api/user/login")  # logout
     api.add_resource(CurrentUserResource, "/api/user")  # get current login user
     api.add_resource(UserProfileResource, "/api/user/profile")  # update user profile
     api.add_resource(UserTemplateListResource, "/api/hackathon/template")  # list templates for specific user
@@ -85,8 +86,11 @@ def init_routes():
     api.add_resource(AdminRegisterResource, "/api/admin/registration")  # create, delete or query registration
     api.add_resource(AdminHackathonTemplateListResource, "/api/admin/template/list")  # get templates of hackathon
     api.add_resource(AdminHackathonTemplateResource, "/api/admin/template")  # select template for hackathon
+    api.add_resource(AdminHackathonTemplateReadinessResource, "/api/admin/template/readiness")  # images on hosts
     api.add_resource(AdminExperimentResource, "/api/admin/experiment")  # start expr by admin
     api.add_resource(AdminExperimentListResource, "/api/admin/experiment/list")  # get expr list of hackathon
     api.add_resource(AdminHackathonFileResource, "/api/admin/file")  # upload hackathon image
     api.add_resource(HackathonAdminListResource, "/api/admin/hackathon/administrator/list")  # list admin/judges
     api.add_resource(HackathonAdminResource, "/api/admin/hackathon/administrator")  # add or delete admin/judge
+    api.add_resource(AdminSQLProfileResource, "/api/admin/sqlprofile")  # SQL profile by endpoint, super admin only
+    api.add_resource(AdminDBPoolResource, "/api/admin/dbpool")  # DB pools with stacks of long held, super admin only
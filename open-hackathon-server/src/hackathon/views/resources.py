@@ -33,9 +33,11 @@ from flask import g, request
 from flask_restful import reqparse
 
 from hackathon import RequiredFeature, Component
-from hackathon.decorators import hackathon_name_required, token_required, admin_privilege_required
+from hackathon.decorators import hackathon_name_required, token_required, admin_privilege_required, replica_reads
 from hackathon.health import report_health
-from hackathon.hackathon_response import bad_request, not_found
+from hackathon.hackathon_response import bad_request, not_found, forbidden
+from hackathon.database.profiler import get_sql_profile, reset_sql_profile
+from hackathon.database.routing import get_pool_stats
 from hackathon_resource import HackathonResource
 from hackathon.constants import RGStatus
 
@@ -50,6 +52,7 @@ azure_cert_manager = RequiredFeature("azure_cert_manager")
 expr_manager = RequiredFeature("expr_manager")
 admin_manager = RequiredFeature("admin_manager")
 guacamole = RequiredFeature("guacamole")
+image_distributor = RequiredFeature("image_distributor")
 
 """Resources for OHP itself"""
 
@@ -104,6 +107,7 @@ class TemplateCreateByFileResource(HackathonResource):
 
 
 class TemplateListResource(HackathonResource):
+    @replica_reads
     def get(self):
         return template_library.search_template(request.args)
 
@@ -112,17 +116,20 @@ class TemplateListResource(HackathonResource):
 
 
 class HackathonResource(HackathonResource):
+    @replica_reads
     @hackathon_name_required
     def get(self):
         return hackathon_manager.get_hackathon_detail(g.hackathon)
 
 
 class HackathonListResource(HackathonResource):
+    @replica_reads
     def get(self):
         return hackathon_manager.get_hackathon_list(request.args)
 
 
 class HackathonStatResource(HackathonResource):
+    @replica_reads
     @hackathon_name_required
     def get(self):
         return hackathon_manager.get_hackathon_stat(g.hackathon)
@@ -146,6 +153,12 @@ class GuacamoleResource(HackathonResource):
         return guacamole.getConnectInfo()
 
 
+class UserLoginResource(HackathonResource):
+    @token_required
+    def delete(self):
+        return user_manager.logout(g.user)
+
+
 class CurrentUserResource(HackathonResource):
     @token_required
     def get(self):
@@ -319,6 +332,7 @@ class TeamMemberResource(HackathonResource):
 
 
 class HackathonTeamListResource(HackathonResource):
+    @replica_reads
     @hackathon_name_required
     def get(self):
         parse = reqparse.RequestParser()
@@ -329,6 +343,7 @@ class HackathonTeamListResource(HackathonResource):
 
 
 class TeamMemberListResource(HackathonResource):
+    @replica_reads
     def get(self):
         parse = reqparse.RequestParser()
         parse.add_argument('team_id', type=int, location='args', required=True)
@@ -497,6 +512,12 @@ class AdminHackathonTemplateListResource(HackathonResource):
         return [t.dic() for t in templates]
 
 
+class AdminHackathonTemplateReadinessResource(HackathonResource):
+    @admin_privilege_required
+    def get(self):
+        return image_distributor.get_template_readiness(g.hackathon.id)
+
+
 class AdminHackathonTemplateResource(HackathonResource):
     @admin_privilege_required
     def post(self):
@@ -536,10 +557,13 @@ class AdminExperimentListResource(HackathonResource):
         parse = reqparse.RequestParser()
         parse.add_argument('user_name', type=str, location='args')
         parse.add_argument('status', type=int, location='args')
+        parse.add_argument('template_name', type=str, location='args')
+        parse.add_argument('host_server_id', type=int, location='args')
+        parse.add_argument('page', type=int, location='args')
+        parse.add_argument('per_page', type=int, location='args')
+        parse.add_argument('cursor', type=int, location='args')
         args = parse.parse_args()
-        return expr_manager.get_expr_list_by_hackathon_id(g.hackathon.id,
-                                                          user_name=args['user_name'],
-                                                          status=args['status'])
+        return expr_manager.get_expr_list_by_hackathon_id(g.hackathon.id, **args)
 
 
 class AdminHackathonFileResource(HackathonResource):
@@ -577,3 +601,30 @@ class HackathonAdminResource(HackathonResource):
         parse.add_argument('id', type=int, location='args', required=True)
         args = parse.parse_args()
         return admin_manager.delete_admin(args['id'])
+
+
+class AdminSQLProfileResource(HackathonResource):
+    """Resource to query or reset the per endpoint SQL profile, see database/profiler.py"""
+
+    @token_required
+    def get(self):
+        if not user_manager.is_super_admin(g.user):
+            return forbidden("access denied")
+        return get_sql_profile()
+
+    @token_required
+    def delete(self):
+        if not user_manager.is_super_admin(g.user):
+            return forbidden("access denied")
+        reset_sql_profile()
+        return True
+
+
+class AdminDBPoolResource(HackathonResource):
+    """Resource to query connection pools of current process with stacks of threads holding connections too long"""
+
+    @token_required
+    def get(self):
+        if not user_manager.is_super_admin(g.user):
+            return forbidden("access denied")
+        return get_pool_stats(with_stacks=True)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from datetime import datetime, timedelta
+from mock import Mock, patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from hackathon.database import AzureOperation
+from hackathon.database.db_adapters import SQLAlchemyAdapter
+from hackathon.azureformation import operation_tracker
+from hackathon.azureformation.operation_tracker import AzureOperationTracker
+
+
+class FakeService(object):
+    """Stub of azure service management service which answers from a script of statuses"""
+    IN_PROGRESS = 'InProgress'
+    SUCCEEDED = 'Succeeded'
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.calls = 0
+
+    def get_operation_status(self, request_id):
+        self.calls += 1
+        return Mock(status=self.statuses[request_id].pop(0))
+
+
+class TestAzureOperationTracker(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        AzureOperation.__table__.create(engine)
+        session = scoped_session(sessionmaker(bind=engine))
+        self.addCleanup(session.remove)
+        self.db = SQLAlchemyAdapter(session)
+
+        self.config = {"azure.operation_tracker.initial_interval_seconds": 0,
+                       "azure.operation_tracker.max_interval_seconds": 0,
+                       "azure.operation_tracker.timeout_seconds": 60}
+        self.now = datetime(2015, 1, 1)
+        util = Mock()
+        util.safe_get_config.side_effect = lambda key, default: self.config.get(key, default)
+        util.get_now.side_effect = lambda: self.now
+        self.scheduler = Mock()
+        patchers = [patch.object(AzureOperationTracker, "log", Mock()),
+                    patch.object(AzureOperationTracker, "util", util),
+                    patch.object(AzureOperationTracker, "db", self.db),
+                    patch.object(AzureOperationTracker, "scheduler", self.scheduler),
+                    patch.object(AzureOperation, "query", session.query_property())]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+        patcher = patch.object(operation_tracker, "run_job")
+        self.run_job = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.tracker = AzureOperationTracker()
+
+    def test_track_stored_once(self):
+        self.tracker.track_async(1, "r1", (["m", "c", "f"], (), ()))
+        self.tracker.track_async(1, "r1", (["m", "c", "f"], (), ()))
+        self.tracker.track_async(1, "r2", (["m", "c", "f"], (), ()))
+        self.assertEqual(2, self.tracker.get_pending_count())
+
+    def test_poll_dispatches_callbacks(self):
+        service = FakeService({"ok": ["InProgress", "Succeeded"], "bad": ["Failed"]})
+        self.tracker.get_service = Mock(return_value=service)
+        self.tracker.track_async(1, "ok", (["m", "c", "ok"], (1,), (2,)), (["m", "c", "ok_false"], (), ()))
+        self.tracker.track_async(1, "bad", (["m", "c", "bad"], (), ()), (["m", "c", "bad_false"], (3,), (4,)))
+
+        self.tracker.poll()
+        # one service for all operations of the same azure key
+        self.tracker.get_service.assert_called_once_with(1)
+        self.run_job.assert_called_once_with(["m", "c", "bad_false"], (3,), (4,), 0)
+        self.assertEqual(1, self.tracker.get_pending_count())
+
+        self.tracker.poll()
+        self.run_job.assert_called_with(["m", "c", "ok"], (1,), (2,), 0)
+        self.assertEqual(0, self.tracker.get_pending_count())
+        self.assertEqual(3, service.calls)
+
+    def test_polled_by_another_process(self):
+        self.tracker.track_async(1, "r", (["m", "c", "f"], (), ({"expr_id": 1},)))
+        self.db.remove()
+
+        # a tracker of another process, or of this process after restart, shares nothing in memory with the first one
+        other = AzureOperationTracker()
+        other.get_service = Mock(return_value=FakeService({"r": ["Succeeded"]}))
+        other.poll()
+        self.run_job.assert_called_once_with(["m", "c", "f"], (), ({"expr_id": 1},), 0)
+        self.assertEqual(0, other.get_pending_count())
+
+    def test_backoff(self):
+        self.config["azure.operation_tracker.initial_interval_seconds"] = 1
+        self.config["azure.operation_tracker.max_interval_seconds"] = 30
+        service = FakeService({"r": ["InProgress", "InProgress"]})
+        self.tracker.get_service = Mock(return_value=service)
+        self.tracker.track_async(1, "r", (["m", "c", "f"], (), ()))
+
+        self.now += timedelta(seconds=1)
+        self.tracker.poll()
+        op = self.db.find_first_object_by(AzureOperation)
+        self.assertEqual(2, op.interval_seconds)
+        # not due yet
+        self.tracker.poll()
+        self.assertEqual(1, service.calls)
+
+        self.now += timedelta(seconds=2)
+        self.tracker.poll()
+        self.assertEqual(2, service.calls)
+
+    def test_timeout(self):
+        service = FakeService({"r": ["InProgress"]})
+        self.tracker.get_service = Mock(return_value=service)
+        self.tracker.track_async(1, "r", (["m", "c", "f"], (), ()), (["m", "c", "timeout"], (), ()))
+        self.now += timedelta(seconds=60)
+        self.tracker.poll()
+        self.run_job.assert_called_once_with(["m", "c", "timeout"], (), (), 0)
+        self.assertEqual(0, self.tracker.get_pending_count())
+
+    def test_service_error_kept(self):
+        self.tracker.get_service = Mock(side_effect=Exception("azure down"))
+        self.tracker.track_async(1, "r", (["m", "c", "f"], (), ()))
+        self.tracker.poll()
+        self.run_job.assert_not_called()
+        self.assertEqual(1, self.tracker.get_pending_count())
+
+
+if __name__ == '__main__':
+    unittest.main()
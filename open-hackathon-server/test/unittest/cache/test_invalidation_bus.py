@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from datetime import timedelta
+from mock import Mock, patch
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from hackathon.util import Utility, get_now
+from hackathon.cache.invalidation_bus import CacheInvalidationBus, ALL_KEYS
+from hackathon.database import CacheInvalidation
+from hackathon.database.db_adapters import SQLAlchemyAdapter
+
+
+class CacheInvalidationBusTest(unittest.TestCase):
+    def setUp(self):
+        self.db = Mock()
+        self.query = self.db.session.return_value.query.return_value
+        patchers = [patch.object(CacheInvalidationBus, "db", self.db),
+                    patch.object(CacheInvalidationBus, "util", Mock()),
+                    patch.object(CacheInvalidationBus, "log", Mock())]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+        self.bus = CacheInvalidationBus(poll_interval=5, retention_minutes=60)
+        self.callback = Mock()
+        self.bus.subscribe("cache", self.callback)
+
+    def test_publish(self):
+        self.bus.publish("cache", "key")
+        self.callback.assert_called_once_with("key")
+        self.assertEqual(self.db.add_object_kwargs.call_args[0][0], CacheInvalidation)
+        self.assertEqual(self.db.add_object_kwargs.call_args[1]["key"], "key")
+
+
+class CacheInvalidationPollTest(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+
+        # let SQLAlchemy rather than pysqlite begin transactions, otherwise savepoints don't work with SQLite
+        @event.listens_for(engine, "connect")
+        def connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, "begin")
+        def begin(connection):
+            connection.execute("BEGIN")
+
+        CacheInvalidation.__table__.create(engine)
+        session = scoped_session(sessionmaker(bind=engine))
+        self.addCleanup(session.remove)
+        self.db = SQLAlchemyAdapter(session)
+        patchers = [patch.object(CacheInvalidationBus, "db", self.db),
+                    patch.object(CacheInvalidationBus, "util", Utility()),
+                    patch.object(CacheInvalidationBus, "log", Mock())]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+        self.bus = CacheInvalidationBus(poll_interval=5, retention_minutes=60, late_commit_seconds=60)
+        self.callback = Mock()
+        self.bus.subscribe("cache", self.callback)
+
+    def insert(self, invalidation_id, key, channel="cache", seconds_ago=0):
+        self.db.add_object_kwargs(CacheInvalidation, id=invalidation_id, channel=channel, key=key,
+                                  create_time=get_now() - timedelta(seconds=seconds_ago))
+
+    def applied_keys(self):
+        keys = [c[0][0] for c in self.callback.call_args_list]
+        self.callback.reset_mock()
+        return keys
+
+    @patch("hackathon.cache.invalidation_bus.time")
+    def test_poll(self, mock_time):
+        mock_time.time.return_value = 100
+        self.insert(10, "old")
+        self.assertEqual(self.bus.poll(), 0)
+        self.assertEqual([], self.applied_keys())
+
+        self.insert(11, "a")
+        self.insert(12, "b", channel="other")
+        self.insert(13, "c")
+        mock_time.time.return_value = 102
+        self.assertEqual(self.bus.poll(), 0)
+
+        mock_time.time.return_value = 106
+        self.assertEqual(self.bus.poll(), 3)
+        self.assertEqual(["a", "c"], self.applied_keys())
+
+        mock_time.time.return_value = 112
+        self.assertEqual(self.bus.poll(), 0)
+
+    @patch("hackathon.cache.invalidation_bus.time")
+    def test_poll_job_ignores_interval(self, mock_time):
+        mock_time.time.return_value = 100
+        self.bus.poll()
+
+        # the job fires slightly earlier than poll interval after a request polled
+        self.insert(11, "a")
+        mock_time.time.return_value = 104.9
+        self.assertEqual(self.bus.poll_job(), 1)
+        self.assertEqual(["a"], self.applied_keys())
+
+    def test_late_commit(self):
+        self.insert(5, "a", seconds_ago=10)
+        self.bus.poll(force=True)
+        self.insert(7, "b")
+        self.assertEqual(self.bus.poll(force=True), 1)
+        self.assertEqual(["b"], self.applied_keys())
+
+        # published before 'b' but committed after it
+        self.insert(6, "c", seconds_ago=5)
+        self.assertEqual(self.bus.poll(force=True), 1)
+        self.assertEqual(["c"], self.applied_keys())
+        self.assertEqual(self.bus.poll(force=True), 0)
+
+    @patch("hackathon.cache.invalidation_bus.time")
+    def test_poll_after_retention(self, mock_time):
+        mock_time.time.return_value = 100
+        self.bus.poll()
+
+        mock_time.time.return_value = 100 + 3601
+        self.bus.poll()
+        self.callback.assert_called_once_with(ALL_KEYS)
+
+    def test_publish_in_transaction(self):
+        self.bus.poll(force=True)
+        with self.db.transaction():
+            self.bus.publish("cache", "a")
+            self.assertEqual(["a"], self.applied_keys())
+        # applied again once committed, so that a value cached before commit is dropped
+        self.assertEqual(["a"], self.applied_keys())
+        self.assertEqual(1, self.db.session().query(CacheInvalidation).count())
+
+        with self.assertRaises(ValueError), self.db.transaction():
+            self.bus.publish("cache", "b")
+            raise ValueError()
+        self.assertEqual(["b"], self.applied_keys())
+        self.assertEqual(1, self.db.session().query(CacheInvalidation).count())
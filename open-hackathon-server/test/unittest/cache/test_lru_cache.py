@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from mock import patch
+
+from hackathon.cache.lru_cache import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_get_and_set(self):
+        cache = LRUCache(max_size=10)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", 1)
+        cache.set("b", None)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b", "default"))
+        self.assertEqual(cache.stats()["hits"], 2)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_evict_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    @patch("hackathon.cache.lru_cache.time")
+    def test_expire_by_ttl(self, mock_time):
+        mock_time.time.return_value = 100
+        cache = LRUCache(max_size=10, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=5)
+
+        mock_time.time.return_value = 110
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+
+        mock_time.time.return_value = 160
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expirations"], 2)
+        self.assertEqual(len(cache), 0)
+
+    def test_invalidate(self):
+        cache = LRUCache(max_size=10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.set("c", 3)
+        self.assertTrue(cache.invalidate("a"))
+        self.assertFalse(cache.invalidate("a"))
+        self.assertEqual(cache.invalidate_where(lambda k, v: v > 2), 1)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get("b"), 2)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+import threading
+from mock import Mock
+
+from hackathon.cache.lru_cache import LRUCache
+from hackathon.cache.tiered_cache import TieredCache, CacheBackend, _MISSING
+
+
+class TieredCacheTest(unittest.TestCase):
+    def test_compute_once(self):
+        cache = TieredCache(LRUCache(max_size=10))
+        createfunc = Mock(return_value={"count": 1})
+        self.assertEqual(cache.get("k", createfunc), {"count": 1})
+        self.assertEqual(cache.get("k", createfunc), {"count": 1})
+        self.assertEqual(createfunc.call_count, 1)
+
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["computes"], 1)
+
+    def test_copy_on_read(self):
+        cache = TieredCache(LRUCache(max_size=10))
+        cache.get("k", lambda: {"count": 1})["count"] = 2
+        self.assertEqual(cache.get("k", lambda: None), {"count": 1})
+
+    def test_none_not_cached(self):
+        cache = TieredCache(LRUCache(max_size=10))
+        createfunc = Mock(return_value=None)
+        cache.get("k", createfunc)
+        cache.get("k", createfunc)
+        self.assertEqual(createfunc.call_count, 2)
+
+    def test_concurrent_misses_coalesced(self):
+        cache = TieredCache(LRUCache(max_size=10))
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def createfunc():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return "value"
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(cache.get("k", createfunc)))
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=lambda: results.append(cache.get("k", createfunc))) for i in range(3)]
+        for t in followers:
+            t.start()
+        while cache.stats()["coalesced"] < 3:
+            pass
+        release.set()
+        for t in [leader] + followers:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["value"] * 4)
+
+    def test_invalidate_discards_computing_value(self):
+        cache = TieredCache(LRUCache(max_size=10))
+
+        def createfunc():
+            cache.invalidate("k")
+            return "stale"
+
+        self.assertEqual(cache.get("k", createfunc), "stale")
+        self.assertEqual(cache.get("k", lambda: "fresh"), "fresh")
+
+    def test_backend(self):
+        backend = Mock(spec=CacheBackend)
+        backend.get.return_value = "shared"
+        cache = TieredCache(LRUCache(max_size=10, ttl=60), backend)
+        createfunc = Mock()
+        self.assertEqual(cache.get("k", createfunc), "shared")
+        self.assertFalse(createfunc.called)
+        self.assertEqual(cache.stats()["backend_hits"], 1)
+
+        backend.get.return_value = _MISSING
+        self.assertEqual(cache.get("k2", lambda: "computed", ttl=10), "computed")
+        backend.set.assert_called_once_with("k2", "computed", 10)
+
+        cache.invalidate("k")
+        backend.delete.assert_called_once_with("k")
+
+    def test_invalidate_discards_computing_value_from_backend(self):
+        backend = Mock(spec=CacheBackend)
+        backend.get.return_value = _MISSING
+        cache = TieredCache(LRUCache(max_size=10, ttl=60), backend)
+
+        def createfunc():
+            cache.invalidate("k")
+            return "stale"
+
+        self.assertEqual(cache.get("k", createfunc), "stale")
+        self.assertFalse(backend.set.called)
+
+    def test_invalidate_while_writing_backend(self):
+        backend = Mock(spec=CacheBackend)
+        backend.get.return_value = _MISSING
+        cache = TieredCache(LRUCache(max_size=10, ttl=60), backend)
+        backend.set.side_effect = lambda key, value, ttl: cache.invalidate(key)
+
+        self.assertEqual(cache.get("k", lambda: "stale"), "stale")
+        # deleted by the invalidation and once more after the stale value is written
+        self.assertEqual(2, backend.delete.call_count)
+        self.assertEqual("fresh", cache.get("k", lambda: "fresh"))
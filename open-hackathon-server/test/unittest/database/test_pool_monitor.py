@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from mock import patch
+
+from hackathon.database import pool_monitor
+from hackathon.database.pool_monitor import PoolMonitor, get_pool_sizing, create_instrumented_engine
+
+
+class TestPoolSizing(unittest.TestCase):
+    def test_single_worker(self):
+        with patch.object(pool_monitor, "get_worker_count", return_value=1):
+            self.assertEqual((50, 100), get_pool_sizing(150))
+
+    def test_split_among_workers(self):
+        with patch.object(pool_monitor, "get_worker_count", return_value=15):
+            self.assertEqual((3, 7), get_pool_sizing(150))
+
+        with patch.object(pool_monitor, "get_worker_count", return_value=200):
+            self.assertEqual((1, 1), get_pool_sizing(150))
+
+
+class TestPoolMonitor(unittest.TestCase):
+    def test_wait_histogram(self):
+        monitor = PoolMonitor()
+        monitor.record_wait(0.0005)
+        monitor.record_wait(0.02)
+        monitor.record_wait(30, timeout=True)
+
+        stats = monitor.get_stats()
+        self.assertEqual(2, stats["checkouts"])
+        self.assertEqual(1, stats["timeouts"])
+        self.assertEqual(1, stats["recent_timeouts"])
+        histogram = stats["checkout_wait"]["histogram_ms"]
+        self.assertEqual(1, histogram["<=1"])
+        self.assertEqual(1, histogram["<=50"])
+        self.assertEqual(1, histogram[">5000"])
+        self.assertEqual(30000, stats["checkout_wait"]["max_ms"])
+
+    def test_recent_timeouts(self):
+        monitor = PoolMonitor(recent_seconds=300)
+        with patch.object(pool_monitor.time, "time", return_value=1000):
+            monitor.record_wait(30, timeout=True)
+        with patch.object(pool_monitor.time, "time", return_value=1200):
+            monitor.record_wait(30, timeout=True)
+            self.assertEqual(2, monitor.get_stats()["recent_timeouts"])
+
+        with patch.object(pool_monitor.time, "time", return_value=1400):
+            stats = monitor.get_stats()
+        self.assertEqual(2, stats["timeouts"])
+        self.assertEqual(1, stats["recent_timeouts"])
+
+    def test_engine(self):
+        with patch.object(pool_monitor, "get_worker_count", return_value=1):
+            engine = create_instrumented_engine("sqlite://", 6)
+        monitor = engine.pool.monitor
+        monitor.pre_ping_idle_seconds = -1
+        monitor.long_held_seconds = -1
+
+        engine.execute("SELECT 1")
+        connection = engine.connect()
+        stats = monitor.get_stats()
+        self.assertEqual(2, stats["checkouts"])
+        # connection returned to pool is pinged on next checkout
+        self.assertEqual(1, stats["pings"])
+        self.assertEqual(1, len(stats["long_held"]))
+        self.assertNotIn("stack", stats["long_held"][0])
+        self.assertTrue(monitor.get_stats(with_stacks=True)["long_held"][0]["stack"])
+
+        connection.close()
+        self.assertEqual([], monitor.get_stats()["long_held"])
+
+        # monitor survives pool recreation
+        engine.dispose()
+        self.assertIs(monitor, engine.pool.monitor)
+        engine.execute("SELECT 1")
+        self.assertEqual(3, monitor.get_stats()["checkouts"])
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from mock import patch
+from flask import Response
+from sqlalchemy import create_engine
+
+import hackathon
+from hackathon import app
+from hackathon.database import profiler
+from hackathon.database.profiler import get_fingerprint, attach_profiler, start_request_profile, \
+    finish_request_profile, get_sql_profile, reset_sql_profile
+
+
+class TestFingerprint(unittest.TestCase):
+    def test_literals(self):
+        self.assertEqual(get_fingerprint("SELECT * FROM user WHERE id = 3 AND name = 'a''b'"),
+                         get_fingerprint("SELECT *  FROM user\n WHERE id = 42 AND name = 'c'"))
+
+    def test_in_list(self):
+        self.assertEqual("SELECT * FROM user WHERE id IN (...)",
+                         get_fingerprint("SELECT * FROM user WHERE id IN (%s, %s, %s)"))
+        self.assertEqual("SELECT * FROM user WHERE id IN (...)", get_fingerprint("SELECT * FROM user WHERE id IN (?)"))
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        reset_sql_profile()
+        self.addCleanup(reset_sql_profile)
+        self.engine = create_engine("sqlite://")
+        attach_profiler(self.engine)
+        self.engine.execute("CREATE TABLE user (id INTEGER PRIMARY KEY)")
+
+    def run_request(self, loops):
+        with app.test_request_context("/api/team/list"):
+            start_request_profile()
+            for i in range(loops):
+                self.engine.execute("SELECT * FROM user WHERE id = ?", i)
+            self.engine.execute("INSERT INTO user (id) VALUES (?)", 1000 + loops)
+            return finish_request_profile()
+
+    def test_n_plus_one(self):
+        profile = self.run_request(2)
+        self.assertEqual(3, profile.query_count)
+        self.assertEqual({}, profile.n_plus_one)
+
+        profile = self.run_request(6)
+        self.assertEqual(7, profile.query_count)
+        self.assertEqual(["SELECT * FROM user WHERE id = ?"], profile.n_plus_one.keys())
+
+        endpoint = get_sql_profile()["endpoints"][0]
+        self.assertEqual(2, endpoint["requests"])
+        self.assertEqual(5, endpoint["avg_query_count"])
+        self.assertEqual(7, endpoint["max_query_count"])
+        self.assertEqual(1, endpoint["n_plus_one_requests"])
+        self.assertEqual(1, len(endpoint["repeated_statements"]))
+        self.assertEqual(8, endpoint["repeated_statements"][0]["count"])
+
+    def test_not_profiled(self):
+        self.engine.execute("SELECT 1")
+        self.assertIsNone(finish_request_profile())
+        self.assertEqual([], get_sql_profile()["endpoints"])
+
+    def test_header(self):
+        with patch.object(hackathon, "safe_get_config", return_value=True):
+            with app.test_request_context("/api/team/list"):
+                hackathon.begin_sql_profile()
+                self.engine.execute("SELECT 1")
+                response = hackathon.end_sql_profile(Response())
+        self.assertEqual("queries=1", response.headers["X-SQL-Profile"].split(";")[0])
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+
+
+import sys
+
+sys.path.append("../src/hackathon")
+import time
+import unittest
+from mock import Mock
+from flask import Response
+
+from hackathon import app
+from hackathon.constants import HTTP_HEADER
+from hackathon.database.routing import RoutingSession, replica_reads, primary_reads, set_written_header
+from hackathon.database.db_adapters import SQLAlchemyAdapter
+from hackathon.database.models import Template
+
+
+class TestRoutingSession(unittest.TestCase):
+    def setUp(self):
+        self.primary, self.replica = Mock(), Mock()
+        self.session = RoutingSession(primary=self.primary, replicas=[self.replica])
+        self.addCleanup(self.session.close)
+
+    def test_primary_by_default(self):
+        with app.test_request_context():
+            self.assertIs(self.primary, self.session.get_bind())
+
+    def test_replica_in_scope_of_request(self):
+        with app.test_request_context(), replica_reads:
+            self.assertIs(self.replica, self.session.get_bind())
+
+        # threads other than request handlers always read primary
+        with replica_reads:
+            self.assertIs(self.primary, self.session.get_bind())
+
+    def test_primary_after_write(self):
+        with app.test_request_context(), replica_reads:
+            self.assertIs(self.primary, self.session.get_bind(clause=Template.__table__.delete()))
+            self.assertIs(self.primary, self.session.get_bind())
+
+        # a new session of another user reads replica again
+        self.session.close()
+        with app.test_request_context(), replica_reads:
+            self.assertIs(self.replica, self.session.get_bind())
+
+    def test_sticky_client(self):
+        with app.test_request_context(), replica_reads:
+            self.session.get_bind(clause=Template.__table__.delete())
+            response = set_written_header(Response())
+        written_at = response.headers[HTTP_HEADER.DB_WRITTEN_AT]
+        self.session.close()
+
+        # any process reads primary for the client which sends back the time of its write
+        with app.test_request_context(headers={HTTP_HEADER.DB_WRITTEN_AT: written_at}), replica_reads:
+            self.assertIs(self.primary, self.session.get_bind())
+        with app.test_request_context(headers={HTTP_HEADER.DB_WRITTEN_AT: str(time.time() - 60)}), replica_reads:
+            self.assertIs(self.replica, self.session.get_bind())
+
+        # requests that don't write respond no time
+        with app.test_request_context(), replica_reads:
+            self.assertNotIn(HTTP_HEADER.DB_WRITTEN_AT, set_written_header(Response()).headers)
+
+    def test_primary_reads(self):
+        with app.test_request_context(), replica_reads:
+            with primary_reads:
+                self.assertIs(self.primary, self.session.get_bind())
+            self.assertIs(self.replica, self.session.get_bind())
+
+    def test_adapter_reads_primary(self):
+        model = Mock()
+        model.query.filter_by.return_value.first.side_effect = self.session.get_bind
+        db = SQLAlchemyAdapter(self.session)
+        # adapter reads outside replica_reads scopes, e.g. in write paths, read primary
+        with app.test_request_context():
+            self.assertIs(self.primary, db.find_first_object_by(model, id=1))
+        with app.test_request_context(), replica_reads:
+            self.assertIs(self.replica, db.find_first_object_by(model, id=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from datetime import datetime
+
+from hackathon.database import Template
+from hackathon.database.models import get_serializer, date_serializer
+
+
+class TestModelSerializer(unittest.TestCase):
+    def setUp(self):
+        self.template = Template(id=1, name="ubuntu", url="http://storage/ubuntu.js", provider=0,
+                                 create_time=datetime(2015, 1, 1), update_time=None)
+
+    def test_dic(self):
+        dic = self.template.dic()
+        self.assertEqual(set(c.name for c in Template.__table__.columns), set(dic.keys()))
+        self.assertEqual(date_serializer(datetime(2015, 1, 1)), dic["create_time"])
+        self.assertIsNone(dic["update_time"])
+        self.assertEqual("ubuntu", dic["name"])
+
+    def test_serializer_shared(self):
+        self.assertIs(Template.serializer(), get_serializer(Template))
+        self.assertIs(Template.serializer(["id", "name"]), Template.serializer(("id", "name")))
+        self.assertIsNot(Template.serializer(), Template.serializer(["id", "name"]))
+
+    def test_dic_many_from_rows(self):
+        fields = ["id", "name", "create_time"]
+        rows = [(1, "ubuntu", datetime(2015, 1, 1)), (2, "centos", None)]
+        self.assertEqual([{"id": 1, "name": "ubuntu", "create_time": date_serializer(datetime(2015, 1, 1))},
+                          {"id": 2, "name": "centos", "create_time": None}],
+                         Template.dic_many(rows, fields))
+        self.assertEqual([{"id": 1, "name": "ubuntu"}], Template.dic_many([(1, "ubuntu")], ["id", "name"]))
+        self.assertEqual([], Template.dic_many([]))
+
+    def test_dic_many_from_instances(self):
+        self.assertEqual([{"id": 1, "name": "ubuntu"}], Template.dic_many([self.template], ["id", "name"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
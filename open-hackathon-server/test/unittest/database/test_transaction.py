@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+
+
+import sys
+
+sys.path.append("../src/hackathon")
+import os
+import tempfile
+import unittest
+from mock import Mock
+from sqlalchemy import create_engine, event, Column, Integer, String
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.ext.declarative import declarative_base
+
+from hackathon.database.db_adapters import SQLAlchemyAdapter
+
+Base = declarative_base()
+
+
+class Item(Base):
+    __tablename__ = 'item'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(50), unique=True)
+
+
+class TestTransaction(unittest.TestCase):
+    def setUp(self):
+        self.session = Mock()
+        self.db = SQLAlchemyAdapter(self.session)
+        self.model = Mock()
+
+    def test_read_never_commits(self):
+        self.db.find_first_object_by(self.model, id=1)
+        self.db.count(self.model)
+        self.assertFalse(self.session.commit.called)
+
+    def test_write_commits_outside_scope(self):
+        self.db.add_object(Mock())
+        self.assertEqual(1, self.session.commit.call_count)
+
+    def test_scope_commits_once(self):
+        with self.db.transaction():
+            self.db.add_object(Mock())
+            with self.db.transaction():
+                self.db.delete_object(Mock())
+            self.assertFalse(self.session.commit.called)
+            self.assertEqual(2, self.session.flush.call_count)
+
+        self.assertEqual(1, self.session.commit.call_count)
+        self.assertFalse(self.db.in_transaction())
+
+    def test_scope_rolls_back_on_exception(self):
+        @self.db.transaction()
+        def create():
+            self.db.add_object(Mock())
+            raise ValueError()
+
+        self.assertRaises(ValueError, create)
+        self.assertFalse(self.session.commit.called)
+        self.assertTrue(self.session.rollback.called)
+        self.assertFalse(self.db.in_transaction())
+
+
+class TestTransactionSQLite(unittest.TestCase):
+    def setUp(self):
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        engine = create_engine("sqlite:///%s" % path)
+
+        # let SQLAlchemy rather than pysqlite begin transactions, otherwise savepoints don't work with SQLite
+        @event.listens_for(engine, "connect")
+        def connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, "begin")
+        def begin(connection):
+            connection.execute("BEGIN")
+
+        Base.metadata.create_all(engine)
+        self.addCleanup(engine.dispose)
+
+        self.session = scoped_session(sessionmaker(bind=engine))
+        self.addCleanup(self.session.remove)
+        Item.query = self.session.query_property()
+        self.db = SQLAlchemyAdapter(self.session)
+        # another connection sees committed rows only
+        self.reader = create_engine("sqlite:///%s" % path)
+        self.addCleanup(self.reader.dispose)
+
+    def committed_names(self):
+        return sorted(row[0] for row in self.reader.execute("SELECT name FROM item"))
+
+    def test_explicit_commit_in_scope(self):
+        with self.db.transaction():
+            item = self.db.add_object_kwargs(Item, name="a")
+            self.db.commit()
+            # flushed so that id is assigned, but not committed
+            self.assertIsNotNone(item.id)
+            self.assertEqual([], self.committed_names())
+            self.assertEqual(1, self.db.count(Item))
+
+        self.assertEqual(["a"], self.committed_names())
+
+    def test_rollback_whole_scope(self):
+        try:
+            with self.db.transaction():
+                self.db.add_object_kwargs(Item, name="a")
+                self.db.commit()
+                self.db.add_object_kwargs(Item, name="b")
+                raise ValueError()
+        except ValueError:
+            pass
+
+        self.assertEqual([], self.committed_names())
+        self.assertEqual(0, self.db.count(Item))
+
+    def test_failed_write_keeps_scope(self):
+        with self.db.transaction():
+            self.db.add_object_kwargs(Item, name="a")
+            self.assertRaises(Exception, self.db.add_object, None)
+            self.db.add_object_kwargs(Item, name="b")
+
+        self.assertEqual(["a", "b"], self.committed_names())
+
+    def test_failed_flush_keeps_session_usable(self):
+        with self.db.transaction():
+            self.db.add_object_kwargs(Item, name="a")
+            try:
+                self.db.add_object_kwargs(Item, name="a")
+                self.fail("duplicate name must fail")
+            except IntegrityError:
+                pass
+            self.assertEqual(1, self.db.count(Item))
+            self.db.add_object_kwargs(Item, name="b")
+
+        self.assertEqual(["a", "b"], self.committed_names())
+
+    def test_failed_explicit_commit_rolls_back_scope(self):
+        with self.db.transaction():
+            self.db.add_object_kwargs(Item, name="a")
+            self.db.session().add(Item(name="a"))
+            self.assertRaises(IntegrityError, self.db.commit)
+            # rolled back at once so the session keeps working
+            self.assertEqual(0, self.db.count(Item))
+            self.db.add_object_kwargs(Item, name="b")
+
+        self.assertEqual([], self.committed_names())
+        self.db.add_object_kwargs(Item, name="c")
+        self.assertEqual(["c"], self.committed_names())
+
+    def test_after_commit(self):
+        callback = Mock()
+        with self.db.transaction():
+            self.db.add_object_kwargs(Item, name="a")
+            self.db.after_commit(callback, 1, key="value")
+            self.assertFalse(callback.called)
+        callback.assert_called_once_with(1, key="value")
+
+        callback = Mock()
+        try:
+            with self.db.transaction():
+                self.db.after_commit(callback)
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertFalse(callback.called)
+
+        # called at once outside scopes
+        self.db.after_commit(callback)
+        self.assertTrue(callback.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
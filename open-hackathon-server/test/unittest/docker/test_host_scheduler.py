@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("../src/hackathon")
+import time
+import unittest
+from mock import Mock, patch
+
+from hackathon import Context
+from hackathon.docker import host_scheduler
+from hackathon.docker.host_scheduler import DockerHostScheduler, spread, bin_pack, least_loaded
+
+
+def candidate(host_id, container_count, container_max_count=10, running=None, mem_total=0):
+    return Context(host_id=host_id,
+                   container_count=container_count,
+                   container_max_count=container_max_count,
+                   running=container_count if running is None else running,
+                   mem_total=mem_total,
+                   cpus=4)
+
+
+class TestPlacementStrategy(unittest.TestCase):
+    def setUp(self):
+        self.candidates = [candidate(1, 5, running=2), candidate(2, 1, container_max_count=2), candidate(3, 3, 100)]
+
+    def test_spread(self):
+        self.assertEqual([2, 1, 3], [c.host_id for c in spread(self.candidates)])
+
+    def test_bin_pack(self):
+        self.assertEqual([1, 3, 2], [c.host_id for c in bin_pack(self.candidates)])
+
+    def test_least_loaded(self):
+        self.assertEqual([3, 1, 2], [c.host_id for c in least_loaded(self.candidates)])
+
+    def test_least_loaded_prefer_memory(self):
+        candidates = [candidate(1, 2, mem_total=4 << 30), candidate(2, 2, mem_total=8 << 30)]
+        self.assertEqual([2, 1], [c.host_id for c in least_loaded(candidates)])
+
+
+class TestDockerHostScheduler(unittest.TestCase):
+    def setUp(self):
+        host_scheduler.host_statuses.clear()
+        self.db = Mock()
+        self.hosts = [Mock(id=1, container_count=5, container_max_count=10),
+                      Mock(id=2, container_count=1, container_max_count=10),
+                      Mock(id=3, container_count=0, container_max_count=10)]
+        self.db.find_all_objects.return_value = self.hosts
+        self.db.get_object.side_effect = lambda cls, host_id: host_id
+        self.update = self.db.session.return_value.query.return_value.filter.return_value.update
+        self.hosted_docker = Mock()
+        self.hosted_docker.get_vm_url.side_effect = lambda h: "http://%d" % h.id
+        self.hosted_docker.remote_info.side_effect = lambda url: None if url == "http://3" else {"NCPU": 4}
+        for name, value in [("db", self.db), ("hosted_docker", self.hosted_docker)]:
+            patcher = patch.object(DockerHostScheduler, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.scheduler = DockerHostScheduler()
+
+    def test_reserve_skip_dead_host(self):
+        self.update.return_value = 1
+        self.assertEqual(2, self.scheduler.reserve(1, Mock(id=1)))
+        self.assertEqual(3, self.hosted_docker.remote_info.call_count)
+
+    def test_reserve_next_if_reserved_by_others(self):
+        self.update.side_effect = [0, 1]
+        self.assertEqual(1, self.scheduler.reserve(1, Mock(id=1)))
+
+    def test_reserve_none(self):
+        self.update.return_value = 0
+        self.assertIsNone(self.scheduler.reserve(1, Mock(id=1)))
+
+    def test_status_cached(self):
+        self.update.return_value = 1
+        self.scheduler.reserve(1, Mock(id=1))
+        self.scheduler.reserve(1, Mock(id=1))
+        self.assertEqual(3, self.hosted_docker.remote_info.call_count)
+
+    def test_stale_status_probed_in_background(self):
+        self.update.return_value = 1
+        self.scheduler.reserve(1, Mock(id=1))
+        for status in host_scheduler.host_statuses.values():
+            status.probe_time = time.time() - 3600
+        self.assertEqual(2, self.scheduler.reserve(1, Mock(id=1)))
+        host_scheduler.get_probe_executor().submit(lambda: None).result()
+        time.sleep(0.1)
+        self.assertEqual(6, self.hosted_docker.remote_info.call_count)
+
+    def test_reserve_prefer_host_with_images(self):
+        self.update.return_value = 1
+        self.hosted_docker.remote_images.side_effect = lambda url: set(["ubuntu:latest"] if url == "http://1" else [])
+        self.assertEqual(1, self.scheduler.reserve(1, Mock(id=1), images=["ubuntu"]))
+        # no host has the image
+        self.assertEqual(2, self.scheduler.reserve(1, Mock(id=1), images=["mysql:5.6"]))
+
+    def test_add_host_image(self):
+        self.hosted_docker.remote_images.return_value = set()
+        self.scheduler.get_host_images(self.hosts)
+        self.scheduler.add_host_image(1, "ubuntu")
+        self.assertEqual(set(["ubuntu:latest"]), host_scheduler.host_statuses[1].images)
+        self.assertIsNone(host_scheduler.host_statuses[3].images)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from mock import Mock, patch
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from hackathon.constants import PortBindingType
+from hackathon.database.models import DockerHostServer, PortBinding, DockerContainer, VirtualEnvironment
+from hackathon.database.db_adapters import SQLAlchemyAdapter
+from hackathon.docker import hosted_docker
+from hackathon.docker.hosted_docker import HostedDockerFormation
+from hackathon.docker.port_allocator import PortAllocator
+from hackathon.template import DOCKER_UNIT
+
+
+class TestReleaseContainerCount(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        DockerHostServer.__table__.create(engine)
+        self.session = scoped_session(sessionmaker(bind=engine))
+        self.addCleanup(self.session.remove)
+        db = SQLAlchemyAdapter(self.session)
+        patcher = patch.object(HostedDockerFormation, "db", db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.host = DockerHostServer(vm_name="vm", container_count=5, container_max_count=10)
+        db.add_object(self.host)
+        self.docker = HostedDockerFormation()
+        self.docker._HostedDockerFormation__release_ports = Mock()
+        self.docker._HostedDockerFormation__release_ports_of_exprs = Mock()
+
+    def reserve_concurrently(self, count):
+        """Reservation made by another process, see DockerHostScheduler.reserve"""
+        self.session.query(DockerHostServer).filter(DockerHostServer.id == self.host.id).update(
+            {DockerHostServer.container_count: DockerHostServer.container_count + count}, synchronize_session=False)
+
+    def test_stop_container_keeps_reservations(self):
+        # loaded before another process reserves
+        self.assertEqual(5, self.host.container_count)
+        self.reserve_concurrently(3)
+        self.docker._HostedDockerFormation__stop_container(1, self.host)
+        self.assertEqual(7, self.host.container_count)
+
+    def test_complete_stop(self):
+        self.reserve_concurrently(1)
+        self.docker.complete_stop(self.host, [1, 2], 4)
+        self.assertEqual(2, self.host.container_count)
+
+        self.docker.complete_stop(self.host, [3], 4)
+        self.assertEqual(0, self.host.container_count)
+
+
+class TestAssignPorts(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+
+        # let SQLAlchemy rather than pysqlite begin transactions, otherwise savepoints don't work with SQLite
+        @event.listens_for(engine, "connect")
+        def connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, "begin")
+        def begin(connection):
+            connection.execute("BEGIN")
+
+        PortBinding.__table__.create(engine)
+        self.session = scoped_session(sessionmaker(bind=engine))
+        self.addCleanup(self.session.remove)
+        util = Mock()
+        util.safe_get_config.side_effect = lambda key, default: "local" if key == "environment" else default
+        patchers = [patch.object(HostedDockerFormation, "db", SQLAlchemyAdapter(self.session)),
+                    patch.object(HostedDockerFormation, "util", util),
+                    patch.object(HostedDockerFormation, "log", Mock()),
+                    patch.dict(hosted_docker.port_allocators, clear=True)]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+        self.host = Mock(id=1)
+        self.allocator = PortAllocator()
+        self.allocator.seed([], synced_binding_id=0)
+        hosted_docker.port_allocators[self.host.id] = self.allocator
+        self.docker = HostedDockerFormation()
+
+    def test_port_committed_late_by_another_process_not_reused(self):
+        # another process binds 10022 but the allocator has synced a higher id already
+        self.session.add(PortBinding(id=1, name="ssh", port_from=10022, port_to=22,
+                                     binding_type=PortBindingType.DOCKER, binding_resource_id=self.host.id))
+        self.session.commit()
+        self.allocator.mark_used([], synced_binding_id=2)
+
+        port_cfg = [{DOCKER_UNIT.PORTS_NAME: "ssh", DOCKER_UNIT.PORTS_PORT: 22}]
+        self.docker._HostedDockerFormation__assign_ports(None, self.host, None, port_cfg)
+
+        ports = self.session.query(PortBinding.port_from).order_by(PortBinding.id).all()
+        self.assertEqual([(10022,), (10023,)], ports)
+        self.assertEqual(10023, port_cfg[0][DOCKER_UNIT.PORTS_HOST_PORT])
+        self.assertTrue(self.allocator.is_used(10022))
+
+
+class TestPrepareStart(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        for model in [DockerHostServer, VirtualEnvironment, DockerContainer, PortBinding]:
+            model.__table__.create(engine)
+        self.session = scoped_session(sessionmaker(bind=engine))
+        self.addCleanup(self.session.remove)
+        db = SQLAlchemyAdapter(self.session)
+        self.docker_host_manager = Mock()
+        patchers = [patch.object(HostedDockerFormation, "db", db),
+                    patch.object(HostedDockerFormation, "log", Mock()),
+                    patch.object(HostedDockerFormation, "docker_host_manager", self.docker_host_manager)]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+        # one container reserved by get_available_docker_host
+        self.host = DockerHostServer(vm_name="vm", container_count=1, container_max_count=10)
+        self.ve = VirtualEnvironment(name="ve")
+        db.add_object(self.host)
+        db.add_object(self.ve)
+        self.docker_host_manager.get_available_docker_host.return_value = self.host
+        self.docker = HostedDockerFormation()
+
+    def test_reservation_released_if_ports_fail(self):
+        self.docker._HostedDockerFormation__assign_ports = Mock(side_effect=Exception("no port available"))
+        unit = Mock()
+        unit.get_name.return_value = "container"
+
+        self.assertRaises(Exception, self.docker.prepare_start, unit, hackathon=Mock(), experiment=None,
+                          virtual_environment=self.ve)
+        self.assertEqual(0, self.session.query(DockerContainer).count())
+        self.assertEqual(0, self.session.query(DockerHostServer.container_count).scalar())
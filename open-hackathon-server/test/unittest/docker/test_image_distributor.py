@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+
+import sys
+
+sys.path.append("../src/hackathon")
+import time
+import unittest
+from threading import Event
+from concurrent.futures import ThreadPoolExecutor
+from mock import Mock, patch
+
+from hackathon.docker import image_distributor
+from hackathon.docker.image_distributor import ImageDistributor, split_image, normalize_image
+
+
+class TestImageReference(unittest.TestCase):
+    def test_split_image(self):
+        self.assertEqual(("ubuntu", "latest"), split_image("ubuntu"))
+        self.assertEqual(("registry:5000/ubuntu", "14.04"), split_image("registry:5000/ubuntu:14.04"))
+        self.assertEqual(("registry:5000/ubuntu", "latest"), split_image("registry:5000/ubuntu"))
+        self.assertEqual(("ubuntu", "sha256:45b2"), split_image("ubuntu@sha256:45b2"))
+
+    def test_normalize_image(self):
+        self.assertEqual("ubuntu:latest", normalize_image("ubuntu"))
+        self.assertEqual("ubuntu@sha256:45b2", normalize_image("ubuntu@sha256:45b2"))
+
+
+class TestImageDistributor(unittest.TestCase):
+    def setUp(self):
+        for state in [image_distributor.pull_states, image_distributor.host_queues,
+                      image_distributor.host_active_counts]:
+            state.clear()
+        image_distributor.pull_executor = ThreadPoolExecutor(max_workers=8)
+        self.hosts = [Mock(id=1), Mock(id=2), Mock(id=3)]
+        self.db = Mock()
+        self.db.find_all_objects.return_value = self.hosts
+        self.template_manager = Mock()
+        self.template_manager.get_template_images.return_value = {1: ["ubuntu", "mysql:5.6"],
+                                                                  2: ["ubuntu@sha256:45b2"]}
+        self.host_scheduler = Mock()
+        self.host_scheduler.get_host_images.return_value = {
+            1: set(["ubuntu:latest", "mysql:5.6", "ubuntu@sha256:45b2"]),
+            2: set(["ubuntu:latest"]),
+            3: None
+        }
+        self.release = Event()
+        self.hosted_docker = Mock()
+        self.hosted_docker.get_vm_url.side_effect = lambda h: "http://%d" % h.id
+        self.hosted_docker.remote_pull_image.side_effect = self.__pull
+        for name, value in [("db", self.db), ("hosted_docker", self.hosted_docker),
+                            ("docker_host_scheduler", self.host_scheduler),
+                            ("hackathon_template_manager", self.template_manager)]:
+            patcher = patch.object(ImageDistributor, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.distributor = ImageDistributor()
+
+    def __pull(self, vm_url, repository, tag, on_progress=None):
+        on_progress({"status": "Pulling from %s" % repository, "id": tag})
+        on_progress({"status": "Downloading", "id": "a1", "progressDetail": {"current": 5, "total": 10}})
+        self.release.wait(5)
+        on_progress({"status": "Pull complete", "id": "a1", "progressDetail": {}})
+        if repository == "mysql":
+            raise Exception("not found")
+
+    def __wait_pulls(self):
+        self.release.set()
+        for _ in range(50):
+            if all(s.status in ["done", "failed"] for s in image_distributor.pull_states.values()):
+                return
+            time.sleep(0.05)
+
+    def test_pull_missing_images_only(self):
+        self.assertEqual(2, self.distributor.distribute(1))
+        self.__wait_pulls()
+        pulled = sorted(c[0][1:3] for c in self.hosted_docker.remote_pull_image.call_args_list)
+        self.assertEqual([("mysql", "5.6"), ("ubuntu", "sha256:45b2")], pulled)
+        self.host_scheduler.add_host_image.assert_called_once_with(2, "ubuntu@sha256:45b2")
+
+    def test_pull_not_queued_twice(self):
+        self.assertEqual(2, self.distributor.distribute(1))
+        self.assertEqual(0, self.distributor.distribute(1))
+        self.__wait_pulls()
+        self.assertEqual(2, self.hosted_docker.remote_pull_image.call_count)
+
+    def test_per_host_concurrency(self):
+        self.host_scheduler.get_host_images.return_value = {1: set(), 2: set(), 3: set()}
+        with patch.object(image_distributor, "safe_get_config",
+                          lambda key, default: 1 if key == "docker.image_pull.per_host_concurrency" else default):
+            self.assertEqual(9, self.distributor.distribute(1))
+            time.sleep(0.1)
+            self.assertEqual({1: 1, 2: 1, 3: 1}, image_distributor.host_active_counts)
+            self.assertEqual([2, 2, 2], [len(q) for q in image_distributor.host_queues.values()])
+            self.__wait_pulls()
+        self.assertEqual(9, self.hosted_docker.remote_pull_image.call_count)
+
+    def test_pull_stats(self):
+        self.distributor.distribute(1)
+        time.sleep(0.1)
+        stats = dict((s["image"], s) for s in self.distributor.get_pull_stats())
+        self.assertEqual("pulling", stats["mysql:5.6"]["status"])
+        self.assertEqual(1, stats["mysql:5.6"]["layers"])
+        self.assertEqual(5, stats["mysql:5.6"]["bytes_current"])
+        self.__wait_pulls()
+        stats = dict((s["image"], s) for s in self.distributor.get_pull_stats())
+        self.assertEqual("failed", stats["mysql:5.6"]["status"])
+        self.assertEqual("done", stats["ubuntu@sha256:45b2"]["status"])
+        self.assertEqual(1, stats["ubuntu@sha256:45b2"]["layers_done"])
+        self.assertEqual(10, stats["ubuntu@sha256:45b2"]["bytes_current"])
+
+    def test_template_readiness(self):
+        readiness = dict((r["host_id"], r) for r in self.distributor.get_template_readiness(1))
+        self.assertEqual([1, 2], readiness[1]["ready_templates"])
+        self.assertEqual({1: ["mysql:5.6"], 2: ["ubuntu@sha256:45b2"]}, readiness[2]["missing_images"])
+        self.assertFalse(readiness[3]["alive"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from mock import patch
+
+from hackathon.docker.port_allocator import PortAllocator
+
+
+class PortAllocatorTest(unittest.TestCase):
+    def test_allocate_preferred_port(self):
+        allocator = PortAllocator()
+        allocator.seed([10022, 10023, 18080])
+        self.assertEqual(allocator.allocate([22, 8080, 3306]), [10024, 18081, 13306])
+        self.assertEqual(allocator.allocate([22]), [10025])
+
+    def test_all_or_nothing(self):
+        allocator = PortAllocator(port_min=10000, port_max=10003)
+        allocator.seed([10001])
+        self.assertRaises(Exception, allocator.allocate, [0, 0, 0])
+        self.assertEqual(allocator.free_count(), 2)
+        self.assertEqual(allocator.allocate([2, 2]), [10002, 10000])
+
+    def test_release(self):
+        allocator = PortAllocator()
+        ports = allocator.allocate([22, 22])
+        self.assertEqual(ports, [10022, 10023])
+        allocator.release([10022])
+        self.assertFalse(allocator.is_used(10022))
+        self.assertEqual(allocator.allocate([22]), [10022])
+
+    @patch("hackathon.docker.port_allocator.time")
+    def test_pending_ports_survive_seed(self, mock_time):
+        mock_time.time.return_value = 100
+        allocator = PortAllocator(pending_seconds=60)
+        allocator.allocate([22])
+        allocator.seed([18080], synced_binding_id=5)
+        self.assertTrue(allocator.is_used(10022))
+        self.assertEqual(allocator.synced_binding_id, 5)
+
+        mock_time.time.return_value = 200
+        allocator.seed([18080])
+        self.assertFalse(allocator.is_used(10022))
+        self.assertTrue(allocator.is_used(18080))
+
+    def test_mark_used(self):
+        allocator = PortAllocator()
+        allocator.mark_used([10022], synced_binding_id=3)
+        allocator.mark_used([10080], synced_binding_id=2)
+        self.assertEqual(allocator.synced_binding_id, 3)
+        self.assertEqual(allocator.allocate([22, 80]), [10023, 10081])
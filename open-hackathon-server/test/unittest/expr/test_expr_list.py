@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from mock import Mock, patch
+
+from hackathon.expr.expr_mgr import ExprManager
+
+
+def row(expr_id):
+    return Mock(id=expr_id, create_time=None, update_time=None, last_heart_beat_time=None)
+
+
+class TestExprList(unittest.TestCase):
+    def setUp(self):
+        self.query = Mock()
+        self.query.filter.return_value = self.query
+        self.query.offset.return_value = self.query
+        self.query.limit.return_value = self.query
+        self.query.order_by.return_value.count.return_value = 25
+        patcher = patch.object(ExprManager, "_ExprManager__get_expr_list_query", return_value=self.query)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.manager = ExprManager()
+
+    def test_page(self):
+        self.query.all.return_value = [row(15), row(14)]
+        result = self.manager.get_expr_list_by_hackathon_id(1, page=2, per_page=10)
+
+        self.query.offset.assert_called_once_with(10)
+        self.query.limit.assert_called_once_with(10)
+        self.assertEqual(25, result["total"])
+        self.assertEqual([15, 14], [i["id"] for i in result["items"]])
+
+    def test_per_page_capped(self):
+        self.query.all.return_value = []
+        result = self.manager.get_expr_list_by_hackathon_id(1, per_page=100000)
+        self.assertEqual(200, result["per_page"])
+        self.assertEqual(1, result["page"])
+
+    def test_per_page_positive(self):
+        self.query.all.return_value = []
+        result = self.manager.get_expr_list_by_hackathon_id(1, page=-1, per_page=-5)
+        self.query.offset.assert_called_once_with(0)
+        self.query.limit.assert_called_once_with(1)
+        self.assertEqual(1, result["page"])
+
+    def test_cursor(self):
+        self.query.all.return_value = [row(30), row(29)]
+        result = self.manager.get_expr_list_by_hackathon_id(1, cursor=0, per_page=2)
+        self.assertEqual(25, result["total"])
+        self.assertEqual(29, result["next_cursor"])
+        self.assertFalse(self.query.filter.called)
+        self.assertFalse(self.query.offset.called)
+
+        # total is counted on the first page only and the last page has no next cursor
+        self.query.order_by.return_value.count.reset_mock()
+        self.query.all.return_value = [row(28)]
+        result = self.manager.get_expr_list_by_hackathon_id(1, cursor=29, per_page=2)
+        self.assertIsNone(result["total"])
+        self.assertIsNone(result["next_cursor"])
+        self.assertTrue(self.query.filter.called)
+        self.assertFalse(self.query.order_by.return_value.count.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from mock import Mock, patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from hackathon.constants import VE_PROVIDER, EStatus, VEStatus
+from hackathon.database import Experiment, VirtualEnvironment, DockerHostServer
+from hackathon.database.db_adapters import SQLAlchemyAdapter
+from hackathon.expr.expr_mgr import ExprManager
+
+
+class TestRecycleHostedContainers(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        for model in [Experiment, VirtualEnvironment, DockerHostServer]:
+            model.__table__.create(engine)
+        self.session = scoped_session(sessionmaker(bind=engine))
+        self.addCleanup(self.session.remove)
+        self.db = SQLAlchemyAdapter(self.session)
+        self.hosted_docker = Mock()
+        patchers = [patch.object(ExprManager, "db", self.db),
+                    patch.object(ExprManager, "hosted_docker", self.hosted_docker),
+                    patch.object(ExprManager, "heart_beat_buffer", Mock()),
+                    patch.object(ExprManager, "log", Mock()),
+                    patch.object(DockerHostServer, "query", self.session.query_property())]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+        self.manager = ExprManager()
+
+    def add(self, model, **kwargs):
+        self.session.add(model(**kwargs))
+        self.session.commit()
+
+    def test_partially_stopped_expr(self):
+        for host_id in [1, 2]:
+            self.add(DockerHostServer, id=host_id, vm_name="vm%d" % host_id, container_count=2, container_max_count=10)
+        for expr_id in [1, 2]:
+            self.add(Experiment, id=expr_id, status=EStatus.RUNNING)
+        for ve_id, expr_id in [(11, 1), (21, 2), (22, 2)]:
+            self.add(VirtualEnvironment, id=ve_id, name="c%d" % ve_id, experiment_id=expr_id, status=VEStatus.RUNNING)
+        self.hosted_docker.get_vm_url.side_effect = lambda h: h.id
+        # container of expr 2 on host 2 fails to stop
+        self.hosted_docker.remote_stop.side_effect = lambda vm_url, names: names if vm_url == 1 else []
+        host_containers = {1: [(1, 11, "c11", VE_PROVIDER.DOCKER, 1), (2, 21, "c21", VE_PROVIDER.DOCKER, 1)],
+                           2: [(2, 22, "c22", VE_PROVIDER.DOCKER, 2)]}
+
+        self.manager._ExprManager__recycle_hosted_containers(host_containers)
+
+        # the stopped container of expr 2 is released when all containers of expr 2 stop
+        self.assertEqual(1, self.hosted_docker.complete_stop.call_count)
+        host, expr_ids, count = self.hosted_docker.complete_stop.call_args[0]
+        self.assertEqual((1, [1], 1), (host.id, expr_ids, count))
+        self.assertEqual({1: EStatus.STOPPED, 2: EStatus.RUNNING},
+                         dict(self.session.query(Experiment.id, Experiment.status).all()))
+        self.assertEqual({11: VEStatus.STOPPED, 21: VEStatus.RUNNING, 22: VEStatus.RUNNING},
+                         dict(self.session.query(VirtualEnvironment.id, VirtualEnvironment.status).all()))
+
+
+if __name__ == '__main__':
+    unittest.main()
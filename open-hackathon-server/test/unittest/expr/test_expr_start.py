@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from datetime import datetime
+from mock import Mock, patch, ANY
+
+from hackathon.constants import VE_PROVIDER
+from hackathon.expr import expr_mgr
+from hackathon.expr.expr_mgr import ExprManager
+
+
+class TestExprStart(unittest.TestCase):
+    def setUp(self):
+        self.db = Mock()
+        self.executor = Mock()
+        self.hackathon_manager = Mock()
+        patchers = [patch.object(ExprManager, "db", self.db),
+                    patch.object(ExprManager, "util", Mock()),
+                    patch.object(ExprManager, "log", Mock()),
+                    patch.object(ExprManager, "heart_beat_buffer", Mock()),
+                    patch.object(ExprManager, "hackathon_manager", self.hackathon_manager),
+                    patch.object(ExprManager, "_ExprManager__report_expr_status", Mock()),
+                    patch.object(expr_mgr, "get_config", Mock(return_value=True)),
+                    patch.object(expr_mgr, "get_expr_start_executor", Mock(return_value=self.executor))]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+        self.manager = ExprManager()
+        self.manager.util.safe_get_config.side_effect = lambda key, default: default
+        self.manager.util.get_now.return_value = datetime(2015, 1, 1)
+
+    def test_async_start_submitted_after_commit(self):
+        self.db.add_object_kwargs.return_value = Mock(id=7)
+        self.manager._ExprManager__start_new_expr(Mock(id=1), Mock(id=2), 3)
+        self.assertFalse(self.executor.submit.called)
+
+        callback, args = self.db.after_commit.call_args[0][0], self.db.after_commit.call_args[0][1:]
+        callback(*args)
+        self.assertEqual(7, self.executor.submit.call_args[0][1])
+
+    def test_sync_start_never_waits_for_template(self):
+        template_library = Mock()
+        template_library.load_compiled_template.return_value = None
+        with patch.object(ExprManager, "template_library", template_library), \
+                patch.object(expr_mgr, "get_config", Mock(return_value=False)):
+            resp = self.manager._ExprManager__start_new_expr(Mock(id=1), Mock(id=2, provider=VE_PROVIDER.DOCKER), 3)
+
+        self.assertEqual(412, resp["error"]["code"])
+        template_library.load_compiled_template.assert_called_once_with(ANY)
+        self.assertFalse(self.db.add_object_kwargs.called)
+
+    def test_stale_starting_exprs_rolled_back(self):
+        query = self.db.session.return_value.query.return_value
+        query.join.return_value.filter.return_value.all.return_value = [(5,), (6,)]
+        self.hackathon_manager.get_recycle_minutes_of_hackathons.return_value = {}
+
+        with patch.object(ExprManager, "_ExprManager__roll_back") as roll_back:
+            self.manager.scheduler_recycle_expr()
+        self.assertEqual([((5,),), ((6,),)], roll_back.call_args_list)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from mock import Mock, patch
+
+from hackathon.expr.heart_beat_buffer import HeartBeatBuffer
+
+
+class TestHeartBeatBuffer(unittest.TestCase):
+    def setUp(self):
+        self.db = Mock()
+        self.db.count_by.return_value = 1
+        patcher = patch.object(HeartBeatBuffer, "db", self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.buffer = HeartBeatBuffer(flush_interval=3600)
+
+    def test_beat_not_running(self):
+        self.db.count_by.return_value = 0
+        self.assertFalse(self.buffer.beat(1))
+        self.assertIsNone(self.buffer.get(1))
+
+    def test_beat_checks_running_once(self):
+        self.assertTrue(self.buffer.beat(1))
+        self.assertTrue(self.buffer.beat(1))
+        self.assertEqual(1, self.db.count_by.call_count)
+        self.assertIsNotNone(self.buffer.get(1))
+
+    def test_flush_throttled(self):
+        self.buffer.beat(1)
+        self.assertEqual(0, self.buffer.flush())
+        self.db.commit.assert_not_called()
+
+    def test_flush_coalesced(self):
+        for expr_id in [1, 2, 1, 2, 3]:
+            self.buffer.beat(expr_id)
+        self.assertEqual(3, self.buffer.flush(force=True))
+        self.assertEqual(1, self.db.session.return_value.query.return_value.filter.return_value.update.call_count)
+        self.db.commit.assert_called_once_with()
+        self.assertIsNone(self.buffer.get(1))
+        self.assertEqual(0, self.buffer.flush(force=True))
+
+    def test_flush_failure_kept(self):
+        self.buffer.beat(1)
+        self.db.commit.side_effect = Exception("db down")
+        self.assertEqual(0, self.buffer.flush(force=True))
+        self.db.rollback.assert_called_once_with()
+        self.assertIsNotNone(self.buffer.get(1))
+
+    def test_discard(self):
+        self.buffer.beat(1)
+        self.buffer.discard([1])
+        self.assertIsNone(self.buffer.get(1))
+        self.db.count_by.return_value = 0
+        self.assertFalse(self.buffer.beat(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
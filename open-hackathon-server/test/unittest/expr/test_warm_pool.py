@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from mock import Mock, patch
+
+from hackathon.constants import VE_PROVIDER
+from hackathon.expr import warm_pool
+from hackathon.expr.warm_pool import WarmPoolManager
+
+
+def pool(template_id, provider=VE_PROVIDER.DOCKER, deficit=2, starting=0, in_flight=0):
+    return {
+        "hackathon_id": 1,
+        "hackathon": "h",
+        "template_id": template_id,
+        "template": "t%d" % template_id,
+        "provider": provider,
+        "target": deficit + starting,
+        "ready": 0,
+        "starting": starting,
+        "in_flight": in_flight,
+        "deficit": deficit
+    }
+
+
+class TestWarmPoolManager(unittest.TestCase):
+    def setUp(self):
+        warm_pool.starting_counts.clear()
+        self.executor = Mock()
+        patcher = patch.object(warm_pool, "get_refill_executor", return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.manager = WarmPoolManager()
+
+    def refill(self, pools, max_concurrency=4):
+        config = {"pre_allocate.max_concurrency": max_concurrency}
+        with patch.object(WarmPoolManager, "get_pool_stats", return_value=pools), \
+                patch.object(warm_pool, "safe_get_config", side_effect=lambda key, default: config.get(key, default)):
+            self.manager.refill()
+        return [c[0][3] for c in self.executor.submit.call_args_list]
+
+    def test_refill_deficit(self):
+        self.assertEqual(["t1", "t1", "t2"], self.refill([pool(1), pool(2, deficit=1)]))
+        self.assertEqual({(1, 1): 2, (1, 2): 1}, warm_pool.starting_counts)
+
+    def test_refill_bounded_by_max_concurrency(self):
+        warm_pool.starting_counts[(1, 9)] = 1
+        self.assertEqual(["t1", "t1", "t2"], self.refill([pool(1), pool(2), pool(3)], max_concurrency=4))
+
+    def test_refill_skip_in_flight_pool(self):
+        self.assertEqual(["t2"], self.refill([pool(1, in_flight=1), pool(2, deficit=1)]))
+
+    def test_refill_azure_one_at_a_time(self):
+        pools = [pool(1, provider=VE_PROVIDER.AZURE, deficit=3),
+                 pool(2, provider=VE_PROVIDER.AZURE, deficit=3, starting=1)]
+        self.assertEqual(["t1"], self.refill(pools))
+
+    def test_refill_skipped_while_refilling(self):
+        warm_pool.refill_lock.acquire()
+        try:
+            self.assertEqual([], self.refill([pool(1)]))
+        finally:
+            warm_pool.refill_lock.release()
+
+
+if __name__ == '__main__':
+    unittest.main()
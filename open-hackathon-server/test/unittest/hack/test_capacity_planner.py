@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from datetime import datetime, timedelta
+from mock import Mock, patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from hackathon.constants import HACKATHON_STAT, DockerHostServerStatus
+from hackathon.database import Experiment, VirtualEnvironment, DockerContainer, DockerHostServer, HackathonStat
+from hackathon.database.db_adapters import SQLAlchemyAdapter
+from hackathon.job_lock import NoJobLock
+from hackathon.hack import capacity_planner
+from hackathon.hack.capacity_planner import CapacityPlanner
+
+
+class TestCapacityPlanner(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        for model in [HackathonStat, Experiment, VirtualEnvironment, DockerContainer, DockerHostServer]:
+            model.__table__.create(engine)
+        session = scoped_session(sessionmaker(bind=engine))
+        self.addCleanup(session.remove)
+        self.db = SQLAlchemyAdapter(session)
+
+        self.now = datetime(2015, 1, 1, 12)
+        self.config = {"docker.capacity_planner.dry_run": False}
+        util = Mock()
+        util.get_now.return_value = self.now
+        util.get_config.side_effect = lambda key: self.config.get(key)
+        util.safe_get_config.side_effect = lambda key, default: self.config.get(key, default)
+        self.hackathon_manager = Mock()
+        self.docker_host_manager = Mock()
+        warm_pool_manager = Mock()
+        warm_pool_manager.get_pool_stats.return_value = []
+        patchers = [patch.object(CapacityPlanner, "db", self.db),
+                    patch.object(CapacityPlanner, "util", util),
+                    patch.object(CapacityPlanner, "log", Mock()),
+                    patch.object(CapacityPlanner, "hackathon_manager", self.hackathon_manager),
+                    patch.object(CapacityPlanner, "docker_host_manager", self.docker_host_manager),
+                    patch.object(CapacityPlanner, "warm_pool_manager", warm_pool_manager)]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+        self.planner = CapacityPlanner()
+
+    def add_hackathon(self, hackathon_id, minutes_to_start, registered):
+        hackathon = Mock(id=hackathon_id,
+                         event_start_time=self.now + timedelta(minutes=minutes_to_start),
+                         event_end_time=self.now + timedelta(days=1))
+        hackathon.name = "hackathon%d" % hackathon_id
+        hackathon.is_alauda_enabled.return_value = False
+        self.hackathon_manager.get_online_hackathons.return_value.append(hackathon)
+        self.db.add_object_kwargs(HackathonStat, hackathon_id=hackathon_id, type=HACKATHON_STAT.REGISTER,
+                                  count=registered)
+
+    def add_host(self, hackathon_id, state, max_count=50, count=0, minutes_ago=0):
+        self.db.add_object_kwargs(DockerHostServer, vm_name="vm", hackathon_id=hackathon_id, state=state, disable=0,
+                                  container_max_count=max_count, container_count=count,
+                                  create_time=self.now - timedelta(minutes=minutes_ago))
+
+    def plan_of(self, hackathon_id):
+        return [p for p in self.planner.plan() if p["hackathon_id"] == hackathon_id][0]
+
+    def test_kickoff_window(self):
+        self.hackathon_manager.get_online_hackathons.return_value = []
+        self.add_hackathon(1, 20, 100)
+        self.add_hackathon(2, 60, 100)
+
+        # 100 registered * 0.8 * 1.2 headroom
+        self.assertEqual(96, self.plan_of(1)["needed_containers"])
+        self.assertEqual(2, self.plan_of(1)["vms_to_create"])
+        # not started within the lead time, only min free containers
+        self.assertEqual(0, self.plan_of(2)["needed_containers"])
+        self.assertEqual(1, self.plan_of(2)["vms_to_create"])
+
+    def test_pending_vms(self):
+        self.hackathon_manager.get_online_hackathons.return_value = []
+        self.add_hackathon(1, 20, 100)
+        self.add_host(1, DockerHostServerStatus.REQUESTED)
+        # requested too long ago, it will never come
+        self.add_host(1, DockerHostServerStatus.REQUESTED, minutes_ago=60)
+        self.add_host(1, DockerHostServerStatus.UNAVAILABLE)
+
+        plan = self.plan_of(1)
+        self.assertEqual(1, plan["pending_vms"])
+        self.assertEqual(50, plan["capacity"])
+        self.assertEqual(1, plan["vms_to_create"])
+
+        self.add_host(1, DockerHostServerStatus.DOCKER_READY, count=10)
+        plan = self.plan_of(1)
+        self.assertEqual(100, plan["capacity"])
+        self.assertEqual(10, plan["used_containers"])
+        self.assertEqual(0, plan["vms_to_create"])
+
+    def test_max_new_vms_per_run(self):
+        self.hackathon_manager.get_online_hackathons.return_value = []
+        self.add_hackathon(1, 0, 1000)
+        self.assertEqual(3, self.plan_of(1)["vms_to_create"])
+
+        self.config["docker.capacity_planner.max_new_vms_per_run"] = 5
+        self.assertEqual(5, self.plan_of(1)["vms_to_create"])
+
+    def test_run(self):
+        self.hackathon_manager.get_online_hackathons.return_value = []
+        self.add_hackathon(1, 20, 100)
+
+        self.planner.run(dry_run=True)
+        self.assertFalse(self.docker_host_manager.create_docker_host_vm.called)
+
+        self.planner.run()
+        self.assertEqual(2, self.docker_host_manager.create_docker_host_vm.call_count)
+
+
+    def test_provision_for_hackathon(self):
+        context = Mock(hackathon_id=1)
+        with patch.object(capacity_planner, "get_job_lock", return_value=NoJobLock()):
+            self.planner.provision_for_hackathon(context)
+            self.docker_host_manager.create_docker_host_vm.assert_called_once_with(1)
+
+            # requested by any process before
+            self.add_host(1, DockerHostServerStatus.REQUESTED)
+            self.planner.provision_for_hackathon(context)
+            self.assertEqual(1, self.docker_host_manager.create_docker_host_vm.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
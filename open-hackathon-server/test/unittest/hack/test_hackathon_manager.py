@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from mock import Mock, patch
+
+from hackathon.constants import HACKATHON_BASIC_INFO
+from hackathon.hack.hackathon_manager import HackathonManager
+from hackathon.util import Utility
+
+
+class TestRecycleMinutes(unittest.TestCase):
+    def setUp(self):
+        self.db = Mock()
+        patchers = [patch.object(HackathonManager, "db", self.db),
+                    patch.object(HackathonManager, "util", Utility()),
+                    patch.object(HackathonManager, "log", Mock())]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+        self.manager = HackathonManager()
+
+    def test_invalid_minutes_fall_back_to_default(self):
+        configs = [(1, HACKATHON_BASIC_INFO.RECYCLE_ENABLED, "1"), (1, HACKATHON_BASIC_INFO.RECYCLE_MINUTES, "30"),
+                   (2, HACKATHON_BASIC_INFO.RECYCLE_ENABLED, "1"), (2, HACKATHON_BASIC_INFO.RECYCLE_MINUTES, "1h"),
+                   (3, HACKATHON_BASIC_INFO.RECYCLE_ENABLED, "0"), (3, HACKATHON_BASIC_INFO.RECYCLE_MINUTES, "10")]
+        self.db.session.return_value.query.return_value.filter.return_value.all.return_value = configs
+
+        self.assertEqual({1: 30, 2: 60}, self.manager.get_recycle_minutes_of_hackathons())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from datetime import datetime
+from mock import Mock, patch
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from hackathon.constants import HACKATHON_STAT
+from hackathon.database import HackathonStat
+from hackathon.database.db_adapters import SQLAlchemyAdapter
+from hackathon.hack.hackathon_manager import HackathonManager
+
+
+class TestHackathonStat(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+
+        # let SQLAlchemy rather than pysqlite begin transactions, otherwise savepoints don't work with SQLite
+        @event.listens_for(self.engine, "connect")
+        def connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(self.engine, "begin")
+        def begin(connection):
+            connection.execute("BEGIN")
+
+        HackathonStat.__table__.create(self.engine)
+        session = scoped_session(sessionmaker(bind=self.engine))
+        self.addCleanup(session.remove)
+        self.db = SQLAlchemyAdapter(session)
+
+        util = Mock()
+        util.get_now.return_value = datetime(2015, 1, 1)
+        patchers = [patch.object(HackathonManager, "db", self.db),
+                    patch.object(HackathonManager, "util", util),
+                    patch.object(HackathonManager, "log", Mock()),
+                    patch.object(HackathonManager, "cache", Mock(), create=True)]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+        self.manager = HackathonManager()
+
+    def get_counts(self):
+        stats = self.db.session().query(HackathonStat).filter(HackathonStat.type == HACKATHON_STAT.LIKE)
+        return [s.count for s in stats]
+
+    def test_first_increase_inserts_stat(self):
+        self.manager.increase_hackathon_stat(Mock(id=1), HACKATHON_STAT.LIKE, 1)
+        self.manager.increase_hackathon_stat(Mock(id=1), HACKATHON_STAT.LIKE, 1)
+        self.assertEqual([2], self.get_counts())
+
+    def test_concurrent_first_increase_retries_update(self):
+        # another request inserts the stat right after our update found nothing to update
+        updates = []
+
+        @event.listens_for(self.engine, "after_cursor_execute")
+        def insert_concurrently(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("UPDATE hackathon_stat"):
+                updates.append(statement)
+                if len(updates) > 1:
+                    return
+                cursor.connection.cursor().execute(
+                    "INSERT INTO hackathon_stat (type, count, hackathon_id) VALUES ('%s', 1, 1)" % HACKATHON_STAT.LIKE)
+
+        self.manager.increase_hackathon_stat(Mock(id=1), HACKATHON_STAT.LIKE, 1)
+        self.assertEqual(2, len(updates))
+        self.assertEqual([2], self.get_counts())
+
+
+if __name__ == '__main__':
+    unittest.main()
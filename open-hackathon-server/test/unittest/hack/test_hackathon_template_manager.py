@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from mock import Mock, patch
+
+from hackathon.template import TEMPLATE, DOCKER_UNIT
+from hackathon.hack.hackathon_template_manager import HackathonTemplateManager
+
+
+class TestHackathonTemplateManager(unittest.TestCase):
+    def setUp(self):
+        self.db = Mock()
+        self.template_library = Mock()
+        patchers = [patch.object(HackathonTemplateManager, "db", self.db),
+                    patch.object(HackathonTemplateManager, "team_manager", Mock()),
+                    patch.object(HackathonTemplateManager, "template_library", self.template_library)]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+        self.manager = HackathonTemplateManager()
+
+    def test_user_templates_list_loading_ones(self):
+        ready = Mock(id=1)
+        ready.dic.return_value = {"name": "ready", "description": None}
+        loading = Mock(id=2)
+        loading.dic.return_value = {"name": "loading", "description": "still downloading"}
+        self.db.find_all_objects_by.return_value = [Mock(template=ready), Mock(template=loading)]
+        compiled = Mock()
+        compiled.to_dict.return_value = {TEMPLATE.TEMPLATE_NAME: "ready",
+                                         TEMPLATE.VIRTUAL_ENVIRONMENTS: [{DOCKER_UNIT.NAME: "web"}]}
+        self.template_library.load_compiled_templates.return_value = {1: compiled}
+
+        settings = self.manager.get_user_templates(Mock(), Mock(id=1))
+
+        # never wait for templates being downloaded in request
+        self.template_library.load_compiled_templates.assert_called_once_with([ready, loading])
+        self.assertEqual(["web"], [u["name"] for u in settings[0]["units"]])
+        self.assertNotIn("loading", settings[0])
+        self.assertEqual({"name": "loading", "description": "still downloading", "units": [], "loading": True},
+                         settings[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
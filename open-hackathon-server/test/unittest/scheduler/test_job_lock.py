@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+
+import sys
+
+sys.path.append("../src/hackathon")
+import time
+import shutil
+import tempfile
+import unittest
+from mock import Mock, patch
+
+from hackathon import hackathon_scheduler
+from hackathon.hackathon_scheduler import interval_executor
+from hackathon.job_lock import FileJobLock
+
+
+class TestFileJobLock(unittest.TestCase):
+    def setUp(self):
+        self.file_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.file_dir)
+        self.lock = FileJobLock(lease=600, file_dir=self.file_dir)
+
+    def test_acquire_once_per_period(self):
+        self.assertTrue(self.lock.acquire("job", 60))
+        # held while running
+        self.assertFalse(FileJobLock(600, self.file_dir).acquire("job", 60))
+        self.lock.release("job", 60, time.time())
+        # kept for the rest of period
+        self.assertFalse(FileJobLock(600, self.file_dir).acquire("job", 60))
+        self.lock.release("job", 60, time.time() - 60)
+        self.assertTrue(FileJobLock(600, self.file_dir).acquire("job", 60))
+
+    def test_jobs_independent(self):
+        self.assertTrue(self.lock.acquire("job1", 60))
+        self.assertTrue(self.lock.acquire("job2", 60))
+
+    def test_release_by_other_owner_ignored(self):
+        self.assertTrue(self.lock.acquire("job", 60))
+        with patch("hackathon.job_lock.owner_id", "other:1"):
+            self.lock.release("job", 60, time.time() - 60)
+        self.assertFalse(self.lock.acquire("job", 60))
+
+
+class TestIntervalExecutor(unittest.TestCase):
+    def setUp(self):
+        self.lock = Mock()
+        self.lock.acquire.return_value = True
+        self.executor = Mock()
+        for name, value in [("get_job_lock", Mock(return_value=self.lock)), ("scheduler_executor", self.executor)]:
+            patcher = patch.object(hackathon_scheduler, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        hackathon_scheduler.job_metrics.clear()
+
+    def test_singleton_run(self):
+        interval_executor("job", 60, True, "feature", "method", None)
+        self.executor.assert_called_once_with("feature", "method", None)
+        self.lock.release.assert_called_once()
+        metrics = hackathon_scheduler.job_metrics["job"]
+        self.assertEqual(1, metrics["runs"])
+        self.assertEqual(0, metrics["skipped"])
+        self.assertIsNotNone(metrics["last_duration_seconds"])
+
+    def test_singleton_skipped(self):
+        self.lock.acquire.return_value = False
+        interval_executor("job", 60, True, "feature", "method", None)
+        self.executor.assert_not_called()
+        self.assertEqual(1, hackathon_scheduler.job_metrics["job"]["skipped"])
+        self.assertEqual(0, hackathon_scheduler.job_metrics["job"]["runs"])
+
+    def test_not_singleton(self):
+        interval_executor("job", 60, False, "feature", "method", None)
+        self.lock.acquire.assert_not_called()
+        self.executor.assert_called_once_with("feature", "method", None)
+
+    def test_error_and_overrun(self):
+        self.executor.side_effect = Exception("job failed")
+        self.assertRaises(Exception, interval_executor, "job", 0, True, "feature", "method", None)
+        self.lock.release.assert_called_once()
+        metrics = hackathon_scheduler.job_metrics["job"]
+        self.assertEqual(1, metrics["errors"])
+        self.assertEqual(1, metrics["overruns"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from threading import Event, RLock
+from mock import Mock
+
+from hackathon.hackathon_scheduler import PriorityPoolExecutor
+
+
+class TestPriorityPoolExecutor(unittest.TestCase):
+    def setUp(self):
+        scheduler = Mock()
+        scheduler._create_lock.side_effect = RLock
+        self.executor = PriorityPoolExecutor(max_workers=1, priority=5)
+        self.executor.start(scheduler, "test")
+        self.addCleanup(self.executor.shutdown)
+        self.done = []
+
+    def __job(self, name, priority=None, func=None):
+        job = Mock(id=name, misfire_grace_time=None, args=(), kwargs={"priority": priority})
+        job.func = func or (lambda priority=None: self.done.append(name))
+        self.executor.submit_job(job, [None])
+        return job
+
+    def test_priority_order(self):
+        started, release = Event(), Event()
+
+        def block(priority=None):
+            started.set()
+            release.wait(5)
+
+        self.__job("block", func=block)
+        started.wait(5)
+        self.__job("low", priority=9)
+        self.__job("default")
+        self.__job("high", priority=0)
+
+        stats = self.executor.get_stats()
+        self.assertEqual(1, stats["busy"])
+        self.assertEqual(3, stats["queued"])
+
+        release.set()
+        self.executor.shutdown()
+        self.assertEqual(["high", "default", "low"], self.done)
+
+    def test_error_job(self):
+        def fail(priority=None):
+            raise Exception("job failed")
+
+        self.__job("fail", func=fail)
+        self.__job("ok")
+        self.executor.shutdown()
+        self.assertEqual(["ok"], self.done)
+        self.assertEqual(0, self.executor.get_stats()["busy"])
+
+
+if __name__ == '__main__':
+    unittest.main()
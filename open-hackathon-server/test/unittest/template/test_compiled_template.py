@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+
+
+import sys
+
+sys.path.append("../src/hackathon")
+import json
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+from mock import Mock, patch
+
+from hackathon.template import compiled_template
+from hackathon.template import TemplateLibrary, TemplateContent, CompiledTemplate, DOCKER_UNIT
+from hackathon.template.compiled_template import get_compiled_template_key
+
+TEMPLATE_DIC = {
+    "name": "ubuntu",
+    "description": "ubuntu with mysql",
+    "virtual_environments": [
+        {
+            "provider": 0,
+            "name": "web",
+            "Image": "ubuntu:14.04",
+            "Env": ["A=1", "invalid"],
+            "ports": [{"name": "ssh", "port": 22, "public": True, "protocol": "tcp"},
+                      {"name": "web", "port": 80, "public": True, "protocol": "tcp"}]
+        },
+        {
+            "provider": 0,
+            "name": "db",
+            "Image": "mysql:5.6",
+            "ports": [{"name": "mysql", "port": 3306, "protocol": "tcp"}]
+        }
+    ]
+}
+
+
+class TestCompiledTemplate(unittest.TestCase):
+    def setUp(self):
+        self.compiled = CompiledTemplate(1, datetime(2015, 1, 1), TemplateContent.from_dict(TEMPLATE_DIC))
+
+    def test_images(self):
+        self.assertEqual(("ubuntu:14.04", "mysql:5.6"), self.compiled.images)
+
+    def test_units_are_independent(self):
+        first, second = self.compiled.new_units()[0], self.compiled.new_units()[0]
+        first.set_name("1-web-abc")
+        first.get_ports()[0][DOCKER_UNIT.PORTS_HOST_PORT] = 10022
+
+        self.assertEqual("web", second.get_name())
+        self.assertNotIn(DOCKER_UNIT.PORTS_HOST_PORT, second.get_ports()[0])
+        self.assertEqual("web", self.compiled.to_dict()["virtual_environments"][0][DOCKER_UNIT.NAME])
+
+    def test_container_config(self):
+        unit = self.compiled.new_units()[0]
+        for p, host_port in zip(unit.get_ports(), [10022, 10080]):
+            p[DOCKER_UNIT.PORTS_HOST_PORT] = host_port
+
+        config = unit.get_container_config()
+        self.assertEqual("ubuntu:14.04", config[DOCKER_UNIT.IMAGE])
+        self.assertNotIn(DOCKER_UNIT.NAME, config)
+        self.assertNotIn(DOCKER_UNIT.PORTS, config)
+        self.assertEqual({"22/tcp": {}, "80/tcp": {}}, config[DOCKER_UNIT.EXPOSED_PORTS])
+        bindings = config[DOCKER_UNIT.HOST_CONFIG][DOCKER_UNIT.HOST_CONFIG_PORT_BINDING]
+        self.assertEqual("10080", bindings["80/tcp"][0][DOCKER_UNIT.HOST_CONFIG_HOST_PORT])
+
+        # the skeleton shared by other experiments is untouched
+        skeleton = unit.compiled.container_config
+        self.assertEqual({}, skeleton[DOCKER_UNIT.HOST_CONFIG][DOCKER_UNIT.HOST_CONFIG_PORT_BINDING])
+
+    def test_instance_env_vars_and_ports(self):
+        unit = self.compiled.new_units()[0]
+        self.assertEqual({"A": "1"}, unit.get_instance_env_vars())
+        self.assertEqual([22, 80], [p["container_port"] for p in unit.get_instance_ports()])
+
+
+class TestTemplateLibrary(unittest.TestCase):
+    def setUp(self):
+        compiled_template.compiled_templates.clear()
+        self.scheduler = Mock()
+        for name, value in [("scheduler", self.scheduler), ("log", Mock()), ("db", Mock())]:
+            patcher = patch.object(TemplateLibrary, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.library = TemplateLibrary()
+
+        fd, self.local_path = tempfile.mkstemp()
+        with os.fdopen(fd, "w") as f:
+            json.dump(TEMPLATE_DIC, f)
+        self.addCleanup(os.remove, self.local_path)
+
+    def test_load_from_local_path_once_per_version(self):
+        template = Mock(id=1, update_time=datetime(2015, 1, 1), local_path=self.local_path)
+        compiled = self.library.load_compiled_template(template)
+        self.assertIs(compiled, self.library.load_compiled_template(template))
+
+        template.update_time = datetime(2015, 1, 2)
+        self.assertIsNot(compiled, self.library.load_compiled_template(template))
+        self.assertEqual(2, len(compiled_template.compiled_templates))
+
+    def test_remote_template_loaded_in_background(self):
+        template = Mock(id=2, update_time=datetime(2015, 1, 1), local_path=None, url="http://storage/ubuntu.js")
+        with patch("hackathon.template.template_library.get_http_client") as get_http_client:
+            get_http_client.return_value.get.return_value = Mock(content=json.dumps(TEMPLATE_DIC))
+            self.assertEqual("ubuntu", self.library.load_template(template, timeout=5).name)
+            self.assertEqual(1, get_http_client.return_value.get.call_count)
+
+            # compiled in this process, no more downloading
+            self.assertIsNotNone(self.library.load_compiled_template(template))
+            self.assertEqual(1, get_http_client.return_value.get.call_count)
+
+        key = get_compiled_template_key(2, template.update_time)
+        self.assertIsNotNone(compiled_template.compiled_templates.get(key))
+        self.assertFalse(self.scheduler.add_once.called)
+
+    def test_remote_template_downloaded_once_while_loading(self):
+        template = Mock(id=3, update_time=datetime(2015, 1, 1), local_path=None, url="http://storage/ubuntu.js")
+        downloading = threading.Event()
+
+        def get(url):
+            downloading.wait(5)
+            return Mock(content=json.dumps(TEMPLATE_DIC))
+
+        with patch("hackathon.template.template_library.get_http_client") as get_http_client:
+            get_http_client.return_value.get.side_effect = get
+            self.assertIsNone(self.library.load_compiled_template(template))
+            self.assertEqual({}, self.library.load_compiled_templates([template], timeout=0.1))
+
+            downloading.set()
+            self.assertEqual([3], self.library.load_compiled_templates([template], timeout=5).keys())
+            self.assertEqual(1, get_http_client.return_value.get.call_count)
+
+    def test_remote_template_failed(self):
+        template = Mock(id=4, update_time=datetime(2015, 1, 1), local_path=None, url="http://storage/ubuntu.js")
+        with patch("hackathon.template.template_library.get_http_client") as get_http_client:
+            get_http_client.return_value.get.side_effect = IOError("unreachable")
+            self.assertIsNone(self.library.load_compiled_template(template, timeout=5))
+
+            # not cached, retried on next load
+            get_http_client.return_value.get.side_effect = None
+            get_http_client.return_value.get.return_value = Mock(content=json.dumps(TEMPLATE_DIC))
+            self.assertIsNotNone(self.library.load_compiled_template(template, timeout=5))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# -----------------------------------------------------------------------------------
+# Copyright (c) Microsoft Open Technologies (Shanghai) Co. Ltd.  All rights reserved.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# -----------------------------------------------------------------------------------
+
+import sys
+
+sys.path.append("../src/hackathon")
+import unittest
+from datetime import timedelta
+from mock import Mock, patch
+from flask import g
+
+from hackathon import app, Context
+from hackathon.util import get_now
+from hackathon.constants import HTTP_HEADER
+from hackathon.cache.invalidation_bus import CacheInvalidationBus
+from hackathon.user import user_manager
+from hackathon.user.user_manager import UserManager
+from hackathon.hack.hackathon_manager import HackathonManager
+
+
+class TokenCacheTest(unittest.TestCase):
+    def setUp(self):
+        user_manager.token_cache.clear()
+        self.db = Mock()
+        self.util = Mock(get_now=get_now)
+        self.admin_manager = Mock()
+        patchers = [patch.object(UserManager, "db", self.db),
+                    patch.object(UserManager, "util", self.util),
+                    patch.object(UserManager, "admin_manager", self.admin_manager),
+                    patch.object(CacheInvalidationBus, "db", Mock()),
+                    patch.object(CacheInvalidationBus, "util", Mock()),
+                    patch.object(CacheInvalidationBus, "log", Mock())]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+        self.user = Mock(id=1)
+        self.db.find_first_object_by.return_value = Mock(user_id=1, expire_date=get_now() + timedelta(days=1),
+                                                         user=self.user)
+        self.db.get_object.return_value = self.user
+        self.manager = UserManager()
+
+    def validate(self, token="token"):
+        with app.test_request_context(headers={HTTP_HEADER.TOKEN: token}):
+            if self.manager.validate_login():
+                return g.user
+            return None
+
+    def test_token_cached(self):
+        self.assertIs(self.user, self.validate())
+        self.assertIs(self.user, self.validate())
+        self.assertEqual(1, self.db.find_first_object_by.call_count)
+
+    def test_expired_token(self):
+        self.db.find_first_object_by.return_value.expire_date = get_now() + timedelta(seconds=60)
+        self.assertIs(self.user, self.validate())
+
+        self.util.get_now = lambda: get_now() + timedelta(seconds=120)
+        self.assertIsNone(self.validate())
+        self.assertEqual(0, len(user_manager.token_cache))
+
+    def test_invalidate_user_tokens(self):
+        self.validate()
+        self.manager.invalidate_user_tokens(2)
+        self.validate()
+        self.assertEqual(1, self.db.find_first_object_by.call_count)
+
+        self.manager.invalidate_user_tokens(1)
+        self.validate()
+        self.assertEqual(2, self.db.find_first_object_by.call_count)
+
+    def test_hackathon_ids_cached(self):
+        self.admin_manager.get_entitled_hackathon_ids.return_value = [1]
+        for i in range(2):
+            with app.test_request_context(headers={HTTP_HEADER.TOKEN: "token"}):
+                self.manager.validate_login()
+                self.assertEqual([1], self.manager.get_login_user_hackathon_ids())
+        self.assertEqual(1, self.admin_manager.get_entitled_hackathon_ids.call_count)
+
+    def test_hackathon_creation_reloads_hackathon_ids(self):
+        self.admin_manager.get_entitled_hackathon_ids.return_value = [1]
+        with app.test_request_context(headers={HTTP_HEADER.TOKEN: "token"}):
+            self.manager.validate_login()
+            self.manager.get_login_user_hackathon_ids()
+
+            with patch.object(HackathonManager, "db", Mock()), \
+                    patch.object(HackathonManager, "user_manager", self.manager):
+                HackathonManager()._HackathonManager__create_hackathon(Context(name="new", display_name="new"))
+
+        self.admin_manager.get_entitled_hackathon_ids.return_value = [1, 2]
+        with app.test_request_context(headers={HTTP_HEADER.TOKEN: "token"}):
+            self.manager.validate_login()
+            self.assertEqual([1, 2], self.manager.get_login_user_hackathon_ids())